@@ -1,11 +1,17 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import os
+import sys
+
 import casadi as ca
 import casadi.tools as ca_tools
 
 import numpy as np
 from draw import Draw_MPC_point_stabilization_v1, draw_gt, draw_gt_measurements, draw_gtmeas_noisemeas, draw_gt_mhe_measurements
+# solver_cache lives in the MPC folder, appended so that the local draw module still comes first
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'MPC'))
+from solver_cache import SolverCache
 
 
 def shift_movement(T, t0, x0, u, x_f, f):
@@ -43,32 +49,38 @@ if __name__ == '__main__':
     ## function
     f = ca.Function('f', [states, controls], [rhs], ['input_state', 'control_input'], ['rhs'])
 
-    ## for MPC
-    U = ca.SX.sym('U', n_controls, N)
+    ### define
+    Q = np.array([[1.0, 0.0, 0.0],[0.0, 5.0, 0.0],[0.0, 0.0, .1]])
+    R = np.array([[0.5, 0.0], [0.0, 0.05]])
+
+    def build_mpc_nlp():
+        ## for MPC
+        U = ca.SX.sym('U', n_controls, N)
 
-    X = ca.SX.sym('X', n_states, N+1)
+        X = ca.SX.sym('X', n_states, N+1)
 
-    P = ca.SX.sym('P', n_states+n_states)
+        P = ca.SX.sym('P', n_states+n_states)
 
+        #### cost function
+        obj = 0 #### cost
+        g = [] # equal constrains
+        g.append(X[:, 0]-P[:3])
+        for i in range(N):
+            obj = obj + ca.mtimes([(X[:, i]-P[3:]).T, Q, X[:, i]-P[3:]]) + ca.mtimes([U[:, i].T, R, U[:, i]])
+            x_next_ = f(X[:, i], U[:, i])*T +X[:, i]
+            g.append(X[:, i+1]-x_next_)
+
+        opt_variables = ca.vertcat( ca.reshape(U, -1, 1), ca.reshape(X, -1, 1))
+
+        return {'f': obj, 'x': opt_variables, 'p':P, 'g':ca.vertcat(*g)}
 
-    ### define
-    Q = np.array([[1.0, 0.0, 0.0],[0.0, 5.0, 0.0],[0.0, 0.0, .1]])
-    R = np.array([[0.5, 0.0], [0.0, 0.05]])
-    #### cost function
-    obj = 0 #### cost
-    g = [] # equal constrains
-    g.append(X[:, 0]-P[:3])
-    for i in range(N):
-        obj = obj + ca.mtimes([(X[:, i]-P[3:]).T, Q, X[:, i]-P[3:]]) + ca.mtimes([U[:, i].T, R, U[:, i]])
-        x_next_ = f(X[:, i], U[:, i])*T +X[:, i]
-        g.append(X[:, i+1]-x_next_)
-
-    opt_variables = ca.vertcat( ca.reshape(U, -1, 1), ca.reshape(X, -1, 1))
-
-    nlp_prob = {'f': obj, 'x': opt_variables, 'p':P, 'g':ca.vertcat(*g)}
     opts_setting = {'ipopt.max_iter':100, 'ipopt.print_level':0, 'print_time':0, 'ipopt.acceptable_tol':1e-8, 'ipopt.acceptable_obj_change_tol':1e-6}
 
-    solver = ca.nlpsol('solver', 'ipopt', nlp_prob, opts_setting)
+    ## solvers are loaded from disk if the same problem definition was built before
+    solver_cache = SolverCache()
+    mpc_definition = {'model': 'unicycle', 'shooting': 'multiple', 'N': N, 'T': T, 'Q': Q, 'R': R,
+                      'v_max': v_max, 'omega_max': omega_max, 'state_box': [2.0, 2.0]}
+    solver = solver_cache.nlpsol('solver', mpc_definition, build_mpc_nlp, opts_setting)
 
     lbg = 0.0
     ubg = 0.0
@@ -147,39 +159,45 @@ if __name__ == '__main__':
     N_MHE = 6 # estimation horizon
     print("MHE horizon {}".format(N_MHE))
     ### using the same model and states （states, f, next_controls)
-    mhe_U = ca.SX.sym('mhe_U', n_controls, N_MHE)
-    mhe_X = ca.SX.sym('mhe_X', n_states, N_MHE+1)
     n_meas = 2
-    Mes_ref = ca.SX.sym('Mes_ref', n_meas, N_MHE+1)
-    U_ref = ca.SX.sym('U_ref', n_controls, N_MHE)
-    
+
     ## measurement model
     f_m = lambda x, y: ca.vertcat(*[np.sqrt(x**2+y**2), np.arctan(y/x)])
     V_mat = np.linalg.inv(np.sqrt(meas_cov))
     W_mat = np.linalg.inv(np.sqrt(con_cov))
-    #### constrains
-    g = [] # equal constrains
-    #### multiple shooting constraints
-    for i in range(N_MHE):
-        x_next_ = f(mhe_X[:, i], mhe_U[:, i])*T + mhe_X[:, i]
-        g.append(mhe_X[:, i+1] - x_next_)
-    #### cost function
-    obj_mhe = 0 #### cost
-    for i in range(N_MHE+1):
-        h_x = f_m(mhe_X[0, i], mhe_X[1, i])
-        temp_diff_ = Mes_ref[:, i] - h_x
-        obj_mhe = obj_mhe + ca.mtimes([temp_diff_.T, V_mat, temp_diff_])
-    for i in range(N_MHE):
-        temp_diff_ = U_ref[:, i] - mhe_U[:, i]
-        obj_mhe = obj_mhe + ca.mtimes([temp_diff_.T, W_mat, temp_diff_])
-
-    mhe_target = ca.vertcat(ca.reshape(mhe_U, -1, 1), ca.reshape(mhe_X, -1, 1))
-    mhe_params = ca.vertcat(ca.reshape(U_ref, -1, 1), ca.reshape(Mes_ref, -1, 1))
-    ### define MHE nlp problem, the constraints stay the same as MPC
-    nlp_prob_mhe = {'f': obj_mhe, 'x': mhe_target, 'p':mhe_params, 'g':ca.vertcat(*g)}
+
+    def build_mhe_nlp():
+        mhe_U = ca.SX.sym('mhe_U', n_controls, N_MHE)
+        mhe_X = ca.SX.sym('mhe_X', n_states, N_MHE+1)
+        Mes_ref = ca.SX.sym('Mes_ref', n_meas, N_MHE+1)
+        U_ref = ca.SX.sym('U_ref', n_controls, N_MHE)
+        #### constrains
+        g = [] # equal constrains
+        #### multiple shooting constraints
+        for i in range(N_MHE):
+            x_next_ = f(mhe_X[:, i], mhe_U[:, i])*T + mhe_X[:, i]
+            g.append(mhe_X[:, i+1] - x_next_)
+        #### cost function
+        obj_mhe = 0 #### cost
+        for i in range(N_MHE+1):
+            h_x = f_m(mhe_X[0, i], mhe_X[1, i])
+            temp_diff_ = Mes_ref[:, i] - h_x
+            obj_mhe = obj_mhe + ca.mtimes([temp_diff_.T, V_mat, temp_diff_])
+        for i in range(N_MHE):
+            temp_diff_ = U_ref[:, i] - mhe_U[:, i]
+            obj_mhe = obj_mhe + ca.mtimes([temp_diff_.T, W_mat, temp_diff_])
+
+        mhe_target = ca.vertcat(ca.reshape(mhe_U, -1, 1), ca.reshape(mhe_X, -1, 1))
+        mhe_params = ca.vertcat(ca.reshape(U_ref, -1, 1), ca.reshape(Mes_ref, -1, 1))
+        ### define MHE nlp problem, the constraints stay the same as MPC
+        return {'f': obj_mhe, 'x': mhe_target, 'p':mhe_params, 'g':ca.vertcat(*g)}
+
     mhe_opts_setting = {'ipopt.max_iter':2000, 'ipopt.print_level':0, 'print_time':0, 'ipopt.acceptable_tol':1e-8, 'ipopt.acceptable_obj_change_tol':1e-6}
 
-    mhe_solver = ca.nlpsol('solver', 'ipopt', nlp_prob_mhe, mhe_opts_setting)
+    mhe_definition = {'model': 'unicycle', 'estimator': 'mhe', 'measurement': 'range_bearing', 'N_MHE': N_MHE,
+                      'T': T, 'V': V_mat, 'W': W_mat}
+    mhe_solver = solver_cache.nlpsol('solver', mhe_definition, build_mhe_nlp, mhe_opts_setting)
+    solver_cache.report()
     
     mhe_lbg = 0.0
     mhe_ubg = 0.0
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Per-solve wall time of the interpreted (CasADi VM) solver against the solver
+whose NLP callbacks are generated as C and compiled with gcc.
+
+The closed loop of sim_2_mpc_mul_shooting.py (unicycle) and
+sim_mpc_forklift.py (forklift) is replayed with both solvers. The first run
+compiles the libraries into solver_cache/, following runs reuse them.
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from ocp_builder import build_mul_shooting_nlp, forklift_model, make_bounds, make_params, unicycle_model
+from solver_cache import SolverCache
+
+
+def scenarios(N):
+    v_max, omega_max = 0.6, np.pi/4.0
+    unicycle = {
+        'name': 'unicycle', 'f': unicycle_model(), 'T': 0.2,
+        'Q': np.diag([1.0, 5.0, 0.1]), 'R': np.diag([0.5, 0.05]),
+        'bounds': make_bounds(N, [-v_max, -omega_max], [v_max, omega_max], [-2.0, -2.0, -np.inf], [2.0, 2.0, np.inf]),
+        'x0': np.array([0.0, 0.0, 0.0]), 'xs': np.array([1.5, 1.5, 0.0]),
+    }
+    forklift = {
+        'name': 'forklift', 'f': forklift_model(), 'T': 0.2,
+        'Q': np.diag([5.0, 5.0, 2.0, 0.1]), 'R': np.diag([0.5, 0.4]),
+        'bounds': make_bounds(N, [-v_max, -omega_max], [v_max, omega_max],
+                              [-16.0, -16.0, -np.pi, -np.pi/2.0], [7.01, 7.01, np.pi, np.pi/2.0]),
+        'x0': np.array([0.0, 0.0, 0.0, 0.0]), 'xs': np.array([7.0, 7.0, 0.0, 0.0]),
+    }
+    return [unicycle, forklift]
+
+
+def closed_loop(solver, scenario, N, n_ticks):
+    f, T = scenario['f'], scenario['T']
+    n_states = f.size1_in(0)
+    n_controls = f.size1_in(1)
+    x0 = scenario['x0'].reshape(-1, 1)
+    xs = scenario['xs'].reshape(-1, 1)
+    u_guess = np.zeros((n_controls, N))
+    x_guess = np.tile(x0, (1, N+1))
+    lbx, ubx = scenario['bounds']
+    solve_t = []
+    callback_t = []
+    for _ in range(n_ticks):
+        c_p = make_params(x0, xs, scenario['Q'], scenario['R'])
+        init_opt = np.concatenate((u_guess.T.reshape(-1, 1), x_guess.T.reshape(-1, 1)))
+        t_ = time.time()
+        res = solver(x0=init_opt, p=c_p, lbg=0.0, ubg=0.0, lbx=lbx, ubx=ubx)
+        solve_t.append(time.time() - t_)
+        stats = solver.stats()
+        callback_t.append(sum(v for k, v in stats.items() if k.startswith('t_wall_nlp')))
+        estimated_opt = res['x'].full()
+        u_guess = estimated_opt[:n_controls*N].reshape(N, n_controls).T
+        x_guess = estimated_opt[n_controls*N:].reshape(N+1, n_states).T
+        x0 = x0 + T*f(x0, u_guess[:, 0]).full()
+        u_guess = np.concatenate((u_guess[:, 1:], u_guess[:, -1:]), axis=1)
+        x_guess = np.concatenate((x_guess[:, 1:], x_guess[:, -1:]), axis=1)
+    return np.array(solve_t), np.array(callback_t), x0
+
+
+if __name__ == '__main__':
+    N = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    n_ticks = 50
+    opts_setting = {'ipopt.max_iter': 100, 'ipopt.print_level': 0, 'print_time': 0,
+                    'ipopt.acceptable_tol': 1e-8, 'ipopt.acceptable_obj_change_tol': 1e-6}
+    solver_cache = SolverCache()
+
+    print('N = {0}, {1} closed loop ticks per run'.format(N, n_ticks))
+    for scenario in scenarios(N):
+        definition = {'model': scenario['name'], 'shooting': 'multiple', 'N': N, 'T': scenario['T'],
+                      'params': 'x0_xs_q_r'}
+
+        def build_nlp():
+            return build_mul_shooting_nlp(scenario['f'], N, scenario['T'])
+
+        results = {}
+        for mode, codegen in (('interpreted', False), ('compiled', True)):
+            solver = solver_cache.nlpsol('solver', definition, build_nlp, opts_setting, codegen=codegen)
+            results[mode] = closed_loop(solver, scenario, N, n_ticks)
+        for mode in ('interpreted', 'compiled'):
+            solve_t, callback_t, x_end = results[mode]
+            print('{0:9s} {1:12s} solve mean {2:7.2f} ms, median {3:7.2f} ms, nlp callbacks mean {4:7.2f} ms'.format(
+                scenario['name'], mode, solve_t.mean()*1e3, np.median(solve_t)*1e3, callback_t.mean()*1e3))
+        speedup = results['interpreted'][0].mean() / results['compiled'][0].mean()
+        drift = np.linalg.norm(results['interpreted'][2] - results['compiled'][2])
+        print('{0:9s} speed up {1:.2f}x, final state difference {2:.2e}'.format(scenario['name'], speedup, drift))
+    solver_cache.report()
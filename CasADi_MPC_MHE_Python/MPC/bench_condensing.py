@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Condensing block size against QP time for the unicycle (3 states) and the
+forklift (4 states), on the QP of one SQP step of the multiple shooting
+problem around a rollout inside the limits.
+
+block 1 is the sparse multiple shooting QP (osqp), block N the dense single
+shooting QP (qpoases), the ones between are partially condensed (osqp).
+condense / solve : median time of the condensing in NumPy and of the QP solver
+The last line per N is the block size select_block_size picks.
+"""
+
+import sys
+
+import numpy as np
+
+from bench_riccati_qp import linearization_point
+from condensing import CondensedQP, select_block_size
+from ocp_builder import build_mul_shooting_nlp, forklift_model, make_bounds, make_params, unicycle_model
+from riccati_qp import ocp_qp_function, unpack_ocp_qp
+
+
+if __name__ == '__main__':
+    horizons = [int(n) for n in sys.argv[1:]] or [20, 50, 100, 200]
+    T = 0.2
+    n_repeat = 5
+    # rollouts inside the limits, the velocity bounds become active through the cost
+    cases = [('unicycle', unicycle_model(), [-2.0, -2.0, -np.inf], [2.0, 2.0, np.inf], lambda t: [0.4, 0.6]),
+             ('forklift', forklift_model(), [-16.0, -16.0, -np.pi, -np.pi/2.0], [7.01, 7.01, np.pi, np.pi/2.0],
+              lambda t: [0.4, 0.5*np.sin(t)])]
+
+    for name, f, x_min, x_max, rollout in cases:
+        n_states = f.size1_in(0)
+        n_controls = f.size1_in(1)
+        x0 = np.zeros(n_states)
+        c_p = make_params(x0, np.r_[1.5, 1.5, np.zeros(n_states-2)], np.ones(n_states), 0.1*np.ones(n_controls))
+        print('{0} ({1} states)'.format(name, n_states))
+        print('{0:>6s} {1:>6s} {2:>12s} {3:>10s} {4:>10s}'.format('N', 'block', 'condense ms', 'solve ms', 'total ms'))
+        for N in horizons:
+            nlp = build_mul_shooting_nlp(f, N, T)
+            lbx, ubx = make_bounds(N, [-0.6, -np.pi/4.0], [0.6, np.pi/4.0], x_min, x_max)
+            w = linearization_point(f, N, T, x0, np.array([rollout(k*T) for k in range(N)]))
+            qp = unpack_ocp_qp(ocp_qp_function(nlp, N, n_states, n_controls)(w, c_p), N, n_states, n_controls)
+            lbz = lbx - w
+            ubz = ubx - w
+            dx0 = x0 - w[N*n_controls:N*n_controls+n_states]
+            candidates = sorted(set([1, 2, 5, 10, 20, 50, N]) & set(range(1, N+1)))
+            for block_size in candidates:
+                solver = CondensedQP(N, n_states, n_controls, lbz, ubz, block_size)
+                stats = [solver.solve(x0=dx0, lbz=lbz, ubz=ubz, **qp)[1] for _ in range(n_repeat)]
+                t_condense = np.median([s['t_condense'] for s in stats])
+                t_solve = np.median([s['t_solve'] for s in stats])
+                print('{0:6d} {1:6d} {2:12.2f} {3:10.2f} {4:10.2f}{5}'.format(
+                    N, block_size, t_condense*1e3, t_solve*1e3, (t_condense+t_solve)*1e3,
+                    '' if all(s['success'] for s in stats) else '  (failed)'))
+            best, _ = select_block_size(qp, dx0, lbz, ubz, candidates, n_repeat)
+            print('{0:6d} selected block size {1}'.format(N, best))
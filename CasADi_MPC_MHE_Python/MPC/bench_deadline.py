@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Closed loop of sim_3_mpc_obs_avoid_mul.py (unicycle, one obstacle, N=100)
+with a per tick time budget (deadline.py), against the loop that waits
+for IPOPT.
+
+misses   : ticks whose solve took longer than the budget
+plans    : where the applied plan comes from (solver / best feasible iterate
+           / shifted previous plan / last iterate at the first tick)
+overrun  : time past the budget of the missed ticks
+cost     : closed loop cost sum x'Qx + u'Ru of the applied controls
+min dist : smallest distance between robot and obstacle centres
+           (must stay above the sum of both radii, 0.3 m)
+"""
+
+import sys
+import time
+
+import casadi as ca
+import numpy as np
+
+from deadline import DeadlineSolver
+from ocp_builder import build_mul_shooting_nlp, make_bounds, make_g_bounds, make_params, unicycle_model
+
+
+def closed_loop(solve, f, N, T, x0, xs, Q, R, n_iter=50):
+    n_states, n_controls = 3, 2
+    x0 = np.array(x0, dtype=float).reshape(-1, 1)
+    xs = np.array(xs, dtype=float).reshape(-1, 1)
+    u0 = np.array([1, 2]*N, dtype=float).reshape(-1, 2).T
+    next_states = np.zeros((n_states, N+1))
+    xx = [x0]
+    cost = 0.0
+    times = []
+    for _ in range(n_iter):
+        c_p = make_params(x0, xs, Q, R)
+        init_control = np.concatenate((u0.T.reshape(-1, 1), next_states.T.reshape(-1, 1)))
+        t_ = time.time()
+        w = solve(init_control, c_p)
+        times.append(time.time() - t_)
+        u0 = w[:N*n_controls].reshape(N, n_controls).T
+        x_m = w[N*n_controls:].reshape(N+1, n_states).T
+        e = x0 - xs
+        cost += (e.T.dot(Q).dot(e) + u0[:, :1].T.dot(R).dot(u0[:, :1])).item()
+        x0 = x0 + T*f(x0, u0[:, 0]).full()
+        u0 = np.concatenate((u0[:, 1:], u0[:, -1:]), axis=1)
+        next_states = np.concatenate((x_m[:, 1:], x_m[:, -1:]), axis=1)
+        xx.append(x0)
+    return cost, np.array(times), np.hstack(xx)
+
+
+if __name__ == '__main__':
+    budgets = [float(b)*1e-3 for b in sys.argv[1:]] or [50e-3, 20e-3, 10e-3, 5e-3]
+    T = 0.2
+    N = 100
+    f = unicycle_model()
+    Q = np.diag([1.0, 5.0, 0.1])
+    R = np.diag([0.5, 0.05])
+    obstacle = (0.5, 0.5)
+    nlp = build_mul_shooting_nlp(f, N, T, obstacles=[obstacle])
+    opts = {'ipopt.max_iter': 100, 'ipopt.print_level': 0, 'print_time': 0,
+            'ipopt.acceptable_tol': 1e-8, 'ipopt.acceptable_obj_change_tol': 1e-6}
+    lbg, ubg = make_g_bounds(f, N, [obstacle], [0.3])
+    lbx, ubx = make_bounds(N, [-0.6, -np.pi/4.0], [0.6, np.pi/4.0], [-2.0, -2.0, -np.inf], [2.0, 2.0, np.inf])
+    x0 = [0.0, 0.0, 0.0]
+    xs = [1.5, 1.5, 0.0]
+
+    def min_dist(xx):
+        return np.min(np.hypot(xx[0]-obstacle[0], xx[1]-obstacle[1]))
+
+    solver = ca.nlpsol('solver', 'ipopt', nlp, opts)
+    cost, times, xx = closed_loop(lambda w0, p: solver(x0=w0, p=p, lbx=lbx, ubx=ubx, lbg=lbg, ubg=ubg)['x'].full(),
+                                  f, N, T, x0, xs, Q, R)
+    print('no budget: solve ms median {0:.2f}, p90 {1:.2f}, max {2:.2f}, cost {3:.3f}, min dist {4:.3f}'.format(
+        np.median(times)*1e3, np.percentile(times, 90)*1e3, times.max()*1e3, cost, min_dist(xx)))
+    for budget in budgets:
+        deadline_solver = DeadlineSolver(nlp, N, 3, 2, budget, opts)
+        cost, times, xx = closed_loop(lambda w0, p: deadline_solver(w0, p, lbx, ubx, lbg, ubg)[0], f, N, T, x0, xs, Q, R)
+        print(deadline_solver.summary())
+        print('cost {0:.3f}, min dist {1:.3f}\n'.format(cost, min_dist(xx)))
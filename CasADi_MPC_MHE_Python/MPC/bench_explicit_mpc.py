@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Explicit MPC table (explicit_mpc.py) against the online solve of the sim_1
+point stabilization OCP. The table is built first if it does not exist.
+
+eval us   : time of one table evaluation (first control and confidence flag)
+coverage  : share of random states in the box where the table is confident
+u err     : |u_table - u_exact| of the first control, for confident and for
+            rejected states (the exact control comes from IPOPT started from
+            the interpolated plan, so both pick the same local solution;
+            ExplicitMPC.plan is None outside the table, there IPOPT starts
+            from zero controls)
+closed loop: table with fallback to the solver against solving every tick,
+            from several initial states
+"""
+
+import os
+import sys
+import time
+
+import casadi as ca
+import numpy as np
+
+from explicit_mpc import DEFAULT_TABLE, ExplicitMPC, build_table
+from ocp_builder import build_single_shooting_nlp, make_params, unicycle_model
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_TABLE
+    lo = np.array([-2.0, -2.0, -np.pi])
+    hi = np.array([2.0, 2.0, np.pi])
+    if not os.path.isfile(path):
+        build_table(lo, hi, path=path)
+    table = ExplicitMPC(path)
+    T = 0.2
+    N = table.N
+    f = unicycle_model()
+    xs = np.array([1.5, 1.5, 0.0])
+    Q = np.diag([1.0, 5.0, 0.1])
+    R = np.diag([0.5, 0.05])
+    # the OCP of sim_1_mpc_single_shooting.py
+    opts = {'ipopt.max_iter': 100, 'ipopt.print_level': 0, 'print_time': 0,
+            'ipopt.acceptable_tol': 1e-8, 'ipopt.acceptable_obj_change_tol': 1e-6}
+    solver = ca.nlpsol('solver', 'ipopt', build_single_shooting_nlp(f, N, T), opts)
+    lbx = np.tile([-0.6, -np.pi/4.0], N)
+    ubx = -lbx
+
+    def solve(x0, u_guess):
+        res = solver(x0=u_guess.reshape(-1, 1), p=make_params(x0, xs, Q, R), lbx=lbx, ubx=ubx, lbg=-2.0, ubg=2.0)
+        return res['x'].full().reshape(N, 2)
+
+    rng = np.random.RandomState(0)
+    test = lo + (hi-lo)*rng.rand(1000, 3)
+    t_ = time.time()
+    for x in test:
+        table(x)
+    t_eval = (time.time() - t_)/len(test)
+    print('{0} table, {1} samples, eval {2:.1f} us'.format(table.kind, len(table.states), t_eval*1e6))
+
+    n_check = 100
+    err_ok = []
+    err_rejected = []
+    t_solve = []
+    for x in test[:n_check]:
+        u, ok = table(x)
+        # the interpolated plan selects the same local solution as the table, zeros outside of it
+        u_plan = table.plan(x)
+        if u_plan is None:
+            u_plan = np.zeros((N, 2))
+        t_ = time.time()
+        u_exact = solve(x, u_plan)[0]
+        t_solve.append(time.time() - t_)
+        u = u if ok else u_plan[0]
+        (err_ok if ok else err_rejected).append(np.linalg.norm(u - u_exact))
+    print('solve {0:.1f} ms, coverage {1:.0f} %'.format(np.mean(t_solve)*1e3, 100.0*len(err_ok)/n_check))
+    print('u err confident: median {0:.4f}, p90 {1:.4f}, max {2:.4f}'.format(
+        np.median(err_ok), np.percentile(err_ok, 90), np.max(err_ok)))
+    if err_rejected:
+        print('u err rejected : median {0:.4f}, max {1:.4f}'.format(np.median(err_rejected), np.max(err_rejected)))
+
+    print('\n{0:>22s} {1:>10s} {2:>10s} {3:>12s} {4:>6s}'.format('initial state', 'mode', 'cost', 'table ticks', 'ms'))
+    for x_init in [[0.0, 0.0, 0.0], [-1.5, 1.0, 2.0], [1.0, -1.5, -2.5]]:
+        for use_table in [False, True]:
+            x0 = np.array(x_init)
+            u_guess = np.zeros((N, 2))
+            cost = 0.0
+            table_ticks = 0
+            index_t = []
+            mpciter = 0
+            while np.linalg.norm(x0-xs) > 1e-2 and mpciter < 100:
+                t_ = time.time()
+                u, ok = table(x0) if use_table else (None, False)
+                if ok:
+                    table_ticks += 1
+                else:
+                    u_guess = solve(x0, u_guess)
+                    u = u_guess[0]
+                    u_guess = np.concatenate((u_guess[1:], u_guess[-1:]))
+                index_t.append(time.time() - t_)
+                e = x0 - xs
+                cost += e.dot(Q).dot(e) + u.dot(R).dot(u)
+                x0 = x0 + T*f(x0, u).full().ravel()
+                mpciter = mpciter + 1
+            print('{0:>22s} {1:>10s} {2:10.3f} {3:>12s} {4:6.2f}'.format(
+                str(x_init), 'table' if use_table else 'solve', cost,
+                '{0}/{1}'.format(table_ticks, mpciter), np.mean(index_t)*1e3))
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Throughput of fleet.FleetController for 1 to 256 unicycle robots with the
+OCP of sim_2 (N=100, T=0.2), every robot from its own random start to its
+own random target.
+
+Every fleet runs one cold tick and n_ticks warm started ticks in closed
+loop (the robots move with their first control).
+robots/s : robots solved per second over the warm ticks
+tick ms  : mean wall time of a warm tick
+failed   : failed robot solves over all ticks
+
+The check below runs 8 robots around the obstacle of sim_3 with every mode
+(n_obstacles=1 for the layout of the shifted warm start): failed solves,
+smallest clearance to the obstacle along the closed loops, and the largest
+difference of the final states to 'loop'.
+
+    python bench_fleet.py [n_workers] [n_ticks]
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+from fleet import FleetController
+from ocp_builder import build_mul_shooting_nlp, make_bounds, make_g_bounds, make_params, unicycle_model
+
+
+def closed_loop(fleet, x0, targets, n_ticks):
+    """ one cold and n_ticks warm ticks, the robots move with their first control """
+    tick_t = []
+    states = [x0]
+    for tick in range(n_ticks+1):
+        p = np.vstack([make_params(x, xs, Q, R).ravel() for x, xs in zip(x0, targets)])
+        t_ = time.time()
+        res = fleet(p)
+        if tick > 0:
+            tick_t.append(time.time() - t_)
+        v, omega = res['u0'][:, 0], res['u0'][:, 1]
+        x0 = x0 + T*np.stack((v*np.cos(x0[:, 2]), v*np.sin(x0[:, 2]), omega), axis=1)
+        states.append(x0)
+    fleet.close()
+    return np.array(states), tick_t
+
+
+if __name__ == '__main__':
+    n_workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count() or 1
+    n_ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    T = 0.2
+    N = 100
+    f = unicycle_model()
+    Q = [1.0, 5.0, 0.1]
+    R = [0.5, 0.05]
+    opts = {'ipopt.max_iter': 100, 'ipopt.print_level': 0, 'print_time': 0, 'ipopt.sb': 'yes',
+            'ipopt.acceptable_tol': 1e-8, 'ipopt.acceptable_obj_change_tol': 1e-6}
+    nlp = build_mul_shooting_nlp(f, N, T)
+    lbx, ubx = make_bounds(N, [-0.6, -np.pi/4.0], [0.6, np.pi/4.0], [-2.0, -2.0, -np.inf], [2.0, 2.0, np.inf])
+    fleet_sizes = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+    # 'thread' is left out, it only runs with a single worker (see fleet.py)
+    modes = ['loop', 'serial', 'process']
+
+    print('{0} CPU(s), {1} workers, {2} warm ticks'.format(len(os.sched_getaffinity(0)), n_workers, n_ticks))
+    print('{0:>6s} {1:>8s} {2:>10s} {3:>10s} {4:>7s}'.format('robots', 'mode', 'robots/s', 'tick ms', 'failed'))
+    for M in fleet_sizes:
+        rng = np.random.default_rng(M)
+        starts = rng.uniform([-1.8, -1.8, -np.pi], [1.8, 1.8, np.pi], (M, 3))
+        targets = rng.uniform([-1.8, -1.8, -np.pi], [1.8, 1.8, np.pi], (M, 3))
+        for mode in modes:
+            fleet = FleetController(nlp, M, N, 3, 2, lbx, ubx, opts=opts, parallelization=mode, n_workers=n_workers)
+            _, tick_t = closed_loop(fleet, starts, targets, n_ticks)
+            print('{0:6d} {1:>8s} {2:10.1f} {3:10.2f} {4:7d}'.format(
+                M, mode, M/np.mean(tick_t), 1e3*np.mean(tick_t), sum(r['failed'] for r in fleet.records)))
+
+    # obstacle of sim_3, starts and targets outside of it
+    obstacle = (0.5, 0.5)
+    min_dist = 0.3/2.0 + 0.3/2.0
+    nlp = build_mul_shooting_nlp(f, N, T, obstacles=[obstacle])
+    lbg, ubg = make_g_bounds(f, N, [obstacle], [min_dist])
+    M = 8
+    rng = np.random.default_rng(0)
+    points = rng.uniform([-1.8, -1.8, -np.pi], [1.8, 1.8, np.pi], (100, 3))
+    points = points[np.hypot(points[:, 0]-obstacle[0], points[:, 1]-obstacle[1]) > min_dist + 0.2]
+    starts, targets = points[:M], points[M:2*M]
+    print('\nobstacle {0}, {1} robots'.format(obstacle, M))
+    print('{0:>8s} {1:>7s} {2:>10s} {3:>10s}'.format('mode', 'failed', 'clearance', 'diff'))
+    reference = None
+    for mode in modes:
+        fleet = FleetController(nlp, M, N, 3, 2, lbx, ubx, lbg, ubg, opts=opts, parallelization=mode,
+                                n_workers=n_workers, n_obstacles=1)
+        states, _ = closed_loop(fleet, starts, targets, n_ticks)
+        if reference is None:
+            reference = states[-1]
+        clearance = np.hypot(states[..., 0]-obstacle[0], states[..., 1]-obstacle[1]).min() - min_dist
+        print('{0:>8s} {1:7d} {2:10.3f} {3:10.1e}'.format(
+            mode, sum(r['failed'] for r in fleet.records), clearance, np.abs(states[-1]-reference).max()))
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Accuracy against cost of the discretizations of ocp_builder (explicit Euler,
+RK4, RK4 with substeps, direct collocation) for the same 20 s lookahead,
+unicycle point stabilization (sim_2) and forklift.
+
+For every discretization and number of stages N (step 20 s / N) the OCP is
+solved from the initial state. Every solve starts from the same guess:
+controls of 0.1 and the states rolled out with them (RK4, clipped to the
+state bounds); all-zero controls make the collocation KKT system singular. The planned controls are then applied to a
+reference simulation (RK4 with 100 substeps per stage).
+
+pred err : largest distance between the predicted and the simulated states
+           at the nodes of the plan
+solve ms : IPOPT time of the solve (best of 3)
+n_x      : number of decision variables
+The last lines give, per discretization, the smallest N whose prediction
+error is not larger than that of Euler with N=100.
+"""
+
+import time
+
+import casadi as ca
+import numpy as np
+
+from ocp_builder import (build_mul_shooting_nlp, collocation_guess, discrete_dynamics, forklift_model, make_bounds,
+                         make_params, unicycle_model)
+
+
+def prediction_error(f, N, T, method, x0, xs, Q, R, limits, opts):
+    integrator, n_substeps = method
+    n_states = f.size1_in(0)
+    n_controls = f.size1_in(1)
+    degree = 3
+    nlp = build_mul_shooting_nlp(f, N, T, integrator=integrator, n_substeps=n_substeps, degree=degree)
+    solver = ca.nlpsol('solver', 'ipopt', nlp, opts)
+    lbx, ubx = make_bounds(N, *limits, integrator=integrator, degree=degree)
+    u_guess = np.full((N, n_controls), 0.1)
+    x_guess = np.tile(x0, (N+1, 1))
+    step = discrete_dynamics(f, 'rk4', 1)
+    for k in range(N):
+        x_guess[k+1] = np.clip(step(x_guess[k], u_guess[k], T).full().ravel(), limits[2], limits[3])
+    w0 = np.concatenate((u_guess.ravel(), x_guess.ravel(),
+                         collocation_guess(x_guess, degree if integrator == 'collocation' else 0).ravel()))
+    c_p = make_params(x0, xs, Q, R)
+    solve_t = []
+    for _ in range(3):
+        t_ = time.time()
+        res = solver(x0=w0, p=c_p, lbx=lbx, ubx=ubx, lbg=0.0, ubg=0.0)
+        solve_t.append(time.time() - t_)
+    w = res['x'].full().ravel()
+    u = w[:N*n_controls].reshape(N, n_controls)
+    x_pred = w[N*n_controls:N*n_controls+(N+1)*n_states].reshape(N+1, n_states)
+    x_sim = np.zeros_like(x_pred)
+    x_sim[0] = x0
+    for k in range(N):
+        x_sim[k+1] = reference(x_sim[k], u[k], T).full().ravel()
+    return np.max(np.linalg.norm(x_pred - x_sim, axis=1)), 1e3*min(solve_t), w.size, solver.stats()['success']
+
+
+if __name__ == '__main__':
+    horizon = 20.0  # lookahead [s]
+    v_max = 0.6
+    omega_max = np.pi/4.0
+    opts = {'ipopt.max_iter': 200, 'ipopt.print_level': 0, 'print_time': 0,
+            'ipopt.acceptable_tol': 1e-8, 'ipopt.acceptable_obj_change_tol': 1e-6}
+    cases = [('unicycle', unicycle_model(), [0.0, 0.0, 0.0], [1.5, 1.5, 0.0],
+              np.diag([1.0, 5.0, 0.1]), np.diag([0.5, 0.05]), [-2.0, -2.0, -np.inf], [2.0, 2.0, np.inf]),
+             ('forklift', forklift_model(), [0.0, 0.0, 0.0, 0.0], [7.0, 7.0, 0.0, 0.0],
+              np.diag([5.0, 5.0, 2.0, 0.1]), np.diag([0.5, 0.4]),
+              [-16.0, -16.0, -np.pi, -np.pi/2.0], [7.01, 7.01, np.pi, np.pi/2.0])]
+    methods = [('euler', 1), ('rk4', 1), ('rk4', 4), ('collocation', 1)]
+    horizons = [100, 50, 25, 20, 10, 5]
+
+    for name, f, x0, xs, Q, R, x_min, x_max in cases:
+        reference = discrete_dynamics(f, 'rk4', 100)
+        limits = ([-v_max, -omega_max], [v_max, omega_max], x_min, x_max)
+        print('{0}, lookahead {1} s'.format(name, horizon))
+        print('{0:>14s} {1:>4s} {2:>6s} {3:>10s} {4:>9s} {5:>6s}'.format(
+            'integrator', 'N', 'T', 'pred err', 'solve ms', 'n_x'))
+        errors = {}
+        for method in methods:
+            label = method[0] if method[1] == 1 else '{0} x{1}'.format(*method)
+            for N in horizons:
+                err, solve_ms, n_x, success = prediction_error(f, N, horizon/N, method, np.array(x0), xs, Q, R,
+                                                               limits, opts)
+                errors[label, N] = (err if success else np.inf, solve_ms)
+                print('{0:>14s} {1:4d} {2:6.2f} {3:10.2e} {4:9.2f} {5:6d}{6}'.format(
+                    label, N, horizon/N, err, solve_ms, n_x, '' if success else '  (not converged)'))
+        target = errors['euler', 100][0]
+        for label in dict.fromkeys(k[0] for k in errors):
+            fine = [N for N in horizons if errors[label, N][0] <= target]
+            if fine:
+                print('{0:>14s}: N={1} reaches the error of euler N=100 ({2:.2e}) in {3:.2f} ms'.format(
+                    label, min(fine), target, errors[label, min(fine)][1]))
+            else:
+                print('{0:>14s}: no N reaches the error of euler N=100'.format(label))
+        print('')
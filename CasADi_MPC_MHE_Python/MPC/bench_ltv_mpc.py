@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+LTV-MPC against the full NLP in the tracking loop of sim_4 (unicycle, N=8,
+T=0.5, 60 ticks), from the initial state of sim_4 and from two starts
+farther away from the reference.
+
+deviation : largest distance of the closed-loop states to those of the NLP run
+cost      : closed-loop tracking cost with the Q / R of sim_4
+qp / nlp  : ticks solved by the QP and by the NLP fallback; 'qp failures'
+            disables the threshold, the NLP then only runs when the QP fails
+tick ms   : mean / max wall time of a tick
+"""
+
+import casadi as ca
+import numpy as np
+import time
+
+from ltv_mpc import LTVController
+from ocp_builder import unicycle_model
+from sim_4_mpc_robot_tracking_mul_shooting import desired_command_and_trajectory
+
+
+def build_nlp():
+    # the NLP of sim_4 on a uniform grid
+    U = ca.SX.sym('U', 2, N)
+    X = ca.SX.sym('X', 3, N+1)
+    U_ref = ca.SX.sym('U_ref', 2, N)
+    X_ref = ca.SX.sym('X_ref', 3, N+1)
+    obj = 0
+    g = [X[:, 0]-X_ref[:, 0]]
+    for i in range(N):
+        state_error_ = X[:, i] - X_ref[:, i+1]
+        control_error_ = U[:, i] - U_ref[:, i]
+        obj = obj + ca.mtimes([state_error_.T, Q, state_error_]) + ca.mtimes([control_error_.T, R, control_error_])
+        g.append(X[:, i+1] - (f(X[:, i], U[:, i])*T + X[:, i]))
+    return {'f': obj, 'x': ca.vertcat(ca.reshape(U, -1, 1), ca.reshape(X, -1, 1)),
+            'p': ca.vertcat(ca.reshape(U_ref, -1, 1), ca.reshape(X_ref, -1, 1)), 'g': ca.vertcat(*g)}
+
+
+def closed_loop(x_init, ltv_args, n_iter=60):
+    solver = ca.nlpsol('solver', 'ipopt', build_nlp(), opts)
+    ltv = None if ltv_args is None else LTVController(f, N, np.full(N, T), Q, R, lbx, ubx, solver, **ltv_args)
+    x0 = np.array(x_init, dtype=float)
+    u_plan = np.zeros((N, 2))
+    x_plan = np.tile(x0, (N+1, 1))
+    x_ref, u_ref = desired_command_and_trajectory(0.0, T, x0, N)
+    states = [x0]
+    cost = 0.0
+    tick_t = []
+    for mpciter in range(n_iter):
+        t_ = time.time()
+        if ltv is None:
+            res = solver(x0=np.concatenate((u_plan.ravel(), x_plan.ravel())),
+                         p=np.concatenate((u_ref.ravel(), x_ref.ravel())), lbx=lbx, ubx=ubx, lbg=0.0, ubg=0.0)
+            z = res['x'].full().ravel()
+        else:
+            z = ltv(x0, x_ref, u_ref, x_plan if mpciter > 0 else None, u_plan).ravel()
+        tick_t.append(time.time() - t_)
+        u_plan = z[:2*N].reshape(N, 2)
+        x_plan = z[2*N:].reshape(N+1, 3)
+        e = x0 - x_ref[1]
+        du = u_plan[0] - u_ref[0]
+        cost += e.dot(Q).dot(e) + du.dot(R).dot(du)
+        x0 = x0 + T*f(x0, u_plan[0]).full().ravel()
+        states.append(x0)
+        u_plan = np.concatenate((u_plan[1:], u_plan[-1:]))
+        x_plan = np.concatenate((x_plan[1:], x_plan[-1:]))
+        x_ref, u_ref = desired_command_and_trajectory(T*(mpciter+1), T, x0, N)
+    modes = [r['mode'] for r in ltv.records] if ltv is not None else ['nlp']*n_iter
+    return np.array(states), cost, modes.count('qp'), modes.count('nlp'), 1e3*np.mean(tick_t), 1e3*np.max(tick_t)
+
+
+if __name__ == '__main__':
+    T = 0.5
+    N = 8
+    f = unicycle_model()
+    Q = np.diag([1.0, 5.0, 0.1])
+    R = np.diag([0.5, 0.05])
+    opts = {'ipopt.max_iter': 100, 'ipopt.print_level': 0, 'print_time': 0,
+            'ipopt.acceptable_tol': 1e-8, 'ipopt.acceptable_obj_change_tol': 1e-6}
+    lbx = np.concatenate((np.tile([-0.6, -np.pi/4.0], N), np.tile([-20.0, -2.0, -np.inf], N+1)))
+    ubx = np.concatenate((np.tile([0.6, np.pi/4.0], N), np.tile([20.0, 2.0, np.inf], N+1)))
+    starts = [[0.0, 0.0, 0.0], [0.0, -1.5, np.pi/2.0], [2.0, 1.0, np.pi]]
+    modes = [('nlp', None),
+             ('ltv reference', {'linearize': 'reference'}),
+             ('ltv shifted', {'linearize': 'shifted'}),
+             ('ltv reference, qp failures', {'linearize': 'reference', 'threshold': np.inf}),
+             ('ltv shifted, qp failures', {'linearize': 'shifted', 'threshold': np.inf}),
+             ('ltv shifted, 0.01 m', {'linearize': 'shifted', 'threshold': 0.01})]
+
+    print('{0:>22s} {1:>26s} {2:>10s} {3:>9s} {4:>4s} {5:>4s} {6:>8s} {7:>7s}'.format(
+        'start', 'mode', 'deviation', 'cost', 'qp', 'nlp', 'tick ms', 'max ms'))
+    for x_init in starts:
+        reference = None
+        for name, ltv_args in modes:
+            states, cost, n_qp, n_nlp, tick_ms, max_ms = closed_loop(x_init, ltv_args)
+            if reference is None:
+                reference = states
+            print('{0:>22s} {1:>26s} {2:10.2e} {3:9.3f} {4:4d} {5:4d} {6:8.2f} {7:7.2f}'.format(
+                str(np.round(x_init, 2).tolist()), name, np.max(np.linalg.norm(states-reference, axis=1)), cost,
+                n_qp, n_nlp, tick_ms, max_ms))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Move blocking against one control per stage for the unicycle (sim_2) and
+the forklift (sim_mpc_forklift.py), N=100, closed loop with the shifted
+primal-dual warm start.
+
+n_w      : decision variables
+jac nnz  : nonzeros of the constraint Jacobian
+solve ms : mean IPOPT time per tick
+iter     : mean IPOPT iterations per tick
+cost     : closed loop cost sum x'Qx + u'Ru of the applied controls
+"""
+
+import sys
+import time
+
+import casadi as ca
+import numpy as np
+
+from ocp_builder import build_mul_shooting_nlp, forklift_model, make_bounds, make_params, n_blocks, unicycle_model
+from warm_start import WARM_START_OPTS, shift_primal_dual
+
+
+def closed_loop(f, N, T, blocks, x0, xs, Q, R, limits, opts, n_iter):
+    n_states = f.size1_in(0)
+    n_controls = f.size1_in(1)
+    nlp = build_mul_shooting_nlp(f, N, T, blocks=blocks)
+    cold_solver = ca.nlpsol('solver', 'ipopt', nlp, opts)
+    solver = ca.nlpsol('solver', 'ipopt', nlp, dict(opts, **WARM_START_OPTS))
+    jac_nnz = ca.jacobian(nlp['g'], nlp['x']).nnz()
+    lbx, ubx = make_bounds(N, *limits, blocks=blocks)
+    x0 = np.array(x0, dtype=float).reshape(-1, 1)
+    w0 = np.concatenate((np.zeros(n_blocks(N, blocks)*n_controls), np.tile(x0.ravel(), N+1)))
+    lam_x0 = 0.0
+    lam_g0 = 0.0
+    cost = 0.0
+    index_t = []
+    iter_c = []
+    for mpciter in range(n_iter):
+        c_p = make_params(x0, xs, Q, R)
+        tick_solver = cold_solver if mpciter == 0 else solver
+        t_ = time.time()
+        res = tick_solver(x0=w0, p=c_p, lbx=lbx, ubx=ubx, lbg=0.0, ubg=0.0, lam_x0=lam_x0, lam_g0=lam_g0)
+        index_t.append(time.time() - t_)
+        iter_c.append(tick_solver.stats()['iter_count'])
+        u = res['x'].full()[:n_controls]
+        e = x0 - np.reshape(xs, (-1, 1))
+        cost += (e.T.dot(Q).dot(e) + u.T.dot(R).dot(u)).item()
+        x0 = x0 + T*f(x0, u).full()
+        w0, lam_x0, lam_g0 = shift_primal_dual(res['x'], res['lam_x'], res['lam_g'], N, n_states, n_controls,
+                                               blocks=blocks)
+    return nlp['x'].size1(), jac_nnz, np.mean(index_t[1:]), np.mean(iter_c[1:]), cost
+
+
+if __name__ == '__main__':
+    N = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    T = 0.2
+    v_max = 0.6
+    omega_max = np.pi/4.0
+    opts = {'ipopt.max_iter': 100, 'ipopt.print_level': 0, 'print_time': 0,
+            'ipopt.acceptable_tol': 1e-8, 'ipopt.acceptable_obj_change_tol': 1e-6}
+    schemes = [('none', None),
+               ('uniform 5', [5]*(N//5)),
+               ('uniform 10', [10]*(N//10)),
+               ('growing', [1, 1, 1, 2, 5, 10, 20, N-40])]
+    cases = [('unicycle', unicycle_model(), [0.0, 0.0, 0.0], [1.5, 1.5, 0.0],
+              np.diag([1.0, 5.0, 0.1]), np.diag([0.5, 0.05]), [-2.0, -2.0, -np.inf], [2.0, 2.0, np.inf], 40),
+             ('forklift', forklift_model(), [0.0, 0.0, 0.0, 0.0], [7.0, 7.0, 0.0, 0.0],
+              np.diag([5.0, 5.0, 2.0, 0.1]), np.diag([0.5, 0.4]),
+              [-16.0, -16.0, -np.pi, -np.pi/2.0], [7.01, 7.01, np.pi, np.pi/2.0], 100)]
+
+    for name, f, x0, xs, Q, R, x_min, x_max, n_iter in cases:
+        limits = ([-v_max, -omega_max], [v_max, omega_max], x_min, x_max)
+        print('{0}, N={1}, {2} ticks'.format(name, N, n_iter))
+        print('{0:>12s} {1:>6s} {2:>8s} {3:>9s} {4:>6s} {5:>10s}'.format(
+            'blocks', 'n_w', 'jac nnz', 'solve ms', 'iter', 'cost'))
+        for label, blocks in schemes:
+            n_w, jac_nnz, t_solve, n_it, cost = closed_loop(f, N, T, blocks, x0, xs, Q, R, limits, opts, n_iter)
+            print('{0:>12s} {1:6d} {2:8d} {3:9.2f} {4:6.2f} {5:10.3f}'.format(
+                label, n_w, jac_nnz, t_solve*1e3, n_it, cost))
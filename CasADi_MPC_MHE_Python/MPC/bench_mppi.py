@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+MPPI against IPOPT in the obstacle avoidance loop of sim_3, unicycle, N=100,
+for the scenarios of bench_multi_start.py.
+
+cost       : closed-loop cost with the Q / R of sim_3
+clearance  : smallest distance between the robot and the obstacle surface,
+             negative for a collision
+final dist : distance to the target after the last tick
+ticks      : ticks until the target is reached (1e-2, or 5e-2 for MPPI) or
+             the limit of 100 ticks
+tick ms    : mean / max wall time of a tick
+
+The MPPI rows use n_samples samples per iteration and n_iterations
+iterations per tick, split into chunks for the serial, thread and process
+executors.
+"""
+
+import os
+import time
+
+import casadi as ca
+import numpy as np
+
+from mppi import MPPI
+from ocp_builder import build_mul_shooting_nlp, make_bounds, make_g_bounds, make_params, unicycle_model
+
+
+def closed_loop(scenario, controller, n_iter=100):
+    x0, xs, obstacle, obs_diam = scenario
+    x0 = np.asarray(x0, dtype=float)
+    xs = np.asarray(xs, dtype=float)
+    min_dist = rob_diam/2. + obs_diam/2.
+    if controller is None:
+        solver = ca.nlpsol('solver', 'ipopt', build_mul_shooting_nlp(f, N, T, obstacles=[obstacle]), opts)
+        lbg, ubg = make_g_bounds(f, N, [obstacle], [min_dist])
+        plan = np.concatenate((np.tile([1.0, 2.0], N), np.zeros(3*(N+1))))
+        tol = 1e-2
+    else:
+        mppi = MPPI('unicycle', N, T, Q, R, u_min, u_max, obstacles=[obstacle], min_distance=[min_dist],
+                    x_min=x_min, x_max=x_max, **controller)
+        u_plan = None
+        tol = 5e-2
+    cost = 0.0
+    clearance = np.inf
+    tick_t = []
+    mpciter = 0
+    while np.linalg.norm(x0-xs) > tol and mpciter < n_iter:
+        t_ = time.time()
+        if controller is None:
+            res = solver(x0=plan, p=make_params(x0, xs, Q, R), lbx=lbx, ubx=ubx, lbg=lbg, ubg=ubg)
+            plan = res['x'].full().ravel()
+            u_plan = plan[:2*N].reshape(N, 2)
+            x_plan = plan[2*N:].reshape(N+1, 3)
+        else:
+            u_plan, x_plan = mppi(x0, xs, u_plan)
+        tick_t.append(time.time() - t_)
+        u = u_plan[0]
+        e = x0 - xs
+        cost += e.dot(Q).dot(e) + u.dot(R).dot(u)
+        x0 = x0 + T*np.array([u[0]*np.cos(x0[2]), u[0]*np.sin(x0[2]), u[1]])
+        clearance = min(clearance, np.linalg.norm(x0[:2]-obstacle) - min_dist)
+        u_plan = np.concatenate((u_plan[1:], u_plan[-1:]))
+        if controller is None:
+            plan = np.concatenate((u_plan.ravel(), np.concatenate((x_plan[1:], x_plan[-1:])).ravel()))
+        mpciter = mpciter + 1
+    if controller is not None:
+        mppi.close()
+    return cost, clearance, np.linalg.norm(x0-xs), mpciter, 1e3*np.mean(tick_t), 1e3*np.max(tick_t)
+
+
+if __name__ == '__main__':
+    T = 0.2
+    N = 100
+    rob_diam = 0.3
+    v_max = 0.6
+    f = unicycle_model()
+    Q = np.diag([1.0, 5.0, 0.1])
+    R = np.diag([0.5, 0.05])
+    u_min, u_max = [-v_max, -np.pi/4.0], [v_max, np.pi/4.0]
+    x_min, x_max = [-2.0, -2.0, -np.inf], [2.0, 2.0, np.inf]
+    opts = {'ipopt.max_iter': 100, 'ipopt.print_level': 0, 'print_time': 0,
+            'ipopt.acceptable_tol': 1e-8, 'ipopt.acceptable_obj_change_tol': 1e-6}
+    lbx, ubx = make_bounds(N, u_min, u_max, x_min, x_max)
+    scenarios = [([0.0, 0.0, 0.0], [1.5, 1.5, 0.0], (0.5, 0.5), 0.3),
+                 ([-1.5, -1.0, 0.0], [1.5, 1.0, 0.0], (0.1, 0.1), 0.6),
+                 ([1.5, -1.5, np.pi], [-1.0, 1.5, np.pi/2.0], (0.25, 0.0), 0.5)]
+    controllers = [('ipopt', None),
+                   ('mppi 250', {'n_samples': 250}),
+                   ('mppi 1000', {'n_samples': 1000}),
+                   ('mppi 4000', {'n_samples': 4000}),
+                   ('mppi 1000 x3', {'n_samples': 1000, 'n_iterations': 3}),
+                   ('mppi 1000 thread 2', {'n_samples': 1000, 'executor': 'thread', 'n_workers': 2}),
+                   ('mppi 1000 process 2', {'n_samples': 1000, 'executor': 'process', 'n_workers': 2})]
+
+    print('{0} CPU(s)'.format(len(os.sched_getaffinity(0))))
+    print('{0:>9s} {1:>20s} {2:>9s} {3:>10s} {4:>10s} {5:>6s} {6:>8s} {7:>7s}'.format(
+        'scenario', 'controller', 'cost', 'clearance', 'final dist', 'ticks', 'tick ms', 'max ms'))
+    for i, scenario in enumerate(scenarios):
+        for name, controller in controllers:
+            cost, clearance, final, ticks, tick_ms, max_ms = closed_loop(scenario, controller)
+            print('{0:>9d} {1:>20s} {2:9.3f} {3:10.3f} {4:10.3f} {5:6d} {6:8.2f} {7:7.2f}'.format(
+                i, name, cost, clearance, final, ticks, tick_ms, max_ms))
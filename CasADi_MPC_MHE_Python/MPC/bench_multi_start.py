@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Multi-start solves in the obstacle avoidance loop of sim_3, unicycle, N=100,
+for scenarios where the obstacle lies on the straight line to the target.
+
+starts       : initial guesses of every tick, 'shifted' is the shifted plan
+               of the last tick (sim_3), 'left' / 'right' the detours of
+               multi_start.detour_guess
+cost         : closed-loop cost, clearance the smallest distance between
+               the robot and the obstacle surfaces along the closed loop
+first tick   : cost of the first plan and iterations of the chosen start
+tick ms      : mean wall time of a tick over all starts
+best         : how often each start gave the plan
+"""
+
+import sys
+
+import numpy as np
+
+from multi_start import MultiStartSolver, detour_guess
+from ocp_builder import build_mul_shooting_nlp, make_bounds, make_g_bounds, make_params, unicycle_model
+
+
+def closed_loop(scenario, start_names, executor, budget=None, n_iter=60):
+    x0, xs, obstacle, obs_diam = scenario
+    x0 = np.asarray(x0, dtype=float).reshape(-1, 1)
+    xs = np.asarray(xs, dtype=float).reshape(-1, 1)
+    nlp = build_mul_shooting_nlp(f, N, T, obstacles=[obstacle])
+    min_dist = rob_diam/2. + obs_diam/2.
+    lbg, ubg = make_g_bounds(f, N, [obstacle], [min_dist])
+    solver = MultiStartSolver(nlp, opts, len(start_names), executor, budget)
+    # the first guess of sim_3
+    plan = np.concatenate((np.tile([1.0, 2.0], N), np.zeros(3*(N+1)))).reshape(-1, 1)
+    cost = 0.0
+    clearance = np.inf
+    first = None
+    mpciter = 0
+    while np.linalg.norm(x0-xs) > 1e-2 and mpciter < n_iter:
+        guesses = {}
+        for name in start_names:
+            if name == 'shifted':
+                guesses[name] = plan
+            else:
+                guesses[name] = detour_guess(x0, xs, obstacle, 1.5*min_dist, 1 if name == 'left' else -1, N, T, v_max)
+        plan, records = solver(guesses, make_params(x0, xs, Q, R), lbx, ubx, lbg, ubg)
+        if first is None:
+            best = [r for r in records if r['best']][0]
+            first = (best['f'], best['iter'])
+        u = plan[:2]
+        e = x0 - xs
+        cost += (e.T.dot(Q).dot(e) + u.T.dot(R).dot(u)).item()
+        x0 = x0 + T*f(x0, u).full()
+        clearance = min(clearance, np.linalg.norm(x0[:2].ravel()-obstacle) - min_dist)
+        # shift [U, X] by one stage like shift_movement
+        u_plan = plan[:2*N].reshape(N, 2)
+        x_plan = plan[2*N:].reshape(N+1, 3)
+        plan = np.concatenate((np.concatenate((u_plan[1:], u_plan[-1:])).ravel(),
+                               np.concatenate((x_plan[1:], x_plan[-1:])).ravel())).reshape(-1, 1)
+        mpciter = mpciter + 1
+    tick_ms = 1e3*np.mean([t['time'] for t in solver.records])
+    best = {name: sum(r['best'] for t in solver.records for r in t['starts'] if r['name'] == name)
+            for name in start_names}
+    solver.close()
+    return cost, clearance, first, tick_ms, mpciter, best
+
+
+if __name__ == '__main__':
+    executor = sys.argv[1] if len(sys.argv) > 1 else 'thread'
+    T = 0.2
+    N = 100
+    rob_diam = 0.3
+    v_max = 0.6
+    f = unicycle_model()
+    Q = np.diag([1.0, 5.0, 0.1])
+    R = np.diag([0.5, 0.05])
+    opts = {'ipopt.max_iter': 100, 'ipopt.print_level': 0, 'print_time': 0,
+            'ipopt.acceptable_tol': 1e-8, 'ipopt.acceptable_obj_change_tol': 1e-6}
+    lbx, ubx = make_bounds(N, [-v_max, -np.pi/4.0], [v_max, np.pi/4.0], [-2.0, -2.0, -np.inf], [2.0, 2.0, np.inf])
+    scenarios = [([0.0, 0.0, 0.0], [1.5, 1.5, 0.0], (0.5, 0.5), 0.3),
+                 ([-1.5, -1.0, 0.0], [1.5, 1.0, 0.0], (0.1, 0.1), 0.6),
+                 ([1.5, -1.5, np.pi], [-1.0, 1.5, np.pi/2.0], (0.25, 0.0), 0.5)]
+
+    print('executor {0}, {1} CPU(s)'.format(executor, len(__import__('os').sched_getaffinity(0))))
+    print('{0:>9s} {1:>24s} {2:>10s} {3:>10s} {4:>11s} {5:>6s} {6:>8s} {7:>6s}  {8}'.format(
+        'scenario', 'starts', 'cost', 'clearance', 'first cost', 'iter', 'tick ms', 'ticks', 'best'))
+    for i, scenario in enumerate(scenarios):
+        for start_names in [['shifted'], ['shifted', 'left', 'right']]:
+            cost, clearance, (first_cost, first_iter), tick_ms, ticks, best = closed_loop(
+                scenario, start_names, executor)
+            print('{0:>9d} {1:>24s} {2:10.3f} {3:10.3f} {4:11.3f} {5:6d} {6:8.2f} {7:6d}  {8}'.format(
+                i, ', '.join(start_names), cost, clearance, first_cost, first_iter, tick_ms, ticks,
+                ' '.join('{0} {1}'.format(k, v) for k, v in best.items())))
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Build time and graph size of the multiple shooting OCP for growing N:
+Python loop with SX, Python loop with MX (as in sim_mpc_forklift.py) and
+Function.map over the stage functions.
+
+graph build : time to construct the nlp expressions
+nodes       : operations in the resulting nlp function (graph memory)
+serialized  : size of the serialized nlp function
+nlpsol      : time of ca.nlpsol(...) on top of the graph
+solve       : one IPOPT solve from a zero initial guess, to check the runtime cost
+"""
+
+import sys
+import time
+
+import casadi as ca
+import numpy as np
+
+from ocp_builder import (build_mul_shooting_nlp, forklift_model, make_bounds, make_g_bounds, make_params,
+                         unicycle_model)
+
+
+def graph_size(nlp):
+    nlp_fun = ca.Function('nlp', [nlp['x'], nlp['p']], [nlp['f'], nlp['g']])
+    if nlp_fun.is_a('SXFunction'):
+        n_nodes = nlp_fun.n_instructions()
+    else:
+        n_nodes = nlp_fun.n_nodes()
+    return n_nodes, len(nlp_fun.serialize())
+
+
+if __name__ == '__main__':
+    horizons = [int(n) for n in sys.argv[1:]] or [100, 200, 500, 1000]
+    T = 0.2
+    opts_setting = {'ipopt.print_level': 0, 'print_time': 0}
+    variants = [('loop SX', {'sym': ca.SX}), ('loop MX', {'sym': ca.MX}), ('map MX', {'use_map': True})]
+    obstacles = [(0.5, 0.5)]
+
+    for model_name, f in [('unicycle', unicycle_model()), ('forklift', forklift_model(sym=ca.MX))]:
+        print('{0}'.format(model_name))
+        print('{0:>6s} {1:>8s} {2:>15s} {3:>10s} {4:>15s} {5:>12s} {6:>10s}'.format(
+            'N', 'variant', 'graph build ms', 'nodes', 'serialized kB', 'nlpsol ms', 'solve ms'))
+        n_states = f.size1_in(0)
+        n_controls = f.size1_in(1)
+        c_p = make_params(np.zeros(n_states), np.r_[1.5, 1.5, np.zeros(n_states-2)],
+                          np.ones(n_states), 0.1*np.ones(n_controls))
+        for N in horizons:
+            lbx, ubx = make_bounds(N, [-0.6, -np.pi/4.0], [0.6, np.pi/4.0], [-2.0]*n_states, [2.0]*n_states)
+            lbg, ubg = make_g_bounds(f, N, obstacles, [0.3])
+            for variant, kwargs in variants:
+                t_ = time.time()
+                nlp = build_mul_shooting_nlp(f, N, T, obstacles=obstacles, **kwargs)
+                t_graph = time.time() - t_
+                n_nodes, n_bytes = graph_size(nlp)
+                t_ = time.time()
+                solver = ca.nlpsol('solver', 'ipopt', nlp, opts_setting)
+                t_solver = time.time() - t_
+                t_ = time.time()
+                solver(x0=0.0, p=c_p, lbx=lbx, ubx=ubx, lbg=lbg, ubg=ubg)
+                t_solve = time.time() - t_
+                print('{0:6d} {1:>8s} {2:15.1f} {3:10d} {4:15.1f} {5:12.1f} {6:10.1f}'.format(
+                    N, variant, t_graph*1e3, n_nodes, n_bytes/1024.0, t_solver*1e3, t_solve*1e3))
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Cost of one plant step of the sim loops, unicycle and forklift, T=0.2.
+
+casadi f     : shift_movement of sim_3 / sim_4 before plant.py,
+               x0 + T*f(x0, u).full() and ca.reshape(x0, -1, 1).full()
+casadi F     : discrete_dynamics(f, integrator, n_substeps)(x0, u, T).full()
+plant        : plant.Plant.step, new column
+plant out    : plant.Plant.step into a preallocated column
+The last column is the largest difference to casadi F over 1000 random steps.
+"""
+
+import time
+
+import casadi as ca
+import numpy as np
+
+from ocp_builder import discrete_dynamics, forklift_model, unicycle_model
+from plant import Plant
+
+
+def step_us(fun, n=20000):
+    t_ = time.time()
+    for _ in range(n):
+        fun()
+    return 1e6*(time.time() - t_)/n
+
+
+if __name__ == '__main__':
+    T = 0.2
+    rng = np.random.default_rng(0)
+    print('{0:>9s} {1:>10s} {2:>10s} {3:>10s} {4:>10s} {5:>10s} {6:>10s}'.format(
+        'model', 'method', 'casadi f', 'casadi F', 'plant', 'plant out', 'max diff'))
+    for name, f in [('unicycle', unicycle_model()), ('forklift', forklift_model())]:
+        n_states = f.size1_in(0)
+        x0 = rng.uniform(-1.0, 1.0, (n_states, 1))
+        u = rng.uniform(-0.5, 0.5, 2)
+        out = np.zeros((n_states, 1))
+
+        def casadi_f():
+            st = x0 + T*f(x0, u).full()
+            return ca.reshape(st, -1, 1).full()
+
+        for integrator, n_substeps in [('euler', 1), ('rk4', 1), ('euler', 10), ('rk4', 10)]:
+            F = discrete_dynamics(f, integrator, n_substeps)
+            plant = Plant(f, T, integrator, n_substeps)
+            diff = 0.0
+            for _ in range(1000):
+                x = rng.uniform(-1.0, 1.0, (n_states, 1))
+                v = rng.uniform(-0.5, 0.5, 2)
+                diff = max(diff, np.max(np.abs(plant.step(x, v) - F(x, v, T).full())))
+            print('{0:>9s} {1:>10s} {2:>10s} {3:10.2f} {4:10.2f} {5:10.2f} {6:10.1e}'.format(
+                name, '{0} x{1}'.format(integrator, n_substeps),
+                '{0:.2f}'.format(step_us(casadi_f)) if (integrator, n_substeps) == ('euler', 1) else '',
+                step_us(lambda: F(x0, u, T).full()), step_us(lambda: plant.step(x0, u)),
+                step_us(lambda: plant.step(x0, u, out)), diff))
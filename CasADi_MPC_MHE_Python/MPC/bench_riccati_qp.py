@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Riccati interior point QP (riccati_qp.py) against ca.qpsol on the QP of one
+SQP step of the multiple shooting unicycle problem, for growing N.
+The QP is the linearization around a rollout that violates the velocity
+limits, so the bounds are active. Every solver sees the same numbers.
+
+solve ms : time of one QP solve (qpsol construction not included)
+obj diff : objective of the solver minus the one of the Riccati solution
+viol     : largest violation of the bounds and of the linearized dynamics
+
+The Riccati solver needs about 10 interior point iterations for every N and
+its time grows linearly with N. Its per-stage work is a handful of NumPy calls
+on 3x3 / 2x2 matrices, so the Python overhead per stage, not the flops,
+sets the constant.
+"""
+
+import sys
+import time
+
+import casadi as ca
+import numpy as np
+
+from ocp_builder import build_mul_shooting_nlp, make_bounds, make_params, unicycle_model
+from riccati_qp import ocp_qp_function, solve_ocp_qp, unpack_ocp_qp
+
+
+def linearization_point(f, N, T, x0, u=None):
+    u = np.tile([0.8, 0.5], (N, 1)) if u is None else u
+    x = [np.ravel(x0)]
+    for k in range(N):
+        x.append(x[-1] + T*f(x[-1], u[k]).full().ravel())
+    return np.concatenate((u.ravel(), np.ravel(x)))
+
+
+if __name__ == '__main__':
+    horizons = [int(n) for n in sys.argv[1:]] or [10, 20, 50, 100, 200, 500, 1000]
+    # qpoases is dense, it is only run for the short horizons
+    plugins = [('qrqp', {'print_iter': False, 'print_header': False, 'print_info': False}, 1000),
+               ('osqp', {'osqp': {'verbose': False, 'eps_abs': 1e-6, 'eps_rel': 1e-6}}, 1000),
+               ('qpoases', {'printLevel': 'none'}, 100)]
+    T = 0.2
+    f = unicycle_model()
+    x0 = np.array([0.0, 0.0, 0.0])
+    c_p = make_params(x0, [1.5, 1.5, 0.0], [1.0, 5.0, 0.1], [0.5, 0.05])
+
+    print('{0:>6s} {1:>10s} {2:>10s} {3:>8s} {4:>12s} {5:>10s}'.format(
+        'N', 'solver', 'solve ms', 'success', 'obj diff', 'viol'))
+    for N in horizons:
+        nlp = build_mul_shooting_nlp(f, N, T)
+        lbx, ubx = make_bounds(N, [-0.6, -np.pi/4.0], [0.6, np.pi/4.0], [-2.0, -2.0, -np.inf], [2.0, 2.0, np.inf])
+        w = linearization_point(f, N, T, x0)
+        qp = unpack_ocp_qp(ocp_qp_function(nlp, N, 3, 2)(w, c_p), N, 3, 2)
+        lbz = lbx - w
+        ubz = ubx - w
+        dx0 = x0 - w[2*N:2*N+3]
+
+        t_ = time.time()
+        z, info = solve_ocp_qp(x0=dx0, lbz=lbz, ubz=ubz, **qp)
+        t_riccati = time.time() - t_
+        H, grad = ca.hessian(nlp['f'], nlp['x'])
+        H, grad = ca.Function('H', [nlp['x'], nlp['p']], [H, grad])(w, c_p)
+        obj_riccati = 0.5*z.dot(H.full().dot(z)) + grad.full().ravel().dot(z)
+        J = ca.Function('J', [nlp['x'], nlp['p']], [ca.jacobian(nlp['g'], nlp['x'])])(w, c_p)
+        g_lin = np.concatenate((-dx0, -qp['c'].ravel()))
+
+        def violation(dz):
+            return max(np.max(lbz-dz), np.max(dz-ubz), np.max(np.abs(J.full().dot(dz)+g_lin)))
+        print('{0:6d} {1:>10s} {2:10.2f} {3:>8s} {4:12.2e} {5:10.1e}   {6} iterations'.format(
+            N, 'riccati', t_riccati*1e3, str(info['success']), 0.0, violation(z), info['iter']))
+
+        # the same QP through the symbolic qpsol interface
+        dw = ca.SX.sym('dw', nlp['x'].size1())
+        qp_prob = {'x': dw, 'f': 0.5*ca.mtimes([dw.T, H, dw]) + ca.mtimes(grad.T, dw), 'g': ca.mtimes(J, dw)}
+        for plugin, opts, max_N in plugins:
+            if N > max_N:
+                continue
+            solver = ca.qpsol('solver', plugin, qp_prob, dict({'print_time': 0, 'error_on_fail': False}, **opts))
+            t_ = time.time()
+            res = solver(lbx=lbz, ubx=ubz, lbg=-g_lin, ubg=-g_lin)
+            t_solve = time.time() - t_
+            print('{0:6d} {1:>10s} {2:10.2f} {3:>8s} {4:12.2e} {5:10.1e}'.format(
+                N, plugin, t_solve*1e3, str(solver.stats()['success']), float(res['f']) - obj_riccati,
+                violation(res['x'].full().ravel())))
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Throughput of the batched rollouts of rollout.py against the per-stage loop
+of prediction_state (demo_car_opti.py) and the CasADi discrete dynamics
+mapped over the horizon.
+
+First the rollouts are checked against discrete_dynamics of ocp_builder for
+both models and integrators. Then the rollouts per second are measured for
+batches of K random control sequences, horizon N, single core.
+"""
+
+import sys
+import time
+
+import casadi as ca
+import numpy as np
+
+from ocp_builder import discrete_dynamics, forklift_model, unicycle_model
+from rollout import Rollout
+
+
+def prediction_state(x0, u, T, N):
+    # loop of demo_car_opti.py
+    states = np.zeros((N+1, 3))
+    states[0, :] = x0
+    for i in range(N):
+        states[i+1, 0] = states[i, 0] + u[i, 0] * np.cos(states[i, 2]) * T
+        states[i+1, 1] = states[i, 1] + u[i, 0] * np.sin(states[i, 2]) * T
+        states[i+1, 2] = states[i, 2] + u[i, 1] * T
+    return states
+
+
+def casadi_rollout(F, N, T):
+    """ Function (x0, U (n_controls, N)) -> X (n_states, N+1) """
+    x0 = ca.SX.sym('x0', F.size1_in(0))
+    U = ca.SX.sym('U', F.size1_in(1), N)
+    X = [x0]
+    for k in range(N):
+        X.append(F(X[-1], U[:, k], T))
+    return ca.Function('rollout', [x0, U], [ca.horzcat(*X)])
+
+
+def rate(fun, n_rollouts, min_time=0.5):
+    """ rollouts per second, fun runs n_rollouts rollouts """
+    n_calls = 0
+    t_ = time.time()
+    while time.time() - t_ < min_time or n_calls < 3:
+        fun()
+        n_calls += 1
+    return n_calls*n_rollouts/(time.time() - t_)
+
+
+if __name__ == '__main__':
+    N = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    T = 0.2
+    rng = np.random.default_rng(0)
+    models = {'unicycle': (unicycle_model(), [0.0, 0.0, 0.0]), 'forklift': (forklift_model(1.0), [0.0, 0.0, 0.0, 0.0])}
+
+    print('largest difference to discrete_dynamics, 100 rollouts, N={0}'.format(N))
+    for name, (f, x0) in models.items():
+        for integrator, n_substeps in [('euler', 1), ('rk4', 1), ('rk4', 4)]:
+            reference = casadi_rollout(discrete_dynamics(f, integrator, n_substeps), N, T)
+            u = rng.uniform([-0.6, -np.pi/4.0], [0.6, np.pi/4.0], (100, N, 2))
+            x0_batch = rng.uniform(-1.0, 1.0, (100, len(x0)))
+            states = Rollout(name, N, T, 100, integrator, n_substeps)(x0_batch, u)
+            error = max(np.max(np.abs(states[i] - reference(x0_batch[i], u[i].T).full().T)) for i in range(100))
+            print('{0:>9s} {1:>5s} x{2}: {3:.1e}'.format(name, integrator, n_substeps, error))
+
+    print('')
+    print('rollouts per second, N={0}'.format(N))
+    print('{0:>9s} {1:>9s} {2:>6s} {3:>12s}'.format('model', 'method', 'K', 'rollouts/s'))
+    u1 = rng.uniform([-0.6, -np.pi/4.0], [0.6, np.pi/4.0], (1, N, 2))
+    print('{0:>9s} {1:>9s} {2:6d} {3:12.0f}'.format(
+        'unicycle', 'loop', 1, rate(lambda: prediction_state(models['unicycle'][1], u1[0], T, N), 1)))
+    for name, (f, x0) in models.items():
+        reference = casadi_rollout(discrete_dynamics(f, 'euler'), N, T)
+        print('{0:>9s} {1:>9s} {2:6d} {3:12.0f}'.format(
+            name, 'casadi', 1, rate(lambda: reference(x0, u1[0].T), 1)))
+        mapped = reference.map(1000)
+        u_mapped = np.tile(u1[0].T, 1000)
+        print('{0:>9s} {1:>9s} {2:6d} {3:12.0f}'.format(
+            name, 'casadi map', 1000, rate(lambda: mapped(x0, u_mapped), 1000)))
+        for integrator in ['euler', 'rk4']:
+            for K in [1, 10, 100, 1000, 10000]:
+                rollout = Rollout(name, N, T, K, integrator)
+                u = rng.uniform([-0.6, -np.pi/4.0], [0.6, np.pi/4.0], (K, N, 2))
+                print('{0:>9s} {1:>9s} {2:6d} {3:12.0f}'.format(
+                    name, integrator, K, rate(lambda: rollout(x0, u), K)))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Real-time iteration against the full NLP solve in the closed loop of the
+unicycle (sim_2) and the forklift (sim_mpc_forklift).
+
+latency     : time from the new state to the first control (IPOPT solve / RTI feedback QP)
+preparation : RTI linearization, done between two ticks
+cost        : closed-loop cost sum of x'Qx + u'Ru along the executed trajectory
+"""
+
+import sys
+import time
+
+import casadi as ca
+import numpy as np
+
+from ocp_builder import build_mul_shooting_nlp, forklift_model, make_bounds, make_params, unicycle_model
+from rti import RTIController
+
+
+def closed_loop_cost(xs, us, x_target, Q, R):
+    cost = 0.0
+    for x, u in zip(xs, us):
+        e = np.ravel(x) - np.ravel(x_target)
+        cost += e.dot(Q).dot(e) + np.ravel(u).dot(R).dot(np.ravel(u))
+    return cost
+
+
+def run_nlp(solver, f, N, T, x0, xs, Q, R, lbx, ubx, n_steps):
+    n_states = f.size1_in(0)
+    n_controls = f.size1_in(1)
+    w0 = np.concatenate((np.zeros(N*n_controls), np.tile(np.ravel(x0), N+1)))
+    x_hist, u_hist, latency = [], [], []
+    for _ in range(n_steps):
+        t_ = time.time()
+        res = solver(x0=w0, p=make_params(x0, xs, Q, R), lbg=0.0, ubg=0.0, lbx=lbx, ubx=ubx)
+        latency.append(time.time() - t_)
+        w = res['x'].full().ravel()
+        u = w[:n_controls].reshape(-1, 1)
+        x_hist.append(x0)
+        u_hist.append(u)
+        x0 = x0 + T*f(x0, u).full()
+        w0 = np.concatenate((w[n_controls:N*n_controls], w[(N-1)*n_controls:N*n_controls],
+                             w[N*n_controls+n_states:], w[-n_states:]))
+    return x_hist, u_hist, np.array(latency), [], x0
+
+
+def run_rti(solver, rti, f, N, T, x0, xs, Q, R, lbx, ubx, n_steps):
+    # the iterate is initialized once with a converged solution of the first state
+    n_states = f.size1_in(0)
+    n_controls = f.size1_in(1)
+    w0 = np.concatenate((np.zeros(N*n_controls), np.tile(np.ravel(x0), N+1)))
+    rti.initialize(solver(x0=w0, p=make_params(x0, xs, Q, R), lbg=0.0, ubg=0.0, lbx=lbx, ubx=ubx)['x'])
+    rti.preparation(make_params(x0, xs, Q, R))
+    x_hist, u_hist, latency, prep_t = [], [], [], []
+    for _ in range(n_steps):
+        t_ = time.time()
+        u = rti.feedback(x0)
+        latency.append(time.time() - t_)
+        x_hist.append(x0)
+        u_hist.append(u)
+        x0 = x0 + T*f(x0, u).full()
+        t_ = time.time()
+        rti.shift()
+        rti.preparation(make_params(x0, xs, Q, R))
+        prep_t.append(time.time() - t_)
+    return x_hist, u_hist, np.array(latency), np.array(prep_t), x0
+
+
+if __name__ == '__main__':
+    qp_plugin = sys.argv[1] if len(sys.argv) > 1 else 'osqp'
+    T = 0.2
+    N = 100
+    v_max = 0.6
+    omega_max = np.pi/4.0
+    opts_setting = {'ipopt.max_iter': 100, 'ipopt.print_level': 0, 'print_time': 0,
+                    'ipopt.acceptable_tol': 1e-8, 'ipopt.acceptable_obj_change_tol': 1e-6}
+    cases = [
+        ('unicycle', unicycle_model(), np.zeros(3), np.array([1.5, 1.5, 0.0]),
+         np.diag([1.0, 5.0, 0.1]), np.diag([0.5, 0.05]), [-2.0, -2.0, -np.inf], [2.0, 2.0, np.inf], 100),
+        ('forklift', forklift_model(), np.zeros(4), np.array([7.0, 7.0, 0.0, 0.0]),
+         np.diag([5.0, 5.0, 2.0, 0.1]), np.diag([0.5, 0.4]),
+         [-16.0, -16.0, -np.pi, -np.pi/2.0], [7.01, 7.01, np.pi, np.pi/2.0], 100),
+    ]
+
+    print('QP solver of the feedback phase: {0}'.format(qp_plugin))
+    print('{0:>9s} {1:>5s} {2:>12s} {3:>12s} {4:>12s} {5:>12s} {6:>12s}'.format(
+        'model', 'mode', 'latency ms', 'max ms', 'prep ms', 'cost', 'final error'))
+    for name, f, x0, xs, Q, R, x_min, x_max, n_steps in cases:
+        lbx, ubx = make_bounds(N, [-v_max, -omega_max], [v_max, omega_max], x_min, x_max)
+        nlp = build_mul_shooting_nlp(f, N, T)
+        solver = ca.nlpsol('solver', 'ipopt', nlp, opts_setting)
+        rti = RTIController(nlp, N, f.size1_in(0), f.size1_in(1), lbx, ubx, qp_plugin=qp_plugin)
+        x0 = x0.reshape(-1, 1)
+        for mode in ['nlp', 'rti']:
+            if mode == 'nlp':
+                x_hist, u_hist, latency, prep_t, x_end = run_nlp(solver, f, N, T, x0, xs, Q, R, lbx, ubx, n_steps)
+            else:
+                x_hist, u_hist, latency, prep_t, x_end = run_rti(solver, rti, f, N, T, x0, xs, Q, R, lbx, ubx,
+                                                                 n_steps)
+            print('{0:>9s} {1:>5s} {2:12.2f} {3:12.2f} {4:>12s} {5:12.3f} {6:12.3e}'.format(
+                name, mode, latency.mean()*1e3, latency.max()*1e3,
+                '{0:.2f}'.format(prep_t.mean()*1e3) if len(prep_t) else '-',
+                closed_loop_cost(x_hist, u_hist, xs, Q, R), np.linalg.norm(x_end.ravel()-xs)))
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tangential (sensitivity) predictor in the sim_2 closed loop, unicycle, N=100,
+with a random disturbance on the plant state (sigma in m / rad per tick).
+
+warm start : IPOPT iterations and solve time per tick when the initial guess
+             is the shifted last solution or the sensitivity prediction of the
+             last solution for the new x0
+rate       : a full solve every k ticks, in between the predictor or the
+             shifted plan of the last full solve (open loop); latency of the
+             predictor ticks, mean and largest error of the applied control
+             against the exact solution of the tick, closed-loop cost
+"""
+
+import sys
+import time
+
+import casadi as ca
+import numpy as np
+
+from ocp_builder import build_mul_shooting_nlp, make_bounds, make_params, unicycle_model
+from sensitivity import SensitivityPredictor
+from warm_start import WARM_START_OPTS, shift_primal_dual
+
+
+def closed_loop(guess, solve_every, sigma, open_loop=False, n_iter=100, seed=0):
+    rng = np.random.RandomState(seed)
+    x0 = np.zeros((3, 1))
+    w0 = np.concatenate((np.zeros(2*N), np.tile(x0.ravel(), N+1)))
+    lam_x0 = 0.0
+    lam_g0 = 0.0
+    cost = 0.0
+    solve_t = []
+    predict_t = []
+    update_t = []
+    u_err = []
+    iter_c = []
+    mpciter = 0
+    while np.linalg.norm(x0-xs) > 1e-2 and mpciter < n_iter:
+        c_p = make_params(x0, xs, Q, R)
+        if mpciter % solve_every == 0:
+            if mpciter > 0 and guess == 'predicted':
+                w0, lam_x0, lam_g0 = predictor.predict(c_p)
+            tick_solver = cold_solver if mpciter == 0 else solver
+            t_ = time.time()
+            res = tick_solver(x0=w0, p=c_p, lbx=lbx, ubx=ubx, lbg=0.0, ubg=0.0, lam_x0=lam_x0, lam_g0=lam_g0)
+            solve_t.append(time.time() - t_)
+            iter_c.append(tick_solver.stats()['iter_count'])
+            t_ = time.time()
+            predictor.update(res, c_p)
+            update_t.append(time.time() - t_)
+            w = res['x'].full()
+            w0, lam_x0, lam_g0 = shift_primal_dual(res['x'], res['lam_x'], res['lam_g'], N, 3, 2)
+        else:
+            t_ = time.time()
+            w = predictor.w.reshape(-1, 1) if open_loop else predictor.predict(c_p)[0]
+            predict_t.append(time.time() - t_)
+            # exact solution of this tick, only for the error of the applied control
+            w_ref = solver(x0=w, p=c_p, lbx=lbx, ubx=ubx, lbg=0.0, ubg=0.0)['x'].full()
+            u_err.append(np.linalg.norm(w[:2]-w_ref[:2]))
+        predictor.shift()
+        u = w[:2]
+        e = x0 - xs
+        cost += (e.T.dot(Q).dot(e) + u.T.dot(R).dot(u)).item()
+        x0 = x0 + T*f(x0, u).full() + sigma*rng.randn(3, 1)
+        mpciter = mpciter + 1
+    return np.array(iter_c[1:]), np.array(solve_t[1:]), np.array(predict_t), np.mean(update_t), \
+        np.array(u_err), cost
+
+
+if __name__ == '__main__':
+    sigma = float(sys.argv[1]) if len(sys.argv) > 1 else 0.01
+    T = 0.2
+    N = 100
+    f = unicycle_model()
+    Q = np.diag([1.0, 5.0, 0.1])
+    R = np.diag([0.5, 0.05])
+    xs = np.array([1.5, 1.5, 0.0]).reshape(-1, 1)
+    nlp = build_mul_shooting_nlp(f, N, T)
+    opts = {'ipopt.max_iter': 100, 'ipopt.print_level': 0, 'print_time': 0,
+            'ipopt.acceptable_tol': 1e-8, 'ipopt.acceptable_obj_change_tol': 1e-6}
+    cold_solver = ca.nlpsol('solver', 'ipopt', nlp, opts)
+    solver = ca.nlpsol('solver', 'ipopt', nlp, dict(opts, **WARM_START_OPTS))
+    lbx, ubx = make_bounds(N, [-0.6, -np.pi/4.0], [0.6, np.pi/4.0], [-2.0, -2.0, -np.inf], [2.0, 2.0, np.inf])
+    predictor = SensitivityPredictor(nlp, N, 3, 2, lbx, ubx)
+
+    print('warm start, full solve every tick, sigma {0}'.format(sigma))
+    print('{0:>10s} {1:>6s} {2:>9s} {3:>10s}'.format('guess', 'iter', 'solve ms', 'cost'))
+    for guess in ['shifted', 'predicted']:
+        iter_c, solve_t, _, _, _, cost = closed_loop(guess, 1, sigma)
+        print('{0:>10s} {1:6.2f} {2:9.2f} {3:10.3f}'.format(guess, iter_c.mean(), solve_t.mean()*1e3, cost))
+
+    print('\nfull solve every k ticks, predictor in between, sigma {0}'.format(sigma))
+    print('{0:>4s} {1:>10s} {2:>9s} {3:>10s} {4:>11s} {5:>11s} {6:>10s} {7:>10s}'.format(
+        'k', 'between', 'solve ms', 'update ms', 'predict ms', 'mean u err', 'max u err', 'cost'))
+    for k in [2, 5, 10]:
+        for open_loop in [False, True]:
+            _, solve_t, predict_t, t_update, u_err, cost = closed_loop('predicted', k, sigma, open_loop)
+            print('{0:4d} {1:>10s} {2:9.2f} {3:10.2f} {4:11.3f} {5:11.4f} {6:10.4f} {7:10.3f}'.format(
+                k, 'plan' if open_loop else 'predictor', solve_t.mean()*1e3, t_update*1e3,
+                predict_t.mean()*1e3, u_err.mean(), u_err.max(), cost))
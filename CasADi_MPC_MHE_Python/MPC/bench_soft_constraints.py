@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Hard and soft (slack) obstacle / state box constraints in the obstacle
+avoidance loop of sim_3, unicycle, N=100.
+
+scenarios : nominal (feasible), the robot starts inside the safety margin of
+            the obstacle, the robot starts outside of the +-2 m box
+failed    : ticks where IPOPT did not succeed (the last iterate is applied)
+iter      : mean and largest IPOPT iterations per tick
+slack     : largest slack of the first tick and the number of ticks that
+            use a slack
+cost      : closed-loop cost, clearance the smallest distance between the
+            robot and the obstacle surfaces along the closed loop (negative
+            inside the margin)
+"""
+
+import time
+
+import casadi as ca
+import numpy as np
+
+from ocp_builder import (build_mul_shooting_nlp, make_bounds, make_g_bounds, make_params, n_slacks, slack_usage,
+                         unicycle_model)
+
+
+def closed_loop(x0, soft, n_iter=60):
+    nlp = build_mul_shooting_nlp(f, N, T, obstacles=obstacles, soft=soft)
+    solver = ca.nlpsol('solver', 'ipopt', nlp, opts)
+    lbx, ubx = make_bounds(N, u_min, u_max, x_min, x_max, soft=soft, obstacles=obstacles)
+    lbg, ubg = make_g_bounds(f, N, obstacles, [min_dist], soft, x_min, x_max)
+    n_s = n_slacks(N, obstacles, soft)
+    x0 = np.asarray(x0, dtype=float).reshape(-1, 1)
+    plan = np.concatenate((np.tile([1.0, 2.0], N), np.zeros(3*(N+1)), np.zeros(n_s))).reshape(-1, 1)
+    cost = 0.0
+    clearance = np.linalg.norm(x0[:2].ravel()-obstacles[0]) - min_dist
+    iter_c, solve_t, slack_c = [], [], []
+    failed = 0
+    mpciter = 0
+    while np.linalg.norm(x0-xs) > 1e-2 and mpciter < n_iter:
+        t_ = time.time()
+        res = solver(x0=plan, p=make_params(x0, xs, Q, R), lbx=lbx, ubx=ubx, lbg=lbg, ubg=ubg)
+        solve_t.append(time.time() - t_)
+        stats = solver.stats()
+        iter_c.append(stats['iter_count'])
+        failed += not stats['success']
+        plan = res['x'].full()
+        slack_c.append(max(slack_usage(plan, N, 3, 2, obstacles, soft).values(), default=0.0))
+        u = plan[:2]
+        e = x0 - xs
+        cost += (e.T.dot(Q).dot(e) + u.T.dot(R).dot(u)).item()
+        x0 = x0 + T*f(x0, u).full()
+        clearance = min(clearance, np.linalg.norm(x0[:2].ravel()-obstacles[0]) - min_dist)
+        u_plan = plan[:2*N].reshape(N, 2)
+        x_plan = plan[2*N:2*N+3*(N+1)].reshape(N+1, 3)
+        plan = np.concatenate((np.concatenate((u_plan[1:], u_plan[-1:])).ravel(),
+                               np.concatenate((x_plan[1:], x_plan[-1:])).ravel(), np.zeros(n_s))).reshape(-1, 1)
+        mpciter = mpciter + 1
+    return mpciter, failed, np.mean(iter_c), np.max(iter_c), 1e3*np.mean(solve_t), slack_c[0], \
+        sum(s > 1e-6 for s in slack_c), cost, clearance
+
+
+if __name__ == '__main__':
+    T = 0.2
+    N = 100
+    f = unicycle_model()
+    Q = np.diag([1.0, 5.0, 0.1])
+    R = np.diag([0.5, 0.05])
+    xs = np.array([1.5, 1.5, 0.0]).reshape(-1, 1)
+    obstacles = [(0.5, 0.5)]
+    min_dist = 0.3/2. + 0.3/2.
+    u_min, u_max = [-0.6, -np.pi/4.0], [0.6, np.pi/4.0]
+    x_min, x_max = [-2.0, -2.0, -np.inf], [2.0, 2.0, np.inf]
+    opts = {'ipopt.max_iter': 100, 'ipopt.print_level': 0, 'print_time': 0,
+            'ipopt.acceptable_tol': 1e-8, 'ipopt.acceptable_obj_change_tol': 1e-6}
+    scenarios = [('nominal', [0.0, 0.0, 0.0]), ('in margin', [0.45, 0.4, 0.0]),
+                 ('out of box', [2.2, 0.0, np.pi])]
+
+    print('{0:>10s} {1:>20s} {2:>6s} {3:>7s} {4:>9s} {5:>9s} {6:>9s} {7:>11s} {8:>11s} {9:>10s} {10:>10s}'.format(
+        'scenario', 'soft', 'ticks', 'failed', 'mean iter', 'max iter', 'solve ms', 'first slack', 'slack ticks',
+        'cost', 'clearance'))
+    for name, x0 in scenarios:
+        for soft in [(), ('obstacles', 'states')]:
+            print('{0:>10s} {1:>20s} {2:6d} {3:7d} {4:9.2f} {5:9d} {6:9.2f} {7:11.4f} {8:11d} {9:10.3f} {10:10.3f}'.format(
+                name, ', '.join(soft) or 'hard', *closed_loop(x0, soft)))
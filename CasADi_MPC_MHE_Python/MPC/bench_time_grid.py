@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Uniform against non-uniform time grids for the same lookahead, unicycle
+point stabilization (sim_2) and forklift, closed loop with the primal-dual
+warm start shifted on the grid. The control period is always the first
+step, the grids grow geometrically from it (ocp_builder.make_time_grid).
+
+solve ms : mean IPOPT time per tick
+iter     : mean IPOPT iterations per tick
+cost     : closed loop cost sum x'Qx + u'Ru of the applied controls
+ticks    : ticks until |x - xs| < 1e-2 (or the tick limit)
+"""
+
+import time
+
+import casadi as ca
+import numpy as np
+
+from ocp_builder import build_mul_shooting_nlp, forklift_model, make_bounds, make_params, make_time_grid, \
+    unicycle_model
+from warm_start import WARM_START_OPTS, shift_primal_dual
+
+
+def closed_loop(f, N, dt, x0, xs, Q, R, limits, opts, n_iter):
+    n_states = f.size1_in(0)
+    n_controls = f.size1_in(1)
+    uniform = np.all(dt == dt[0])
+    nlp = build_mul_shooting_nlp(f, N, dt)
+    cold_solver = ca.nlpsol('solver', 'ipopt', nlp, opts)
+    solver = ca.nlpsol('solver', 'ipopt', nlp, dict(opts, **WARM_START_OPTS))
+    lbx, ubx = make_bounds(N, *limits)
+    x0 = np.array(x0, dtype=float).reshape(-1, 1)
+    xs = np.array(xs, dtype=float).reshape(-1, 1)
+    w0 = np.concatenate((np.zeros(N*n_controls), np.tile(x0.ravel(), N+1)))
+    lam_x0 = 0.0
+    lam_g0 = 0.0
+    cost = 0.0
+    index_t = []
+    iter_c = []
+    mpciter = 0
+    while np.linalg.norm(x0-xs) > 1e-2 and mpciter < n_iter:
+        c_p = make_params(x0, xs, Q, R)
+        tick_solver = cold_solver if mpciter == 0 else solver
+        t_ = time.time()
+        res = tick_solver(x0=w0, p=c_p, lbx=lbx, ubx=ubx, lbg=0.0, ubg=0.0, lam_x0=lam_x0, lam_g0=lam_g0)
+        index_t.append(time.time() - t_)
+        iter_c.append(tick_solver.stats()['iter_count'])
+        u = res['x'].full()[:n_controls]
+        e = x0 - xs
+        cost += (e.T.dot(Q).dot(e) + u.T.dot(R).dot(u)).item()
+        x0 = x0 + dt[0]*f(x0, u).full()
+        w0, lam_x0, lam_g0 = shift_primal_dual(res['x'], res['lam_x'], res['lam_g'], N, n_states, n_controls,
+                                               dt=None if uniform else dt)
+        mpciter = mpciter + 1
+    return np.mean(index_t[1:]), np.mean(iter_c[1:]), cost, mpciter
+
+
+if __name__ == '__main__':
+    T = 0.2
+    horizon = 20.0  # lookahead [s]
+    v_max = 0.6
+    omega_max = np.pi/4.0
+    opts = {'ipopt.max_iter': 100, 'ipopt.print_level': 0, 'print_time': 0,
+            'ipopt.acceptable_tol': 1e-8, 'ipopt.acceptable_obj_change_tol': 1e-6}
+    cases = [('unicycle', unicycle_model(), [0.0, 0.0, 0.0], [1.5, 1.5, 0.0],
+              np.diag([1.0, 5.0, 0.1]), np.diag([0.5, 0.05]), [-2.0, -2.0, -np.inf], [2.0, 2.0, np.inf], 100),
+             ('forklift', forklift_model(), [0.0, 0.0, 0.0, 0.0], [7.0, 7.0, 0.0, 0.0],
+              np.diag([5.0, 5.0, 2.0, 0.1]), np.diag([0.5, 0.4]),
+              [-16.0, -16.0, -np.pi, -np.pi/2.0], [7.01, 7.01, np.pi, np.pi/2.0], 100)]
+    grids = [('uniform', 100), ('uniform', 50), ('grid', 50), ('grid', 30), ('grid', 20)]
+
+    for name, f, x0, xs, Q, R, x_min, x_max, n_iter in cases:
+        limits = ([-v_max, -omega_max], [v_max, omega_max], x_min, x_max)
+        print('{0}, dt0 {1} s'.format(name, T))
+        print('{0:>8s} {1:>4s} {2:>11s} {3:>8s} {4:>9s} {5:>6s} {6:>10s} {7:>6s}'.format(
+            'grid', 'N', 'lookahead s', 'last dt', 'solve ms', 'iter', 'cost', 'ticks'))
+        for kind, N in grids:
+            dt = np.full(N, T) if kind == 'uniform' else make_time_grid(N, T, horizon)
+            t_solve, n_it, cost, ticks = closed_loop(f, N, dt, x0, xs, Q, R, limits, opts, n_iter)
+            print('{0:>8s} {1:4d} {2:11.1f} {3:8.2f} {4:9.2f} {5:6.2f} {6:10.3f} {7:6d}'.format(
+                kind, N, dt.sum(), dt[-1], t_solve*1e3, n_it, cost, ticks))
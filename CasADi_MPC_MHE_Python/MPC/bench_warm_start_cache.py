@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Nearest neighbour warm start cache for robots that repeat a few routes.
+Unicycle, N=100 multiple shooting, every episode starts at one of the route
+start points (with noise sigma in m / rad) and drives to the route goal.
+
+guess    : initial guess of the first tick of every episode (zero guess,
+           or the cache with the solution of the closest stored problem);
+           'every tick' also looks the cache up at every later tick instead
+           of using the shifted last solution
+iter     : IPOPT iterations of the first ticks / of the later ticks
+solve ms : mean solve time of the first ticks / of all ticks
+cache    : hit rate and mean lookup time
+"""
+
+import sys
+import time
+
+import casadi as ca
+import numpy as np
+
+from ocp_builder import build_mul_shooting_nlp, make_bounds, make_params, unicycle_model
+from warm_start import WARM_START_OPTS, shift_primal_dual
+from warm_start_cache import WarmStartCache
+
+
+def run_episodes(mode, n_episodes, sigma, capacity=256, seed=0, n_iter=60):
+    rng = np.random.RandomState(seed)
+    cache = WarmStartCache(3, capacity, scale=[1.0, 1.0, 0.5, 1.0, 1.0, 0.5], max_distance=0.5)
+    first_iter, later_iter, first_t, all_t = [], [], [], []
+    for _ in range(n_episodes):
+        start, goal = routes[rng.randint(len(routes))]
+        x0 = (np.asarray(start) + sigma*rng.randn(3)).reshape(-1, 1)
+        xs = np.asarray(goal, dtype=float).reshape(-1, 1)
+        res = None
+        mpciter = 0
+        while np.linalg.norm(x0-xs) > 1e-2 and mpciter < n_iter:
+            guess = None
+            if mode != 'cold' and (res is None or mode == 'every'):
+                guess = cache.lookup(x0, xs)
+            if guess is not None:
+                tick_solver = solver
+                w0, lam_x0, lam_g0 = guess
+            elif res is None:
+                tick_solver = cold_solver
+                w0, lam_x0, lam_g0 = np.concatenate((np.zeros(2*N), np.tile(x0.ravel(), N+1))), 0.0, 0.0
+            else:
+                tick_solver = solver
+                w0, lam_x0, lam_g0 = shift_primal_dual(res['x'], res['lam_x'], res['lam_g'], N, 3, 2)
+            t_ = time.time()
+            res = tick_solver(x0=w0, p=make_params(x0, xs, Q, R), lbx=lbx, ubx=ubx, lbg=0.0, ubg=0.0,
+                              lam_x0=lam_x0, lam_g0=lam_g0)
+            solve_t = time.time() - t_
+            iterations = tick_solver.stats()['iter_count']
+            if mode != 'cold' and (mpciter == 0 or mode == 'every'):
+                cache.record(iterations)
+            if mode != 'cold':
+                cache.store(x0, xs, res)
+            (first_iter if mpciter == 0 else later_iter).append(iterations)
+            if mpciter == 0:
+                first_t.append(solve_t)
+            all_t.append(solve_t)
+            u = res['x'].full()[:2]
+            x0 = x0 + T*f(x0, u).full()
+            mpciter = mpciter + 1
+    return np.mean(first_iter), np.mean(later_iter), np.mean(first_t), np.mean(all_t), cache
+
+
+if __name__ == '__main__':
+    sigma = float(sys.argv[1]) if len(sys.argv) > 1 else 0.05
+    n_episodes = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    T = 0.2
+    N = 100
+    f = unicycle_model()
+    Q = np.diag([1.0, 5.0, 0.1])
+    R = np.diag([0.5, 0.05])
+    routes = [([0.0, 0.0, 0.0], [1.5, 1.5, 0.0]), ([-1.5, 1.0, np.pi/2.0], [1.0, -1.0, 0.0]),
+              ([1.5, -1.5, np.pi], [-1.0, 1.5, np.pi/2.0]), ([-1.0, -1.5, 0.0], [0.0, 1.0, 0.0])]
+    nlp = build_mul_shooting_nlp(f, N, T)
+    opts = {'ipopt.max_iter': 100, 'ipopt.print_level': 0, 'print_time': 0,
+            'ipopt.acceptable_tol': 1e-8, 'ipopt.acceptable_obj_change_tol': 1e-6}
+    cold_solver = ca.nlpsol('solver', 'ipopt', nlp, opts)
+    solver = ca.nlpsol('solver', 'ipopt', nlp, dict(opts, **WARM_START_OPTS))
+    lbx, ubx = make_bounds(N, [-0.6, -np.pi/4.0], [0.6, np.pi/4.0], [-2.0, -2.0, -np.inf], [2.0, 2.0, np.inf])
+
+    print('{0} episodes over {1} routes, start noise sigma {2}'.format(n_episodes, len(routes), sigma))
+    print('{0:>11s} {1:>10s} {2:>10s} {3:>14s} {4:>12s} {5:>9s} {6:>10s} {7:>7s}'.format(
+        'guess', 'first iter', 'later iter', 'first solve ms', 'all solve ms', 'hit rate', 'lookup ms', 'size'))
+    for mode, name in [('cold', 'zero'), ('first', 'cache'), ('every', 'every tick')]:
+        it_first, it_later, t_first, t_all, cache = run_episodes(mode, n_episodes, sigma)
+        s = cache.stats()
+        print('{0:>11s} {1:10.2f} {2:10.2f} {3:14.2f} {4:12.2f} {5:8.0f}% {6:10.3f} {7:7d}'.format(
+            name, it_first, it_later, t_first*1e3, t_all*1e3, 100*s['hit_rate'], s['lookup_ms'], s['size']))
+        if mode != 'cold':
+            print('            ' + cache.report())
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Full and partial condensing of the stage-wise QPs of riccati_qp.py.
+
+The stages are grouped in blocks of block_size, the states inside a block are
+eliminated with the dynamics
+    x_{k0+i} = Phi_i x_{k0} + G_i U_b + d_i
+so every block is one stage of a shorter QP with the block input
+U_b = [u_k0, ..., u_{k1-1}]. The bounds of the eliminated states become
+general constraints on (x_{k0}, U_b).
+    block_size = 1 : the multiple shooting QP itself, sparse
+    block_size = N : full condensing, a dense QP in U only (single shooting)
+The condensed QP is handed to a ca.conic solver, qpoases (dense) for full
+condensing and osqp (sparse) otherwise. select_block_size times the candidates
+and returns the fastest one.
+"""
+
+import time
+
+import casadi as ca
+import numpy as np
+
+
+def condense_block(qp, k0, k1):
+    """ stages k0, ..., k1-1 of qp condensed into one stage with the input U_b """
+    A, B, c, Q, R, S, q, r = [qp[key] for key in ['A', 'B', 'c', 'Q', 'R', 'S', 'q', 'r']]
+    m = k1 - k0
+    n_states = A.shape[1]
+    n_controls = B.shape[2]
+    Phi = np.empty((m+1, n_states, n_states))
+    G = np.zeros((m+1, n_states, m*n_controls))
+    d = np.zeros((m+1, n_states))
+    Phi[0] = np.eye(n_states)
+    for i in range(m):
+        k = k0 + i
+        Phi[i+1] = A[k].dot(Phi[i])
+        G[i+1] = A[k].dot(G[i])
+        G[i+1][:, i*n_controls:(i+1)*n_controls] += B[k]
+        d[i+1] = A[k].dot(d[i]) + c[k]
+
+    # cost of the stages inside the block, u_i is the i-th slice of U_b
+    Phi_s, G_s, d_s = Phi[:m], G[:m], d[:m]
+    Q_s, R_s, S_s = Q[k0:k1], R[k0:k1], S[k0:k1]
+    # sums over the stages as tensordot, so they run in BLAS
+    QG = np.matmul(Q_s, G_s)
+    QPhi = np.matmul(Q_s, Phi_s)
+    SG = np.matmul(S_s, G_s).reshape(m*n_controls, m*n_controls)
+    R_diag = np.zeros((m, n_controls, m, n_controls))
+    R_diag[np.arange(m), :, np.arange(m), :] = R_s
+    lin_x = np.einsum('kij,kj->ki', Q_s, d_s) + q[k0:k1]
+    return {
+        'A': Phi[m], 'B': G[m], 'c': d[m],
+        'Q': np.tensordot(Phi_s, QPhi, ([0, 1], [0, 1])),
+        'S': np.tensordot(QG, Phi_s, ([0, 1], [0, 1])) + np.matmul(S_s, Phi_s).reshape(m*n_controls, -1),
+        'R': np.tensordot(G_s, QG, ([0, 1], [0, 1])) + SG + SG.T + R_diag.reshape(m*n_controls, m*n_controls),
+        'q': np.tensordot(Phi_s, lin_x, ([0, 1], [0, 1])),
+        'r': np.tensordot(G_s, lin_x, ([0, 1], [0, 1])) + (np.einsum('kuj,kj->ku', S_s, d_s) + r[k0:k1]).ravel(),
+        'Phi': Phi, 'G': G, 'd': d,
+    }
+
+
+class CondensedQP(object):
+    """
+    Solves the QPs of solve_ocp_qp (same arguments, same [U, X] layout of the
+    result) after condensing. The sparsity is fixed at construction, lbz / ubz
+    given here only decide which bounds are finite.
+    """
+
+    def __init__(self, N, n_states, n_controls, lbz, ubz, block_size=None, qp_plugin=None, qp_opts=None):
+        self.N = N
+        self.n_states = n_states
+        self.n_controls = n_controls
+        self.n_u = N*n_controls
+        self.block_size = N if block_size is None else max(1, min(int(block_size), N))
+        self.full = self.block_size == N
+        self.blocks = [(k0, min(k0+self.block_size, N)) for k0 in range(0, N, self.block_size)]
+        lb_x = np.asarray(lbz, dtype=float).ravel()[self.n_u:].reshape(N+1, n_states)
+        ub_x = np.asarray(ubz, dtype=float).ravel()[self.n_u:].reshape(N+1, n_states)
+        bounded = np.isfinite(lb_x) | np.isfinite(ub_x)
+        # states whose bounds turn into general constraints: all of them for full
+        # condensing, the ones inside the blocks otherwise
+        if self.full:
+            self.eliminated = [k for k in range(1, N+1) if bounded[k].any()]
+        else:
+            self.eliminated = [k for k0, k1 in self.blocks for k in range(k0+1, k1) if bounded[k].any()]
+        # block index and position inside the block of every eliminated state
+        self._eliminated_in = [(k // self.block_size, k % self.block_size) for k in self.eliminated]
+        if qp_plugin is None:
+            qp_plugin = 'qpoases' if self.full else 'osqp'
+        if qp_opts is None:
+            qp_opts = {'qpoases': {'printLevel': 'none'},
+                       'osqp': {'osqp': {'verbose': False, 'eps_abs': 1e-6, 'eps_rel': 1e-6}}}.get(qp_plugin, {})
+        self._build_pattern()
+        self.qp = ca.conic('condensed_qp', qp_plugin, {'h': self._h_sp, 'a': self._a_sp},
+                           dict({'print_time': 0, 'error_on_fail': False}, **qp_opts))
+
+    def _block_layout(self):
+        """ offsets of U_b and of the block states x_{k0} in the variables of the condensed QP """
+        n_s, n_c = self.n_states, self.n_controls
+        u_offset = [k0*n_c for k0, _ in self.blocks]
+        x_offset = [self.n_u + b*n_s for b in range(len(self.blocks)+1)]
+        return u_offset, x_offset
+
+    def _build_pattern(self):
+        n_s, n_c = self.n_states, self.n_controls
+        h_rows, h_cols, a_rows, a_cols = [], [], [], []
+
+        def dense_block(rows, cols, r0, c0, n_r, n_c_):
+            rr, cc = np.meshgrid(np.arange(r0, r0+n_r), np.arange(c0, c0+n_c_), indexing='ij')
+            rows.append(rr.ravel())
+            cols.append(cc.ravel())
+
+        if self.full:
+            self.n_var = self.n_u
+            dense_block(h_rows, h_cols, 0, 0, self.n_u, self.n_u)
+            n_con = 0
+            for k in self.eliminated:
+                dense_block(a_rows, a_cols, n_con, 0, n_s, self.n_u)
+                n_con += n_s
+        else:
+            u_offset, x_offset = self._block_layout()
+            self.n_var = self.n_u + (len(self.blocks)+1)*n_s
+            for b, (k0, k1) in enumerate(self.blocks):
+                n_ub = (k1-k0)*n_c
+                # [x_b; U_b] Hessian block
+                for r0, n_r in [(x_offset[b], n_s), (u_offset[b], n_ub)]:
+                    for c0, n_cc in [(x_offset[b], n_s), (u_offset[b], n_ub)]:
+                        dense_block(h_rows, h_cols, r0, c0, n_r, n_cc)
+            dense_block(h_rows, h_cols, x_offset[-1], x_offset[-1], n_s, n_s)
+            # x_0 = x0, then x_{b+1} - A_b x_b - B_b U_b = c_b
+            a_rows.append(np.arange(n_s))
+            a_cols.append(np.arange(x_offset[0], x_offset[0]+n_s))
+            n_con = n_s
+            for b, (k0, k1) in enumerate(self.blocks):
+                a_rows.append(np.arange(n_con, n_con+n_s))
+                a_cols.append(np.arange(x_offset[b+1], x_offset[b+1]+n_s))
+                dense_block(a_rows, a_cols, n_con, x_offset[b], n_s, n_s)
+                dense_block(a_rows, a_cols, n_con, u_offset[b], n_s, (k1-k0)*n_c)
+                n_con += n_s
+            for b, _ in self._eliminated_in:
+                dense_block(a_rows, a_cols, n_con, x_offset[b], n_s, n_s)
+                dense_block(a_rows, a_cols, n_con, u_offset[b], n_s, (self.blocks[b][1]-self.blocks[b][0])*n_c)
+                n_con += n_s
+        self.n_con = n_con
+        self._h_rows, self._h_cols = np.concatenate(h_rows), np.concatenate(h_cols)
+        self._h_sp, self._h_map = ca.Sparsity.triplet(self.n_var, self.n_var, self._h_rows.tolist(),
+                                                      self._h_cols.tolist(), False)
+        self._a_rows = np.concatenate(a_rows) if a_rows else np.zeros(0, dtype=int)
+        self._a_cols = np.concatenate(a_cols) if a_cols else np.zeros(0, dtype=int)
+        self._a_sp, self._a_map = ca.Sparsity.triplet(self.n_con, self.n_var, self._a_rows.tolist(),
+                                                      self._a_cols.tolist(), False)
+
+    def condense(self, qp, x0, lbz, ubz):
+        """ numerical data of the condensed QP as arguments of self.qp """
+        n_s, n_c = self.n_states, self.n_controls
+        lbz = np.asarray(lbz, dtype=float).ravel()
+        ubz = np.asarray(ubz, dtype=float).ravel()
+        lb_x = lbz[self.n_u:].reshape(self.N+1, n_s)
+        ub_x = ubz[self.n_u:].reshape(self.N+1, n_s)
+        x0 = np.ravel(x0)
+        Q_N, q_N = qp['Q'][self.N], qp['q'][self.N]
+        blocks = [condense_block(qp, k0, k1) for k0, k1 in self.blocks]
+        h_val, a_val, lba, uba = [], [], [], []
+
+        if self.full:
+            blk = blocks[0]
+            Phi, G, d = blk['Phi'], blk['G'], blk['d']
+            x_free = np.einsum('kij,j->ki', Phi, x0) + d
+            H = blk['R'] + G[-1].T.dot(Q_N).dot(G[-1])
+            grad = blk['r'] + blk['S'].dot(x0) + G[-1].T.dot(Q_N.dot(x_free[-1]) + q_N)
+            h_val.append(H.ravel())
+            for k in self.eliminated:
+                a_val.append(G[k].ravel())
+                lba.append(lb_x[k] - x_free[k])
+                uba.append(ub_x[k] - x_free[k])
+            lbx, ubx = lbz[:self.n_u], ubz[:self.n_u]
+            self._x_free = x_free
+        else:
+            u_offset, x_offset = self._block_layout()
+            grad = np.zeros(self.n_var)
+            for b, blk in enumerate(blocks):
+                h_val += [blk['Q'].ravel(), blk['S'].T.ravel(), blk['S'].ravel(), blk['R'].ravel()]
+                grad[x_offset[b]:x_offset[b]+n_s] = blk['q']
+                grad[u_offset[b]:u_offset[b]+blk['r'].size] = blk['r']
+            h_val.append(Q_N.ravel())
+            grad[x_offset[-1]:] = q_N
+            a_val.append(np.ones(n_s))
+            lba.append(x0)
+            uba.append(x0)
+            for blk in blocks:
+                a_val += [np.ones(n_s), -blk['A'].ravel(), -blk['B'].ravel()]
+                lba.append(blk['c'])
+                uba.append(blk['c'])
+            for k, (b, i) in zip(self.eliminated, self._eliminated_in):
+                a_val += [blocks[b]['Phi'][i].ravel(), blocks[b]['G'][i].ravel()]
+                lba.append(lb_x[k] - blocks[b]['d'][i])
+                uba.append(ub_x[k] - blocks[b]['d'][i])
+            k_states = [k0 for k0, _ in self.blocks] + [self.N]
+            lbx = np.concatenate((lbz[:self.n_u], lb_x[k_states].ravel()))
+            ubx = np.concatenate((ubz[:self.n_u], ub_x[k_states].ravel()))
+        self._blocks = blocks
+        h_val = np.concatenate(h_val)
+        a_val = np.concatenate(a_val) if a_val else np.zeros(0)
+        return {'h': ca.DM(self._h_sp, h_val[self._h_map]), 'g': grad,
+                'a': ca.DM(self._a_sp, a_val[self._a_map]),
+                'lba': np.concatenate(lba) if lba else np.zeros(0),
+                'uba': np.concatenate(uba) if uba else np.zeros(0), 'lbx': lbx, 'ubx': ubx}
+
+    def expand(self, sol):
+        """ z = [U, X] of the full horizon from the solution of the condensed QP """
+        n_s, n_c = self.n_states, self.n_controls
+        U = sol[:self.n_u]
+        if self.full:
+            X = self._x_free + np.einsum('kij,j->ki', self._blocks[0]['G'], U)
+        else:
+            _, x_offset = self._block_layout()
+            X = np.empty((self.N+1, n_s))
+            for b, ((k0, k1), blk) in enumerate(zip(self.blocks, self._blocks)):
+                x_b = sol[x_offset[b]:x_offset[b]+n_s]
+                X[k0:k1] = np.einsum('kij,j->ki', blk['Phi'][:-1], x_b) + \
+                    np.einsum('kij,j->ki', blk['G'][:-1], U[k0*n_c:k1*n_c]) + blk['d'][:-1]
+            X[self.N] = sol[x_offset[-1]:]
+        return np.concatenate((U, X.ravel()))
+
+    def solve(self, A, B, c, Q, R, S, q, r, x0, lbz, ubz, **kwargs):
+        """ same interface as solve_ocp_qp, returns z and a dict with success and the timings """
+        qp = {'A': A, 'B': B, 'c': c, 'Q': Q, 'R': R, 'S': S, 'q': q, 'r': r}
+        t_ = time.time()
+        args = self.condense(qp, x0, lbz, ubz)
+        t_condense = time.time() - t_
+        t_ = time.time()
+        res = self.qp(**args)
+        t_solve = time.time() - t_
+        z = self.expand(res['x'].full().ravel())
+        return z, {'success': self.qp.stats()['success'], 't_condense': t_condense, 't_solve': t_solve}
+
+
+def select_block_size(qp, x0, lbz, ubz, candidates=None, n_repeat=3, qp_plugin=None):
+    """
+    time condensing + solving for every candidate block size and return the
+    fastest one together with the median times {block_size: seconds}
+    """
+    N, n_states = qp['c'].shape
+    n_controls = qp['r'].shape[1]
+    if candidates is None:
+        candidates = sorted(set([1, 2, 5, 10, 20, 50, N]) & set(range(1, N+1)))
+    timings = {}
+    for block_size in candidates:
+        solver = CondensedQP(N, n_states, n_controls, lbz, ubz, block_size, qp_plugin)
+        times = []
+        for _ in range(n_repeat):
+            t_ = time.time()
+            solver.solve(x0=x0, lbz=lbz, ubz=ubz, **qp)
+            times.append(time.time() - t_)
+        timings[block_size] = float(np.median(times))
+    return min(timings, key=timings.get), timings
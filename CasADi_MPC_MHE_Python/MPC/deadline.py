@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Deadline bounded solves for the multiple shooting MPC loops.
+
+The time budget of a tick is enforced twice: ipopt.max_wall_time and an
+iteration callback that stops IPOPT as soon as the wall clock passes the
+budget. The callback also keeps the best feasible iterate it has seen. If
+IPOPT does not converge in time the tick falls back to
+    1. the best feasible iterate (lowest cost, constraint violation <= feas_tol)
+    2. the last plan shifted by one stage, as shift_movement does
+A loop has no previous plan at its first tick, so by default the first tick
+waits for IPOPT (the initial plan is computed before the robot starts).
+Every tick is recorded: solve time, deadline miss, overrun and where the
+returned plan comes from.
+"""
+
+import time
+
+import casadi as ca
+import numpy as np
+
+from warm_start import shift_blocks
+
+
+class DeadlineCallback(ca.Callback):
+    def __init__(self, name, n_x, n_g, feas_tol=1e-6, opts=None):
+        ca.Callback.__init__(self)
+        self.n_x = n_x
+        self.n_g = n_g
+        self.feas_tol = feas_tol
+        self.budget = np.inf
+        self.start_time = time.time()
+        self.best_x = None
+        self.best_f = np.inf
+        self.construct(name, dict(opts or {}))
+
+    def get_n_in(self):
+        return ca.nlpsol_n_out()
+
+    def get_n_out(self):
+        return 1
+
+    def get_name_in(self, i):
+        return ca.nlpsol_out(i)
+
+    def get_name_out(self, i):
+        return 'ret'
+
+    def get_sparsity_in(self, i):
+        name = ca.nlpsol_out(i)
+        if name == 'f':
+            return ca.Sparsity.scalar()
+        if name in ['x', 'lam_x']:
+            return ca.Sparsity.dense(self.n_x)
+        if name in ['g', 'lam_g']:
+            return ca.Sparsity.dense(self.n_g)
+        return ca.Sparsity(0, 0)
+
+    def start(self, budget, lbx, ubx, lbg, ubg):
+        self.budget = budget
+        self.lbx, self.ubx, self.lbg, self.ubg = lbx, ubx, lbg, ubg
+        self.best_x = None
+        self.best_f = np.inf
+        self.start_time = time.time()
+
+    def eval(self, arg):
+        f = float(arg[1])
+        if f < self.best_f:
+            x = arg[0].full().ravel()
+            g = arg[2].full().ravel()
+            violation = max(np.max(self.lbg-g, initial=0.0), np.max(g-self.ubg, initial=0.0),
+                            np.max(self.lbx-x, initial=0.0), np.max(x-self.ubx, initial=0.0))
+            if violation <= self.feas_tol:
+                self.best_x = x
+                self.best_f = f
+        # a non-zero return value stops IPOPT (User_Requested_Stop)
+        return [1 if time.time() - self.start_time > self.budget else 0]
+
+
+class DeadlineSolver(object):
+    """ ca.nlpsol with a per tick budget [s], called like the solver of the sim scripts """
+
+    def __init__(self, nlp, N, n_states, n_controls, budget, opts=None, feas_tol=1e-6, wait_first=True):
+        self.N = N
+        self.n_states = n_states
+        self.n_controls = n_controls
+        self.budget = budget
+        self.callback = DeadlineCallback('deadline_callback', nlp['x'].size1(), nlp['g'].size1(), feas_tol)
+        opts = dict(opts or {}, error_on_fail=False)
+        self.solver = ca.nlpsol('solver', 'ipopt', nlp, dict(opts, **{'iteration_callback': self.callback,
+                                                                      'ipopt.max_wall_time': budget}))
+        self.first_solver = ca.nlpsol('first_solver', 'ipopt', nlp, opts) if wait_first else None
+        self.plan = None
+        self.records = []
+
+    def shifted_plan(self):
+        n_u = self.N*self.n_controls
+        n_x = (self.N+1)*self.n_states
+        # slacks of soft constraints (after X) are kept
+        return np.concatenate((shift_blocks(self.plan[:n_u], self.N, self.n_controls),
+                               shift_blocks(self.plan[n_u:n_u+n_x], self.N+1, self.n_states), self.plan[n_u+n_x:]))
+
+    def __call__(self, x0, p, lbx, ubx, lbg, ubg):
+        """ returns the plan [U, X] as a column and the record of the tick """
+        n_x = self.callback.n_x
+        n_g = self.callback.n_g
+        self.callback.start(self.budget, np.broadcast_to(lbx, (n_x,)), np.broadcast_to(ubx, (n_x,)),
+                            np.broadcast_to(lbg, (n_g,)), np.broadcast_to(ubg, (n_g,)))
+        solver = self.first_solver if self.plan is None and self.first_solver is not None else self.solver
+        t_ = time.time()
+        res = solver(x0=x0, p=p, lbx=lbx, ubx=ubx, lbg=lbg, ubg=ubg)
+        solve_time = time.time() - t_
+        stats = solver.stats()
+        if stats['success']:
+            plan, source = res['x'].full(), 'solver'
+        elif self.callback.best_x is not None:
+            plan, source = self.callback.best_x.reshape(-1, 1), 'best_iterate'
+        elif self.plan is not None:
+            plan, source = self.shifted_plan(), 'shifted_plan'
+        else:
+            # nothing better at the first tick
+            plan, source = res['x'].full(), 'last_iterate'
+        self.plan = plan
+        record = {'time': solve_time, 'missed': solve_time > self.budget,
+                  'overrun': max(0.0, solve_time - self.budget), 'source': source,
+                  'status': stats['return_status'], 'iter': stats['iter_count']}
+        self.records.append(record)
+        return plan, record
+
+    def summary(self):
+        overrun = np.array([r['overrun'] for r in self.records if r['missed']])
+        sources = [r['source'] for r in self.records]
+        lines = ['ticks {0}, budget {1:.1f} ms, deadline misses {2}'.format(
+            len(self.records), self.budget*1e3, len(overrun))]
+        lines.append('plans: ' + ', '.join('{0} {1}'.format(s, sources.count(s)) for s in
+                                           ['solver', 'best_iterate', 'shifted_plan', 'last_iterate']))
+        if len(overrun):
+            lines.append('overrun ms: median {0:.2f}, p90 {1:.2f}, p99 {2:.2f}, max {3:.2f}'.format(
+                *(1e3*np.r_[np.percentile(overrun, [50, 90, 99]), overrun.max()])))
+        return '\n'.join(lines)
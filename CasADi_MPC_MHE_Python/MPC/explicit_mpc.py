@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Offline explicit (approximate) MPC for the fixed target point stabilization
+of sim_1_mpc_single_shooting.py.
+
+build_table samples initial states on a regular grid or as a Halton
+sequence inside a box, solves the OCP for every sample in a process pool and
+stores the first control, the whole control sequence and the predicted state
+trajectory in a compressed .npz file. The OCP is the one of sim_1 (same cost, control bounds and
+position limits); it is solved in the multiple shooting form, which has the
+same solution and is much faster to solve from a cold start. Every worker
+sweeps a contiguous chunk of samples and warm starts from its last solution.
+
+ExplicitMPC evaluates the table online:
+    grid   : multilinear interpolation in the cell of the state
+    halton : inverse distance weighting of the k nearest samples
+The result is flagged as not confident outside the box, when a sample of the
+cell / neighbourhood did not converge, or when the controls of the samples
+spread more than spread_tol (relative to the control range), e.g. across the
+switch between turning left and turning right. The caller then solves the
+OCP instead. For the grid the confidence of every cell is computed when the
+table is loaded and the interpolation of the first control is plain Python
+arithmetic, so one evaluation takes a few microseconds.
+
+    python explicit_mpc.py [n_x n_y n_theta]      grid table
+    python explicit_mpc.py halton [n_samples]     quasi-random table
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import casadi as ca
+import numpy as np
+
+from ocp_builder import build_mul_shooting_nlp, make_bounds, make_params, unicycle_model
+
+DEFAULT_TABLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'explicit_mpc_table.npz')
+
+
+def halton(n, dim):
+    """ first n points of the Halton sequence in [0, 1]^dim """
+    bases = [2, 3, 5, 7, 11, 13][:dim]
+    points = np.zeros((n, dim))
+    for j, b in enumerate(bases):
+        for i in range(n):
+            k, fraction, value = i+1, 1.0, 0.0
+            while k > 0:
+                fraction /= b
+                value += fraction*(k % b)
+                k //= b
+            points[i, j] = value
+    return points
+
+
+def _solve_chunk(args):
+    states, problem = args
+    N, T = problem['N'], problem['T']
+    f = unicycle_model()
+    opts = {'ipopt.max_iter': 200, 'ipopt.print_level': 0, 'print_time': 0,
+            'ipopt.acceptable_tol': 1e-8, 'ipopt.acceptable_obj_change_tol': 1e-6}
+    solver = ca.nlpsol('solver', 'ipopt', build_mul_shooting_nlp(f, N, T), opts)
+    lbx, ubx = make_bounds(N, problem['u_min'], problem['u_max'], problem['x_min'], problem['x_max'])
+    u = np.zeros((len(states), N, 2))
+    x = np.zeros((len(states), N+1, 3))
+    success = np.zeros(len(states), dtype=bool)
+    w0 = None
+    for i, x0 in enumerate(states):
+        if w0 is None:
+            w0 = np.concatenate((np.zeros(2*N), np.tile(x0, N+1)))
+        res = solver(x0=w0, p=make_params(x0, problem['xs'], problem['Q'], problem['R']),
+                     lbx=lbx, ubx=ubx, lbg=0.0, ubg=0.0)
+        success[i] = solver.stats()['success']
+        w = res['x'].full().ravel()
+        u[i] = w[:2*N].reshape(N, 2)
+        x[i] = w[2*N:].reshape(N+1, 3)
+        # a failed solve is a bad guess for the neighbour
+        w0 = w if success[i] else None
+    return u, x, success
+
+
+def build_table(lo, hi, shape=(9, 9, 9), n_samples=None, path=DEFAULT_TABLE, N=100, T=0.2,
+                xs=(1.5, 1.5, 0.0), Q=(1.0, 5.0, 0.1), R=(0.5, 0.05), v_max=0.6, omega_max=np.pi/4.0,
+                n_workers=None):
+    """ grid table with shape points per axis, or a Halton table with n_samples points """
+    lo = np.asarray(lo, dtype=float)
+    hi = np.asarray(hi, dtype=float)
+    if n_samples is None:
+        axes = [np.linspace(lo[i], hi[i], shape[i]) for i in range(3)]
+        states = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, 3)
+    else:
+        states = lo + (hi-lo)*halton(n_samples, 3)
+    # the position limits of sim_1 are |x|, |y| <= 2
+    problem = {'N': N, 'T': T, 'xs': np.asarray(xs, dtype=float), 'Q': np.asarray(Q), 'R': np.asarray(R),
+               'u_min': [-v_max, -omega_max], 'u_max': [v_max, omega_max],
+               'x_min': [-2.0, -2.0, -np.inf], 'x_max': [2.0, 2.0, np.inf]}
+    n_workers = n_workers or os.cpu_count() or 1
+    chunks = np.array_split(states, max(1, 4*n_workers))
+    t_ = time.time()
+    if n_workers == 1:
+        results = [_solve_chunk((chunk, problem)) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(n_workers) as pool:
+            results = list(pool.map(_solve_chunk, [(chunk, problem) for chunk in chunks]))
+    build_time = time.time() - t_
+    u = np.concatenate([r[0] for r in results])
+    x = np.concatenate([r[1] for r in results])
+    success = np.concatenate([r[2] for r in results])
+    np.savez_compressed(path, kind='grid' if n_samples is None else 'halton', lo=lo, hi=hi,
+                        shape=np.asarray(shape if n_samples is None else (len(states),)), states=states,
+                        u=u.astype(np.float32), x=x.astype(np.float32), success=success, xs=problem['xs'], N=N, T=T,
+                        u_range=np.subtract(problem['u_max'], problem['u_min']))
+    return len(states), int(success.sum()), build_time
+
+
+class ExplicitMPC(object):
+    def __init__(self, path=DEFAULT_TABLE, spread_tol=0.25, k=8, radius=None):
+        data = np.load(path)
+        self.kind = str(data['kind'])
+        self.lo = data['lo']
+        self.hi = data['hi']
+        self.states = data['states']
+        self.u = data['u'].astype(float)
+        self.u0 = self.u[:, 0, :].copy()
+        self.x = data['x'].astype(float)
+        self.success = data['success']
+        self.u_range = data['u_range']
+        self.N = int(data['N'])
+        self.spread_tol = spread_tol
+        if self.kind == 'grid':
+            self.shape = [int(n) for n in data['shape']]
+            self.step = (self.hi-self.lo)/(np.asarray(self.shape)-1)
+            n0, n1, n2 = self.shape
+            corners = np.array([[a, b, c] for a in (0, 1) for b in (0, 1) for c in (0, 1)])
+            self.corners = corners
+            self.offsets = (corners[:, 0]*n1 + corners[:, 1])*n2 + corners[:, 2]
+            # confidence per cell, the corners have to converge and agree
+            cells = np.stack(np.meshgrid(np.arange(n0-1), np.arange(n1-1), np.arange(n2-1), indexing='ij'), -1)
+            bases = (cells[..., 0]*n1 + cells[..., 1])*n2 + cells[..., 2]
+            idx = bases[..., None] + self.offsets
+            spread = np.ptp(self.u0[idx], axis=-2)
+            self.cell_ok = (np.all(self.success[idx], axis=-1) &
+                            np.all(spread <= spread_tol*self.u_range, axis=-1)).tolist()
+            # plain Python copies for the hot path
+            self.lo_list = self.lo.tolist()
+            self.inv_step = (1.0/self.step).tolist()
+            self.u0_list = self.u0.tolist()
+            self.corner_offsets = [(a, b, c, int(o)) for (a, b, c), o in zip(corners.tolist(), self.offsets)]
+        else:
+            self.k = k
+            # scale the axes by the box so that the distance is comparable per axis
+            self.scale = 1.0/(self.hi-self.lo)
+            self.scaled = self.states*self.scale
+            self.radius = radius if radius is not None else 2.0*len(self.states)**(-1.0/3.0)
+
+    def weights(self, x):
+        """ sample indices and interpolation weights for the state x, None outside the table """
+        x = np.ravel(x)
+        if self.kind == 'grid':
+            s = (x-self.lo)/self.step
+            if np.any(s < 0.0) or np.any(s > np.asarray(self.shape)-1):
+                return None
+            idx = np.minimum(s.astype(int), np.asarray(self.shape)-2)
+            frac = s - idx
+            w = np.prod(np.where(self.corners, frac, 1.0-frac), axis=1)
+            base = (idx[0]*self.shape[1] + idx[1])*self.shape[2] + idx[2]
+            return base + self.offsets, w
+        d = np.sqrt(np.sum((self.scaled - x*self.scale)**2, axis=1))
+        near = np.argpartition(d, self.k)[:self.k]
+        if d[near].min() > self.radius:
+            return None
+        w = 1.0/np.maximum(d[near], 1e-12)
+        return near, w/w.sum()
+
+    def __call__(self, x):
+        """ first control (n_controls,) and whether the table is confident at x """
+        if self.kind == 'grid':
+            return self._grid_control(np.ravel(x).tolist())
+        found = self.weights(x)
+        if found is None:
+            return None, False
+        idx, w = found
+        u = self.u0[idx]
+        ok = bool(np.all(self.success[idx])) and np.all(np.ptp(u, axis=0) <= self.spread_tol*self.u_range)
+        return w.dot(u), ok
+
+    def _grid_control(self, x):
+        n0, n1, n2 = self.shape
+        s = [(x[i]-self.lo_list[i])*self.inv_step[i] for i in range(3)]
+        if not (0.0 <= s[0] <= n0-1 and 0.0 <= s[1] <= n1-1 and 0.0 <= s[2] <= n2-1):
+            return None, False
+        i, j, k = min(int(s[0]), n0-2), min(int(s[1]), n1-2), min(int(s[2]), n2-2)
+        if not self.cell_ok[i][j][k]:
+            return None, False
+        frac = (s[0]-i, s[1]-j, s[2]-k)
+        base = (i*n1 + j)*n2 + k
+        u_0 = 0.0
+        u_1 = 0.0
+        for a, b, c, offset in self.corner_offsets:
+            w = (frac[0] if a else 1.0-frac[0])*(frac[1] if b else 1.0-frac[1])*(frac[2] if c else 1.0-frac[2])
+            row = self.u0_list[base+offset]
+            u_0 += w*row[0]
+            u_1 += w*row[1]
+        return np.array([u_0, u_1]), True
+
+    def plan(self, x):
+        """
+        interpolated control sequence (N, n_controls), e.g. as initial guess of the fallback solve,
+        None outside the table
+        """
+        found = self.weights(x)
+        if found is None:
+            return None
+        idx, w = found
+        return np.tensordot(w, self.u[idx], axes=1)
+
+    def trajectory(self, x):
+        """ interpolated state trajectory (N+1, n_states) of the plan, None outside the table """
+        found = self.weights(x)
+        if found is None:
+            return None
+        idx, w = found
+        return np.tensordot(w, self.x[idx], axes=1)
+
+
+if __name__ == '__main__':
+    lo = [-2.0, -2.0, -np.pi]
+    hi = [2.0, 2.0, np.pi]
+    if len(sys.argv) > 1 and sys.argv[1] == 'halton':
+        n, n_ok, t_build = build_table(lo, hi, n_samples=int(sys.argv[2]) if len(sys.argv) > 2 else 1000)
+    else:
+        shape = tuple(int(n) for n in sys.argv[1:4]) if len(sys.argv) > 3 else (9, 9, 9)
+        n, n_ok, t_build = build_table(lo, hi, shape)
+    print('{0} samples ({1} converged) solved in {2:.1f} s, table {3} ({4:.0f} kB)'.format(
+        n, n_ok, t_build, DEFAULT_TABLE, os.path.getsize(DEFAULT_TABLE)/1e3))
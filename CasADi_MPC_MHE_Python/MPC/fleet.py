@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+One MPC tick for a fleet of M robots that share the model and the OCP of
+sim_2_mpc_mul_shooting.py (an nlp of ocp_builder.build_mul_shooting_nlp,
+p = make_params per robot). n_obstacles, blocks, dt and degree describe its
+layout [U, X, Xc] like in warm_start.shift_primal_dual; soft constraints
+(slacks) are not supported.
+
+The parameters, initial guesses and multipliers of the robots are stacked
+as columns and solved by
+    'loop'    : one Python call of the solver per robot (reference)
+    'serial'  : solver.map(M), one call for the fleet
+    'thread'  : solver.map(M, 'thread', 1)
+    'process' : a pool of worker processes, every worker deserializes the
+                solver once and solves a contiguous chunk of robots (default)
+IPOPT's linear solvers (MUMPS and SPRAL alike) are not thread safe, the
+thread map segfaults with more than one worker, so 'thread' only accepts
+n_workers=1 and the worker processes are the parallel mode.
+A mapped solver has no per-robot stats, there a robot counts as failed when
+its constraint violation exceeds feas_tol, its iterations are unknown (-1)
+and its time is the batch time / M. 'loop' and 'process' report the IPOPT
+status, iterations and wall time of every robot.
+
+Every robot is warm started with its shifted primal-dual solution of the
+last tick (warm_start.shift_primal_dual) by the solver with the warm start
+options. A robot that failed, and every robot at the first tick, starts cold
+again from the cold guess with the solver without them; the mapped modes
+call one mapped solver per group. Calling the controller with the (M, n_p)
+parameters returns a dict of per-robot arrays: x (M, n_w), u0 (M,
+n_controls), f, success, violation, iterations and time.
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import casadi as ca
+import numpy as np
+
+from ocp_builder import n_blocks
+from warm_start import WARM_START_OPTS, shift_primal_dual
+
+_worker_solvers = None
+
+
+def _init_worker(serialized):
+    global _worker_solvers
+    _worker_solvers = [ca.Function.deserialize(s) for s in serialized]
+
+
+def _solve_loop(solvers, args):
+    """ robots of args one after another, args holds (n, M_chunk) columns and warm flags; per-robot stats """
+    warm, x0, p, lam_x0, lam_g0, lbx, ubx, lbg, ubg = args
+    n_robots = p.shape[1]
+    x, lam_x, lam_g, g = np.empty_like(x0), np.empty_like(x0), np.empty_like(lam_g0), np.empty_like(lam_g0)
+    f = np.empty(n_robots)
+    success = np.empty(n_robots, dtype=bool)
+    iterations = np.empty(n_robots, dtype=int)
+    solve_t = np.empty(n_robots)
+    for i in range(n_robots):
+        solver = solvers[1 if warm[i] else 0]
+        t_ = time.time()
+        res = solver(x0=x0[:, i], p=p[:, i], lam_x0=lam_x0[:, i], lam_g0=lam_g0[:, i], lbx=lbx, ubx=ubx, lbg=lbg,
+                     ubg=ubg)
+        solve_t[i] = time.time() - t_
+        stats = solver.stats()
+        x[:, i], lam_x[:, i], lam_g[:, i], g[:, i] = [res[k].full().ravel() for k in ['x', 'lam_x', 'lam_g', 'g']]
+        f[i] = float(res['f'])
+        success[i] = stats['success']
+        iterations[i] = stats['iter_count']
+    return x, lam_x, lam_g, g, f, success, iterations, solve_t
+
+
+def _solve_in_worker(args):
+    return _solve_loop(_worker_solvers, args)
+
+
+class FleetController(object):
+    def __init__(self, nlp, n_robots, N, n_states, n_controls, lbx, ubx, lbg=0.0, ubg=0.0, opts=None,
+                 parallelization='process', n_workers=None, warm_start=True, feas_tol=1e-6, n_obstacles=0,
+                 blocks=None, dt=None, degree=0):
+        self.n_robots = n_robots
+        self.N = N
+        self.n_states = n_states
+        self.n_controls = n_controls
+        self.n_obstacles = n_obstacles
+        self.blocks = blocks
+        self.dt = dt
+        self.degree = degree
+        self.n_w = nlp['x'].size1()
+        self.n_g = nlp['g'].size1()
+        self.n_u = n_blocks(N, blocks)*n_controls
+        n_w = self.n_u + (N+1)*n_states + N*degree*n_states
+        n_g = (N+1)*(n_states+n_obstacles) + N*degree*n_states
+        if (self.n_w, self.n_g) != (n_w, n_g):
+            raise ValueError('nlp has {0} variables and {1} constraints, the layout (n_obstacles={2}, blocks, '
+                             'degree={3}) gives {4} and {5}; soft constraints are not supported'.format(
+                                 self.n_w, self.n_g, n_obstacles, degree, n_w, n_g))
+        self.lbx = np.broadcast_to(np.asarray(lbx, dtype=float).ravel(), (self.n_w,)).copy()
+        self.ubx = np.broadcast_to(np.asarray(ubx, dtype=float).ravel(), (self.n_w,)).copy()
+        self.lbg = np.broadcast_to(np.asarray(lbg, dtype=float).ravel(), (self.n_g,)).copy()
+        self.ubg = np.broadcast_to(np.asarray(ubg, dtype=float).ravel(), (self.n_g,)).copy()
+        self.parallelization = parallelization
+        self.n_workers = n_workers or (1 if parallelization == 'thread' else os.cpu_count() or 1)
+        if parallelization == 'thread' and self.n_workers > 1:
+            raise ValueError('the thread map crashes inside IPOPT with more than one worker, '
+                             'use parallelization=\'process\'')
+        self.warm_start = warm_start
+        self.feas_tol = feas_tol
+        opts = dict(opts or {})
+        # the first tick has no multipliers, it is solved without the warm start options
+        self.solvers = [ca.nlpsol('fleet_cold', 'ipopt', nlp, opts),
+                        ca.nlpsol('fleet_warm', 'ipopt', nlp, dict(opts, **WARM_START_OPTS) if warm_start else opts)]
+        self.pool = None
+        self.mapped = {}  # (warm, number of robots) -> mapped solver
+        if parallelization == 'process':
+            self.pool = ProcessPoolExecutor(self.n_workers, initializer=_init_worker,
+                                            initargs=([s.serialize() for s in self.solvers],))
+        elif parallelization not in ('loop', 'serial', 'thread'):
+            raise ValueError('unknown parallelization {0}'.format(parallelization))
+        self.guess = None  # (x0, lam_x0, lam_g0) columns of all robots for the next tick
+        self.cold = np.ones(n_robots, dtype=bool)  # robots solved from the cold guess by the cold solver
+        self.records = []  # per tick: wall time, failed robots
+
+    def cold_guess(self, p):
+        """ zero controls and the initial state at every node and collocation point, no multipliers """
+        x0 = np.zeros((self.n_w, p.shape[1]))
+        x0[self.n_u:] = np.tile(p[:self.n_states], ((self.n_w-self.n_u)//self.n_states, 1))
+        return x0, np.zeros((self.n_w, p.shape[1])), np.zeros((self.n_g, p.shape[1]))
+
+    def violation(self, x, g):
+        """ largest bound and constraint violation per robot, inf for a non-finite solution """
+        lbx, ubx, lbg, ubg = [b[:, None] for b in [self.lbx, self.ubx, self.lbg, self.ubg]]
+        v = np.max(np.concatenate((lbx-x, x-ubx, lbg-g, g-ubg, np.zeros((1, x.shape[1])))), axis=0)
+        v[~(np.all(np.isfinite(x), axis=0) & np.all(np.isfinite(g), axis=0))] = np.inf
+        return v
+
+    def __call__(self, p):
+        """ p : (M, n_p) parameters of the robots, returns the per-robot result arrays """
+        t_ = time.time()
+        p = np.asarray(p, dtype=float).reshape(self.n_robots, -1).T
+        x0, lam_x0, lam_g0 = self.guess if self.guess is not None else self.cold_guess(p)
+        if np.any(self.cold):
+            cold = self.cold_guess(p)
+            for v, c in zip((x0, lam_x0, lam_g0), cold):
+                v[:, self.cold] = c[:, self.cold]
+        warm = ~self.cold
+        if self.parallelization in ('serial', 'thread'):
+            x, lam_x, lam_g, g = [np.empty_like(v) for v in (x0, lam_x0, lam_g0, lam_g0)]
+            f = np.empty(self.n_robots)
+            for use_warm in (False, True):
+                idx = np.flatnonzero(warm == use_warm)
+                if len(idx) == 0:
+                    continue
+                res = self._mapped(use_warm, len(idx))(x0=x0[:, idx], p=p[:, idx], lam_x0=lam_x0[:, idx],
+                                                        lam_g0=lam_g0[:, idx], lbx=self.lbx, ubx=self.ubx,
+                                                        lbg=self.lbg, ubg=self.ubg)
+                for v, k in zip((x, lam_x, lam_g, g), ['x', 'lam_x', 'lam_g', 'g']):
+                    v[:, idx] = res[k].full()
+                f[idx] = res['f'].full().ravel()
+            violation = self.violation(x, g)
+            success = violation <= self.feas_tol
+            iterations = np.full(self.n_robots, -1)
+            solve_t = np.full(self.n_robots, (time.time() - t_)/self.n_robots)
+        else:
+            args = (warm, x0, p, lam_x0, lam_g0, self.lbx, self.ubx, self.lbg, self.ubg)
+            if self.pool is None:
+                x, lam_x, lam_g, g, f, success, iterations, solve_t = _solve_loop(self.solvers, args)
+            else:
+                chunks = np.array_split(np.arange(self.n_robots), self.n_workers)
+                jobs = [(warm[c],) + tuple(a[:, c] if a.ndim == 2 else a for a in args[1:])
+                        for c in chunks if len(c)]
+                parts = list(self.pool.map(_solve_in_worker, jobs))
+                x, lam_x, lam_g, g, f, success, iterations, solve_t = [
+                    np.concatenate([part[k] for part in parts], axis=-1) for k in range(8)]
+            violation = self.violation(x, g)
+        self._shift(x, lam_x, lam_g, success)
+        self.records.append({'time': time.time() - t_, 'failed': int(np.sum(~success))})
+        return {'x': x.T, 'u0': x[:self.n_controls].T, 'f': f, 'success': success, 'violation': violation,
+                'iterations': iterations, 'time': solve_t}
+
+    def _mapped(self, warm, n):
+        key = (warm, n)
+        if key not in self.mapped:
+            solver = self.solvers[1 if warm else 0]
+            self.mapped[key] = solver.map(n, 'thread', 1) if self.parallelization == 'thread' else solver.map(n)
+        return self.mapped[key]
+
+    def _shift(self, x, lam_x, lam_g, success):
+        guess = [np.empty_like(x), np.empty_like(lam_x), np.empty_like(lam_g)]
+        for i in range(self.n_robots):
+            shifted = shift_primal_dual(x[:, i], lam_x[:, i], lam_g[:, i], self.N, self.n_states, self.n_controls,
+                                        n_obstacles=self.n_obstacles, blocks=self.blocks, dt=self.dt,
+                                        degree=self.degree)
+            for v, s in zip(guess, shifted):
+                v[:, i] = np.ravel(s)
+        self.guess = tuple(guess)
+        # the cold guess of a failed robot needs its next x0, it is filled in at the next call
+        self.cold = ~success
+
+    def summary(self):
+        t = 1e3*np.array([r['time'] for r in self.records])
+        return 'ticks {0}, {1} robots, mean tick {2:.2f} ms, {3:.1f} robots/s, failed solves {4}'.format(
+            len(t), self.n_robots, t.mean(), 1e3*self.n_robots/t.mean(), sum(r['failed'] for r in self.records))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Adaptive prediction horizon from a bank of prebuilt multiple shooting solvers.
+
+One IPOPT solver per horizon is built at start up, in worker processes when
+more than one CPU is available (the solvers come back serialized). At every
+tick the controller picks the shortest horizon that covers the remaining
+error at the largest rates of the states (with a margin), and steps up to a
+longer horizon when the cost of the last solve did not decrease by at least
+alpha times the stage cost of the applied control (the relaxed decrease
+condition of a stabilizing horizon without terminal cost, alpha in (0, 1]).
+A horizon that failed the decrease condition is not used again in the same
+run, this keeps the choice from flipping between two horizons. The shifted
+solution of the last tick is truncated or padded to the new horizon before
+it is used as initial guess.
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import casadi as ca
+import numpy as np
+
+from ocp_builder import build_mul_shooting_nlp, make_bounds, make_params
+from warm_start import WARM_START_OPTS, resize_primal_dual, shift_primal_dual
+
+
+def _build_solvers(args):
+    # the symbolic NLP of a horizon is built once and shared by the solvers of all option sets
+    f, N, T, opts_list = args
+    nlp = build_mul_shooting_nlp(f, N, T)
+    return [ca.nlpsol('solver_N{0}'.format(N), 'ipopt', nlp, opts) for opts in opts_list]
+
+
+def _build_serialized(args):
+    return [s.serialize() for s in _build_solvers(args)]
+
+
+def build_bank(f, T, horizons, opts_list, n_workers=None):
+    """
+    {N: [solver per option set of opts_list]}, built in n_workers processes (default: one per CPU)
+    """
+    n_workers = min(len(horizons), n_workers or os.cpu_count() or 1)
+    jobs = [(f, N, T, opts_list) for N in horizons]
+    if n_workers == 1:
+        return {N: _build_solvers(job) for N, job in zip(horizons, jobs)}
+    with ProcessPoolExecutor(n_workers) as pool:
+        return {N: [ca.Function.deserialize(s) for s in solvers]
+                for N, solvers in zip(horizons, pool.map(_build_serialized, jobs))}
+
+
+class HorizonBank(object):
+    def __init__(self, f, T, horizons, u_min, u_max, x_min, x_max, rates, opts=None, margin=1.5,
+                 alpha=0.5, warm_start=True, n_workers=None):
+        """
+        rates : largest rate of every state [unit/s], e.g. [v_max, v_max, omega_max] for the unicycle
+        """
+        self.f = f
+        self.T = T
+        self.horizons = sorted(horizons)
+        self.n_states = f.size1_in(0)
+        self.n_controls = f.size1_in(1)
+        self.rates = np.asarray(rates, dtype=float)
+        self.margin = margin
+        self.alpha = alpha
+        self.warm_start = warm_start
+        opts = dict(opts or {})
+        t_ = time.time()
+        opts_list = [opts, dict(opts, **WARM_START_OPTS)] if warm_start else [opts]
+        bank = build_bank(f, T, self.horizons, opts_list, n_workers)
+        self.cold_solvers = {N: solvers[0] for N, solvers in bank.items()}
+        self.solvers = {N: solvers[-1] for N, solvers in bank.items()}
+        self.build_time = time.time() - t_
+        self.bounds = {N: make_bounds(N, u_min, u_max, x_min, x_max) for N in self.horizons}
+        self.N = None
+        self.res = None
+        self.bound = np.inf  # cost the next solve should stay below
+        self.min_idx = 0  # shortest horizon still allowed
+        self.horizon_c = []  # horizon per tick
+
+    def select(self, x0, xs):
+        """ horizon for the next tick from the remaining error and the cost of the last solve """
+        steps = self.margin*np.max(np.abs(np.ravel(x0)-np.ravel(xs))/self.rates)/self.T
+        idx = min(np.searchsorted(self.horizons, steps), len(self.horizons)-1)
+        return self.horizons[max(idx, self.min_idx)]
+
+    def __call__(self, x0, xs, Q, R):
+        """ solve the tick for the state x0, returns u (N, n_controls) and x (N+1, n_states) """
+        c_p = make_params(x0, xs, Q, R)
+        N = self.select(x0, xs)
+        lbx, ubx = self.bounds[N]
+        if self.res is None:
+            x_init = np.concatenate((np.zeros(N*self.n_controls), np.tile(np.ravel(x0), N+1)))
+            res = self.cold_solvers[N](x0=x_init, p=c_p, lbx=lbx, ubx=ubx, lbg=0.0, ubg=0.0)
+        else:
+            x_init, lam_x0, lam_g0 = shift_primal_dual(self.res['x'], self.res['lam_x'], self.res['lam_g'],
+                                                       self.N, self.n_states, self.n_controls)
+            if N != self.N:
+                x_init, lam_x0, lam_g0 = resize_primal_dual(x_init, lam_x0, lam_g0, self.N, N,
+                                                            self.n_states, self.n_controls)
+            solver = self.solvers[N] if self.warm_start else self.cold_solvers[N]
+            res = solver(x0=x_init, p=c_p, lbx=lbx, ubx=ubx, lbg=0.0, ubg=0.0, lam_x0=lam_x0, lam_g0=lam_g0)
+        w = res['x'].full().ravel()
+        u = w[:N*self.n_controls].reshape(N, self.n_controls)
+        x = w[N*self.n_controls:].reshape(N+1, self.n_states)
+        cost = float(res['f'])
+        # the cost is only comparable between two solves with the same horizon
+        if N == self.N and cost > self.bound:
+            # no decrease along the closed loop, the horizon is too short
+            self.min_idx = min(self.horizons.index(N)+1, len(self.horizons)-1)
+        self.N = N
+        self.res = res
+        self.horizon_c.append(N)
+        e = np.ravel(x0) - np.ravel(xs)
+        self.bound = cost - self.alpha*(e.dot(np.asarray(Q).dot(e)) + u[0].dot(np.asarray(R).dot(u[0])))
+        return u, x
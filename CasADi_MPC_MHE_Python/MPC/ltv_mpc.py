@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Linear time-varying MPC for the tracking problem of
+sim_4_mpc_robot_tracking_mul_shooting.py.
+
+The robot stays close to the reference, so instead of the full NLP every
+tick solves the convex QP of the Euler dynamics linearized per stage
+    X_{k+1} = A_k X_k + B_k U_k + c_k,   c_k = F(xbar_k, ubar_k) - A_k xbar_k - B_k ubar_k
+with the tracking cost and the bounds of the NLP (same [U, X] layout). The
+linearization points (xbar_k, ubar_k) are the reference ('reference') or the
+shifted plan of the last tick ('shifted'). F and its Jacobians are one
+CasADi Function built once and mapped over the horizon, so a tick costs one
+call for all stages and one QP.
+
+After the QP its controls are simulated with the nonlinear model. If the
+largest distance between the QP prediction and that simulation exceeds
+threshold, or the QP fails, the linearization is not trusted and the tick is
+solved with the NLP solver instead, warm started with the QP plan (with the
+linearization points after a failed QP).
+"""
+
+import time
+
+import casadi as ca
+import numpy as np
+
+
+def linearization(f):
+    """ Function (x, u, dt) -> (F(x, u, dt), dF/dx, dF/du) of the explicit Euler step """
+    x = ca.SX.sym('x', f.size1_in(0))
+    u = ca.SX.sym('u', f.size1_in(1))
+    dt = ca.SX.sym('dt')
+    x_next = x + dt*f(x, u)
+    return ca.Function('linearize', [x, u, dt], [x_next, ca.jacobian(x_next, x), ca.jacobian(x_next, u)],
+                       ['x', 'u', 'dt'], ['x_next', 'A', 'B'])
+
+
+def simulation(f, dt):
+    """ Function (x0, U (n_controls, N)) -> X (n_states, N+1), explicit Euler on the grid dt """
+    x0 = ca.SX.sym('x0', f.size1_in(0))
+    U = ca.SX.sym('U', f.size1_in(1), len(dt))
+    X = [x0]
+    for k, dt_k in enumerate(dt):
+        X.append(X[-1] + dt_k*f(X[-1], U[:, k]))
+    return ca.Function('simulate', [x0, U], [ca.horzcat(*X)])
+
+
+class LTVController(object):
+    def __init__(self, f, N, dt, Q, R, lbx, ubx, nlp_solver=None, linearize='reference', threshold=0.05,
+                 qp_plugin='osqp', qp_opts=None):
+        if linearize not in ('reference', 'shifted'):
+            raise ValueError('unknown linearization point {0}'.format(linearize))
+        self.n_states = f.size1_in(0)
+        self.n_controls = f.size1_in(1)
+        self.N = N
+        self.dt = np.asarray(dt, dtype=float).ravel()
+        self.lbx = np.asarray(lbx, dtype=float).ravel()
+        self.ubx = np.asarray(ubx, dtype=float).ravel()
+        self.nlp_solver = nlp_solver
+        self.linearize = linearize
+        self.threshold = threshold
+        self.lin = linearization(f).map(N)
+        self.simulate = simulation(f, self.dt)
+        self.qp = self._build_qp(Q, R, qp_plugin, qp_opts)
+        self.records = []  # per tick: mode, linearization error, time
+
+    def _build_qp(self, Q, R, qp_plugin, qp_opts):
+        n_x, n_u, N = self.n_states, self.n_controls, self.N
+        U = ca.SX.sym('U', n_u, N)
+        X = ca.SX.sym('X', n_x, N+1)
+        A = ca.SX.sym('A', n_x, n_x*N)
+        B = ca.SX.sym('B', n_x, n_u*N)
+        c = ca.SX.sym('c', n_x, N)
+        U_ref = ca.SX.sym('U_ref', n_u, N)
+        X_ref = ca.SX.sym('X_ref', n_x, N+1)
+        # the cost of the sim_4 NLP
+        obj = 0
+        g = [X[:, 0]-X_ref[:, 0]]
+        for i in range(N):
+            state_error_ = X[:, i] - X_ref[:, i+1]
+            control_error_ = U[:, i] - U_ref[:, i]
+            obj = obj + self.dt[i]/self.dt[0]*(ca.mtimes([state_error_.T, Q, state_error_]) +
+                                               ca.mtimes([control_error_.T, R, control_error_]))
+            x_next_ = ca.mtimes(A[:, i*n_x:(i+1)*n_x], X[:, i]) + ca.mtimes(B[:, i*n_u:(i+1)*n_u], U[:, i]) + c[:, i]
+            g.append(X[:, i+1]-x_next_)
+        qp = {'x': ca.vertcat(ca.reshape(U, -1, 1), ca.reshape(X, -1, 1)), 'f': obj, 'g': ca.vertcat(*g),
+              'p': ca.vertcat(*[ca.reshape(M, -1, 1) for M in [A, B, c, U_ref, X_ref]])}
+        if qp_opts is None:
+            qp_opts = {'osqp': {'verbose': False, 'eps_abs': 1e-6, 'eps_rel': 1e-6, 'polish': True}} \
+                if qp_plugin == 'osqp' else {}
+        return ca.qpsol('ltv_qp', qp_plugin, qp, dict({'print_time': 0, 'error_on_fail': False}, **qp_opts))
+
+    def __call__(self, x0, x_ref, u_ref, x_guess=None, u_guess=None):
+        """
+        x0             : current state
+        x_ref, u_ref   : reference (N+1, n_states) and (N, n_controls), x_ref[k+1] is the target of stage k
+        x_guess, u_guess : shifted plan of the last tick, (N+1, n_states) and (N, n_controls)
+        returns the plan [U, X] as a column, like the NLP solution
+        """
+        t_ = time.time()
+        x_ref = np.array(x_ref, dtype=float)
+        x_ref[0] = np.ravel(x0)
+        u_ref = np.asarray(u_ref, dtype=float)
+        if self.linearize == 'shifted' and x_guess is not None:
+            x_bar, u_bar = np.asarray(x_guess, dtype=float)[:self.N], np.asarray(u_guess, dtype=float)
+        else:
+            x_bar, u_bar = x_ref[1:], u_ref
+        x_next, A, B = [M.full() for M in self.lin(x_bar.T, u_bar.T, self.dt)]
+        # the affine term of every stage, the mapped Jacobians are the blocks of A (n_states, N*n_states)
+        A_k = A.reshape(self.n_states, self.N, self.n_states)
+        B_k = B.reshape(self.n_states, self.N, self.n_controls)
+        c = x_next - np.einsum('ikj,kj->ik', A_k, x_bar) - np.einsum('ikj,kj->ik', B_k, u_bar)
+        p = np.concatenate((A.ravel('F'), B.ravel('F'), c.ravel('F'), u_ref.ravel(), x_ref.ravel()))
+        res = self.qp(p=p, lbx=self.lbx, ubx=self.ubx, lbg=0.0, ubg=0.0)
+        z = res['x'].full()
+        n_u = self.N*self.n_controls
+        x_qp = z[n_u:].reshape(self.N+1, self.n_states).T
+        x_sim = self.simulate(np.ravel(x0), z[:n_u].reshape(self.N, self.n_controls).T).full()
+        error = np.max(np.linalg.norm(x_qp - x_sim, axis=0))
+        mode = 'qp'
+        qp_success = self.qp.stats()['success']
+        if (error > self.threshold or not qp_success) and self.nlp_solver is not None:
+            if not qp_success:
+                # the iterate of a failed QP is no warm start, take the linearization points
+                z = np.concatenate((u_bar.ravel(), np.ravel(x0), x_bar[1:].ravel(), x_bar[-1])).reshape(-1, 1)
+            res = self.nlp_solver(x0=z, p=np.concatenate((u_ref.ravel(), x_ref.ravel())), lbx=self.lbx,
+                                  ubx=self.ubx, lbg=0.0, ubg=0.0)
+            z = res['x'].full()
+            mode = 'nlp'
+        self.records.append({'mode': mode, 'error': error, 'qp_success': qp_success, 'time': time.time() - t_})
+        return z
+
+    def summary(self):
+        lines = ['ticks {0}'.format(len(self.records))]
+        for mode in ['qp', 'nlp']:
+            ticks = [r for r in self.records if r['mode'] == mode]
+            if ticks:
+                lines.append('{0:>4s}: {1:4d} ticks, mean {2:.2f} ms, max {3:.2f} ms'.format(
+                    mode, len(ticks), 1e3*np.mean([r['time'] for r in ticks]),
+                    1e3*np.max([r['time'] for r in ticks])))
+        lines.append('failed QPs: {0}'.format(sum(not r['qp_success'] for r in self.records)))
+        lines.append('linearization error: mean {0:.2e}, max {1:.2e}'.format(
+            np.mean([r['error'] for r in self.records]), np.max([r['error'] for r in self.records])))
+        return '\n'.join(lines)
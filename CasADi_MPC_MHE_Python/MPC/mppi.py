@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Model Predictive Path Integral (MPPI) controller, a sampling based
+alternative to IPOPT for the obstacle avoidance loop of
+sim_3_mpc_obs_avoid_mul.py that needs no gradients.
+
+Every iteration samples K control sequences around the nominal plan (the
+shifted plan of the last tick), u = clip(u_nominal + eps, u_min, u_max) with
+eps ~ N(0, sigma^2), and rolls them out with rollout.Rollout. Every rollout
+is scored with the cost of build_mul_shooting_nlp,
+    sum_k (x_k - xs)' Q (x_k - xs) + u_k' R u_k,
+plus penalty times the violations of the obstacle distances and of the
+state box (hinge, no slack variables). The new plan is the average of the
+samples weighted with exp(-(cost - min cost)/temperature); the nominal plan
+itself is always one of the samples.
+
+The compute per tick is fixed: n_iterations iterations of n_samples
+rollouts. With a budget [s] the iterations stop early once it is spent,
+after at least one. The samples of an iteration are split into n_workers
+chunks that run
+    'serial'  : one after the other (reference, and for a single CPU)
+    'thread'  : in a thread pool, NumPy releases the GIL for the batch operations
+    'process' : in a pool of worker processes that build their sampler once
+Every chunk returns its lowest cost, its sum of weights and its weighted sum
+of controls only, so the chunks are combined without sending the samples
+back.
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from rollout import MODELS, Rollout
+
+_worker_sampler = None
+
+
+def _init_worker(config):
+    global _worker_sampler
+    _worker_sampler = Sampler(**config)
+
+
+def _sample_in_worker(job):
+    return _worker_sampler(*job)
+
+
+class Sampler(object):
+    """ rollouts and costs of one chunk of samples """
+
+    def __init__(self, model, N, T, n_samples, Q, R, u_min, u_max, sigma, temperature, obstacles=(),
+                 min_distance=(), x_min=None, x_max=None, penalty=1e3, integrator='euler'):
+        self.n_states, self.n_controls = MODELS[model]
+        self.N = N
+        self.n_samples = n_samples
+        self.rollout = Rollout(model, N, T, n_samples, integrator)
+        self.q = np.diag(Q) if np.ndim(Q) == 2 else np.asarray(Q, dtype=float)
+        self.r = np.diag(R) if np.ndim(R) == 2 else np.asarray(R, dtype=float)
+        self.u_min = np.asarray(u_min, dtype=float)
+        self.u_max = np.asarray(u_max, dtype=float)
+        self.sigma = np.asarray(sigma, dtype=float)
+        self.temperature = temperature
+        self.obstacles = np.reshape(np.asarray(obstacles, dtype=float), (-1, 2))
+        self.min_distance = np.broadcast_to(np.asarray(min_distance, dtype=float), (len(self.obstacles),))
+        self.x_min = np.full(self.n_states, -np.inf) if x_min is None else np.asarray(x_min, dtype=float)
+        self.x_max = np.full(self.n_states, np.inf) if x_max is None else np.asarray(x_max, dtype=float)
+        self.penalty = penalty
+
+    def cost(self, states, u):
+        """ states (N+1, n_states, K), u (N, n_controls, K), both stage major -> (K,) """
+        cost = np.zeros(states.shape[2])
+        for i in range(self.n_states):
+            if self.q[i] != 0.0:
+                error = states[:self.N, i] - self.xs[i]
+                cost += self.q[i]*np.einsum('nk,nk->k', error, error)
+        for i in range(self.n_controls):
+            cost += self.r[i]*np.einsum('nk,nk->k', u[:, i], u[:, i])
+        for (obs_x, obs_y), min_distance in zip(self.obstacles, self.min_distance):
+            distance = np.hypot(states[:, 0] - obs_x, states[:, 1] - obs_y)
+            cost += self.penalty*np.maximum(min_distance - distance, 0.0).sum(axis=0)
+        for i in np.flatnonzero(np.isfinite(self.x_min) | np.isfinite(self.x_max)):
+            violation = np.maximum(self.x_min[i] - states[:, i], 0.0) + np.maximum(states[:, i] - self.x_max[i], 0.0)
+            cost += self.penalty*violation.sum(axis=0)
+        return cost
+
+    def __call__(self, x0, xs, u_nominal, n, seed, keep_nominal=False):
+        """ (lowest cost, sum of weights, weighted sum of controls) of n samples, weights relative to the lowest cost """
+        self.xs = np.ravel(xs)
+        rng = np.random.default_rng(seed)
+        # stage major samples (N, n_controls, n), the layout of the rollout buffers
+        u = rng.standard_normal((self.N, self.n_controls, n))
+        u *= self.sigma[:, None]
+        u += u_nominal[:, :, None]
+        if keep_nominal:
+            u[:, :, 0] = u_nominal
+        np.clip(u, self.u_min[:, None], self.u_max[:, None], out=u)
+        self.rollout(np.ravel(x0), u.transpose(2, 0, 1))
+        cost = self.cost(self.rollout.states[:, :, :n], u)
+        min_cost = cost.min()
+        weights = np.exp(-(cost - min_cost)/self.temperature)
+        return min_cost, weights.sum(), np.dot(u, weights)
+
+
+class MPPI(object):
+    def __init__(self, model, N, T, Q, R, u_min, u_max, sigma=(0.2, 0.4), temperature=1.0, obstacles=(),
+                 min_distance=(), x_min=None, x_max=None, penalty=1e3, n_samples=1000, n_iterations=1,
+                 budget=None, executor='serial', n_workers=None, integrator='euler', seed=0):
+        self.N = N
+        self.n_states, self.n_controls = MODELS[model]
+        self.n_samples = n_samples
+        self.temperature = temperature
+        self.n_iterations = n_iterations
+        self.budget = budget
+        self.executor = executor
+        self.n_workers = n_workers or (1 if executor == 'serial' else os.cpu_count() or 1)
+        # samples per chunk, the first chunk also carries the nominal plan
+        self.chunks = [len(c) for c in np.array_split(np.arange(n_samples), self.n_workers)]
+        config = dict(model=model, N=N, T=T, n_samples=max(self.chunks), Q=Q, R=R, u_min=u_min, u_max=u_max,
+                      sigma=sigma, temperature=temperature, obstacles=obstacles, min_distance=min_distance,
+                      x_min=x_min, x_max=x_max, penalty=penalty, integrator=integrator)
+        if executor == 'serial':
+            self.samplers = [Sampler(**config)]
+            self.pool = None
+        elif executor == 'thread':
+            self.samplers = [Sampler(**config) for _ in self.chunks]
+            self.pool = ThreadPoolExecutor(self.n_workers)
+        elif executor == 'process':
+            self.samplers = []
+            self.pool = ProcessPoolExecutor(self.n_workers, initializer=_init_worker, initargs=(config,))
+        else:
+            raise ValueError('unknown executor {0}'.format(executor))
+        self.plan_rollout = Rollout(model, N, T, 1, integrator)
+        self.seed = seed
+        self.n_calls = 0
+        self.records = []  # per tick: time, iterations, lowest sampled cost
+
+    def __call__(self, x0, xs, u_nominal=None):
+        """
+        x0, xs    : current and target state
+        u_nominal : (N, n_controls) plan to sample around, e.g. the shifted last plan, default zeros
+        returns the new plan (N, n_controls) and its predicted states (N+1, n_states)
+        """
+        t_ = time.time()
+        u = np.zeros((self.N, self.n_controls)) if u_nominal is None else np.array(u_nominal, dtype=float)
+        n_done = 0
+        for iteration in range(self.n_iterations):
+            if n_done > 0 and self.budget is not None and time.time() - t_ > self.budget:
+                break
+            seeds = [(self.seed, self.n_calls, iteration, j) for j in range(len(self.chunks))]
+            jobs = [(x0, xs, u, n, seed, j == 0) for j, (n, seed) in enumerate(zip(self.chunks, seeds))]
+            if self.executor == 'serial':
+                results = [self.samplers[0](*job) for job in jobs]
+            elif self.executor == 'thread':
+                results = list(self.pool.map(lambda s_job: s_job[0](*s_job[1]), zip(self.samplers, jobs)))
+            else:
+                results = list(self.pool.map(_sample_in_worker, jobs))
+            # chunk weights are relative to the chunk minimum, rescale them to the overall minimum
+            min_cost = min(r[0] for r in results)
+            scale = [np.exp(-(r[0] - min_cost)/self.temperature) for r in results]
+            u = sum(s*r[2] for s, r in zip(scale, results))/sum(s*r[1] for s, r in zip(scale, results))
+            n_done += 1
+        x = self.plan_rollout(np.ravel(x0), u[None])[0].copy()
+        self.n_calls += 1
+        self.records.append({'time': time.time() - t_, 'iterations': n_done, 'min_cost': min_cost})
+        return u, x
+
+    def summary(self):
+        t = 1e3*np.array([r['time'] for r in self.records])
+        return 'ticks {0}, mean tick {1:.2f} ms, max {2:.2f} ms, mean iterations {3:.2f}'.format(
+            len(t), t.mean(), t.max(), np.mean([r['iterations'] for r in self.records]))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Multi-start solves for the non-convex obstacle avoidance OCP of
+sim_3_mpc_obs_avoid_mul.py.
+
+Depending on which side of an obstacle the initial guess passes, IPOPT ends
+in a different local minimum or needs many iterations. MultiStartSolver
+solves the same tick from several initial guesses, e.g. the shifted plan of
+the last tick and the detours left and right of the obstacle built by
+detour_guess, and keeps the feasible result with the lowest cost. The starts
+run concurrently:
+    'thread'  : one solver per start in a thread pool
+    'process' : a pool of worker processes, every worker deserializes the
+                solver once
+    'serial'  : one after the other (reference, and for a single CPU)
+With a budget [s] every solver gets ipopt.max_wall_time and the tick only
+waits for the starts that finish in time. A start that is not back keeps its
+solver (thread) or worker (process) busy; the next tick only submits to the
+free ones and records the other starts as 'solver_busy', in guess order. Every
+start is recorded with its solve time, iterations, return status, cost and
+constraint violation.
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import casadi as ca
+import numpy as np
+
+_worker_solver = None
+
+
+def _init_worker(serialized):
+    global _worker_solver
+    _worker_solver = ca.Function.deserialize(serialized)
+
+
+def _solve(solver, name, args):
+    t_ = time.time()
+    res = solver(**args)
+    stats = solver.stats()
+    return {'name': name, 'x': res['x'].full().ravel(), 'f': float(res['f']), 'g': res['g'].full().ravel(),
+            'time': time.time() - t_, 'iter': stats['iter_count'], 'status': stats['return_status'],
+            'success': stats['success']}
+
+
+def _solve_in_worker(job):
+    name, args = job
+    return _solve(_worker_solver, name, args)
+
+
+def detour_guess(x0, xs, obstacle, clearance, side, N, T, v_max, n_states=3):
+    """
+    initial guess [U, X] along the polyline x0 -> waypoint -> xs, the waypoint lies
+    clearance beside the obstacle center, on the left (side=1) or right (side=-1)
+    of the straight line from x0 to xs; the heading follows the path
+    """
+    start = np.ravel(x0)[:2]
+    goal = np.ravel(xs)[:2]
+    center = np.asarray(obstacle, dtype=float)[:2]
+    direction = goal - start
+    length = np.linalg.norm(direction)
+    direction = direction/length if length > 1e-9 else np.array([1.0, 0.0])
+    normal = np.array([-direction[1], direction[0]])
+    along = np.clip(np.dot(center-start, direction), 0.0, length)
+    waypoint = start + along*direction + (np.dot(center-start, normal) + side*clearance)*normal
+    path = np.array([start, waypoint, goal])
+    segment = np.linalg.norm(np.diff(path, axis=0), axis=1)
+    s_path = np.concatenate(([0.0], np.cumsum(segment)))
+    # drive at the largest speed and stay at the goal once it is reached
+    s = np.minimum(v_max*T*np.arange(N+1), s_path[-1])
+    positions = np.stack([np.interp(s, s_path, path[:, i]) for i in range(2)], axis=1)
+    steps = np.diff(positions, axis=0)
+    heading = np.arctan2(steps[:, 1], steps[:, 0])
+    moving = np.linalg.norm(steps, axis=1) > 1e-9
+    theta = np.empty(N+1)
+    theta[0] = np.ravel(x0)[2]
+    for k in range(N):
+        target = heading[k] if moving[k] else np.ravel(xs)[2]
+        # continuous heading, no jumps of 2 pi between stages
+        theta[k+1] = theta[k] + np.arctan2(np.sin(target-theta[k]), np.cos(target-theta[k]))
+    states = np.zeros((N+1, n_states))
+    states[:, :2] = positions
+    states[:, 2] = theta
+    states[0] = np.ravel(x0)
+    controls = np.stack((np.linalg.norm(steps, axis=1)/T, np.diff(theta)/T), axis=1)
+    return np.concatenate((controls.ravel(), states.ravel())).reshape(-1, 1)
+
+
+class MultiStartSolver(object):
+    def __init__(self, nlp, opts=None, n_starts=3, executor='thread', budget=None, feas_tol=1e-6, n_workers=None):
+        self.budget = budget
+        self.feas_tol = feas_tol
+        self.executor = executor
+        opts = dict(opts or {})
+        if budget is not None:
+            opts['ipopt.max_wall_time'] = budget
+        self.solvers = [ca.nlpsol('solver_{0}'.format(i), 'ipopt', nlp, opts)
+                        for i in range(n_starts if executor == 'thread' else 1)]
+        n_workers = n_workers or min(n_starts, os.cpu_count() or 1)
+        # futures of the last submitted starts, per solver (thread) or per worker slot (process)
+        self.running = [None]*(n_starts if executor == 'thread' else n_workers)
+        if executor == 'thread':
+            self.pool = ThreadPoolExecutor(n_starts)
+        elif executor == 'process':
+            self.pool = ProcessPoolExecutor(n_workers, initializer=_init_worker,
+                                            initargs=(self.solvers[0].serialize(),))
+        elif executor == 'serial':
+            self.pool = None
+        else:
+            raise ValueError('unknown executor {0}'.format(executor))
+        self.records = []  # per tick, the list of start records
+
+    def violation(self, r, lbx, ubx, lbg, ubg):
+        x, g = r['x'], r['g']
+        return max(np.max(np.ravel(lbg)-g, initial=0.0), np.max(g-np.ravel(ubg), initial=0.0),
+                   np.max(np.ravel(lbx)-x, initial=0.0), np.max(x-np.ravel(ubx), initial=0.0))
+
+    def __call__(self, guesses, p, lbx, ubx, lbg, ubg):
+        """
+        guesses : {name: initial guess [U, X]}
+        returns the plan of the best start as a column and the records of the starts
+        """
+        jobs = [(name, {'x0': guess, 'p': p, 'lbx': lbx, 'ubx': ubx, 'lbg': lbg, 'ubg': ubg})
+                for name, guess in guesses.items()]
+        if self.executor == 'thread' and len(jobs) > len(self.solvers):
+            raise ValueError('{0} guesses for {1} solvers, raise n_starts'.format(len(jobs), len(self.solvers)))
+        t_ = time.time()
+        if self.pool is None:
+            results = []
+            for name, args in jobs:
+                if self.budget is not None and results and time.time() - t_ > self.budget:
+                    break
+                results.append(_solve(self.solvers[0], name, args))
+        else:
+            free = self._free_slots()
+            futures = []
+            for slot, (name, args) in zip(free, jobs):
+                if self.executor == 'thread':
+                    future = self.pool.submit(_solve, self.solvers[slot], name, args)
+                else:
+                    future = self.pool.submit(_solve_in_worker, (name, args))
+                self.running[slot] = future
+                futures.append(future)
+            # a start that is not back in time is ignored, max_wall_time ends it soon after
+            done, _ = wait(futures, timeout=self.budget)
+            if not done:
+                done, _ = wait(futures, return_when='FIRST_COMPLETED')
+            results = [future.result() for future in futures if future in done]
+        tick_time = time.time() - t_
+        for r in results:
+            r['violation'] = self.violation(r, lbx, ubx, lbg, ubg)
+            r['feasible'] = r['success'] or r['violation'] <= self.feas_tol
+        feasible = [r for r in results if r['feasible']]
+        # nothing feasible: the start that is closest to feasible
+        best = min(feasible, key=lambda r: r['f']) if feasible else min(results, key=lambda r: r['violation'])
+        records = [{k: r[k] for k in ['name', 'time', 'iter', 'status', 'f', 'violation', 'feasible']}
+                   for r in results]
+        for i, (name, _) in enumerate(jobs):
+            if name not in [r['name'] for r in results]:
+                status = 'not_back_in_time' if self.pool is None or i < len(futures) else 'solver_busy'
+                records.append({'name': name, 'status': status, 'feasible': False})
+        for record in records:
+            record['best'] = record['name'] == best['name']
+        self.records.append({'time': tick_time, 'starts': records})
+        return best['x'].reshape(-1, 1), records
+
+    def _free_slots(self):
+        """ slots whose last start is back, waits for the first one when all are busy """
+        busy = [future for future in self.running if future is not None and not future.done()]
+        if len(busy) == len(self.running):
+            wait(busy, return_when='FIRST_COMPLETED')
+        return [i for i, future in enumerate(self.running) if future is None or future.done()]
+
+    def summary(self):
+        names = []
+        for tick in self.records:
+            names += [r['name'] for r in tick['starts'] if r['name'] not in names]
+        lines = ['ticks {0}, mean tick {1:.2f} ms'.format(len(self.records),
+                                                         1e3*np.mean([t['time'] for t in self.records]))]
+        for name in names:
+            starts = [r for t in self.records for r in t['starts'] if r['name'] == name]
+            solved = [r for r in starts if 'iter' in r]
+            lines.append('{0:>10s}: best {1:3d}, feasible {2:3d}/{3}, mean iter {4:6.2f}, mean {5:6.2f} ms'.format(
+                name, sum(r['best'] for r in starts), sum(r['feasible'] for r in starts), len(starts),
+                np.mean([r['iter'] for r in solved]) if solved else np.nan,
+                1e3*np.mean([r['time'] for r in solved]) if solved else np.nan))
+        return '\n'.join(lines)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
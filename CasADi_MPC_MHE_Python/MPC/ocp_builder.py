@@ -0,0 +1,410 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Builders for the multiple shooting point stabilization OCP.
+
+The weights are NLP parameters and the box constraints are plain lbx / ubx
+vectors, so one built (or compiled) solver serves every tuning and every
+robot limit. Parameter layout:
+    p = [x0 (n_states), xs (n_states), diag(Q) (n_states), diag(R) (n_controls)]
+Decision variable layout (same as the sim_2 scripts):
+    x = [u_0, ..., u_{N-1}, x_0, ..., x_N]
+Constraint layout:
+    g = [x_0 - x0, defect_0, ..., defect_{N-1}, distance to obstacle 1 (N+1), ...]
+
+With blocks (a list of block lengths that sums to N) the controls are held
+constant over each block (move blocking), U then has len(blocks) columns
+instead of N and the layout becomes x = [u_block_0, ..., u_block_M-1, X].
+
+T is the step length, or a vector of N step lengths for a non-uniform time
+grid (fine near the present, coarse far out, see make_time_grid). On a
+non-uniform grid every stage cost is weighted with dt_k / dt_0, so the cost
+stays an approximation of the same integral and the uniform case is
+unchanged.
+
+soft lists the constraint groups that become soft constraints:
+    'obstacles' : distance to obstacle + s >= min distance
+    'states'    : x_min <= X + s and X - s <= x_max for the components soft_states
+                  (the box of these components moves from lbx / ubx to g)
+The slacks s >= 0 are appended to x = [U, X, S] and enter the cost with
+penalty[0]*sum(s) + penalty[1]*sum(s^2). The L1 term is an exact penalty:
+with a weight larger than the multipliers of the hard problem the solution
+stays the same whenever the hard problem is feasible, and otherwise IPOPT
+returns the plan with the smallest weighted violation instead of ending in
+restoration. Layout of g with soft states:
+    g = [x_0 - x0, defects, obstacle distances, X_soft + S_states, X_soft - S_states]
+
+integrator selects the discretization of the dynamics on every stage:
+    'euler'       : x_next = x + dt f(x, u) (the original scripts)
+    'rk4'         : classic Runge-Kutta, with n_substeps the stage is split
+                    into n_substeps RK4 steps (n_substeps also applies to euler)
+    'collocation' : direct collocation with degree Legendre points per stage,
+                    the collocation states are decision variables
+With collocation the layouts become
+    x = [U, X, Xc, S],  Xc = degree collocation states of every stage
+    g = [x_0 - x0, defects, obstacle distances, soft states, collocation equations]
+so the layout of U, X and the obstacle rows does not change.
+
+With use_map=True the stage cost and the dynamics defect are written once and
+applied over the horizon with Function.map. The decision variables are MX in
+that case, so the expression graph does not grow with N.
+"""
+
+import casadi as ca
+import numpy as np
+
+
+def unicycle_model(sym=ca.SX):
+    states = sym.sym('states', 3)
+    controls = sym.sym('controls', 2)
+    theta = states[2]
+    v, omega = controls[0], controls[1]
+    rhs = ca.vertcat(v*ca.cos(theta), v*ca.sin(theta), omega)
+    return ca.Function('f', [states, controls], [rhs], ['input_state', 'control_input'], ['rhs'])
+
+
+def forklift_model(l=1.0, sym=ca.SX):
+    states = sym.sym('states', 4)
+    controls = sym.sym('controls', 2)
+    theta, alpha = states[2], states[3]
+    v, omega = controls[0], controls[1]
+    rhs = ca.vertcat(v*ca.cos(theta)*ca.cos(alpha), v*ca.sin(theta)*ca.cos(alpha), v/l*ca.sin(alpha), omega)
+    return ca.Function('f', [states, controls], [rhs], ['input_state', 'control_input'], ['rhs'])
+
+
+def n_params(f):
+    return 3*f.size1_in(0) + f.size1_in(1)
+
+
+def time_grid(T, N):
+    """ the N step lengths of the horizon, T is a scalar or already a vector of N steps """
+    dt = np.full(N, float(T)) if np.ndim(T) == 0 else np.asarray(T, dtype=float).ravel()
+    if dt.size != N or np.any(dt <= 0.0):
+        raise ValueError('expected {0} positive step lengths, got {1}'.format(N, dt))
+    return dt
+
+
+def make_time_grid(N, dt0, horizon):
+    """ N geometrically growing steps starting with dt0 and adding up to horizon [s] """
+    if N*dt0 >= horizon:
+        return np.full(N, horizon/float(N))
+    # sum of dt0*ratio^k over N steps is increasing in ratio, bisection on it
+    lo, hi = 1.0, 2.0
+    while dt0*np.sum(hi**np.arange(N)) < horizon:
+        hi *= 2.0
+    for _ in range(100):
+        ratio = 0.5*(lo+hi)
+        if dt0*np.sum(ratio**np.arange(N)) < horizon:
+            lo = ratio
+        else:
+            hi = ratio
+    dt = dt0*ratio**np.arange(N)
+    return dt*horizon/dt.sum()
+
+
+def discrete_dynamics(f, integrator='euler', n_substeps=1):
+    """ F(x, u, dt) -> x_next, n_substeps explicit Euler or RK4 steps of length dt/n_substeps """
+    x = ca.SX.sym('x', f.size1_in(0))
+    u = ca.SX.sym('u', f.size1_in(1))
+    dt = ca.SX.sym('dt')
+    h = dt/n_substeps
+    x_next = x
+    for _ in range(n_substeps):
+        if integrator == 'euler':
+            x_next = f(x_next, u)*h + x_next
+        elif integrator == 'rk4':
+            k1 = f(x_next, u)
+            k2 = f(x_next + h/2*k1, u)
+            k3 = f(x_next + h/2*k2, u)
+            k4 = f(x_next + h*k3, u)
+            x_next = x_next + h/6*(k1 + 2*k2 + 2*k3 + k4)
+        else:
+            raise ValueError('no explicit step for integrator {0}'.format(integrator))
+    return ca.Function('F', [x, u, dt], [x_next], ['x', 'u', 'dt'], ['x_next'])
+
+
+def collocation_coefficients(degree):
+    """ collocation times (0 and the Legendre points), derivative matrix C and continuity vector D """
+    tau = np.append(0.0, ca.collocation_points(degree, 'legendre'))
+    C = np.zeros((degree+1, degree+1))
+    D = np.zeros(degree+1)
+    for j in range(degree+1):
+        # Lagrange polynomial of the point j
+        lagrange = np.poly1d([1.0])
+        for r in range(degree+1):
+            if r != j:
+                lagrange *= np.poly1d([1.0, -tau[r]])/(tau[j]-tau[r])
+        D[j] = lagrange(1.0)
+        derivative = np.polyder(lagrange)
+        for r in range(degree+1):
+            C[j, r] = derivative(tau[r])
+    return tau, C, D
+
+
+def collocation_stage(f, degree=3):
+    """ (x, xc (n_states, degree), u, dt) -> (collocation equations, state at the end of the stage) """
+    n_states = f.size1_in(0)
+    _, C, D = collocation_coefficients(degree)
+    x = ca.SX.sym('x', n_states)
+    xc = ca.SX.sym('xc', n_states, degree)
+    u = ca.SX.sym('u', f.size1_in(1))
+    dt = ca.SX.sym('dt')
+    points = [x] + [xc[:, j] for j in range(degree)]
+    equations = []
+    for j in range(1, degree+1):
+        slope = sum(C[r, j]*points[r] for r in range(degree+1))
+        equations.append(dt*f(points[j], u) - slope)
+    x_end = sum(D[r]*points[r] for r in range(degree+1))
+    return ca.Function('collocation', [x, xc, u, dt], [ca.vertcat(*equations), x_end])
+
+
+def n_collocation(N, n_states, integrator='euler', degree=3):
+    """ number of collocation states in x """
+    return N*degree*n_states if integrator == 'collocation' else 0
+
+
+def collocation_guess(x_nodes, degree=3):
+    """ initial guess of Xc from the node states (N+1, n_states), every stage starts at its node """
+    return np.repeat(np.asarray(x_nodes, dtype=float)[:-1], degree, axis=0).reshape(-1, 1)
+
+
+def stage_functions(f, integrator='euler', n_substeps=1):
+    """ stage cost, dynamics defect (with the step length as input) and obstacle distance for a single stage """
+    n_states = f.size1_in(0)
+    n_controls = f.size1_in(1)
+    x = ca.SX.sym('x', n_states)
+    u = ca.SX.sym('u', n_controls)
+    x_next = ca.SX.sym('x_next', n_states)
+    dt = ca.SX.sym('dt')
+    x_target = ca.SX.sym('x_target', n_states)
+    q = ca.SX.sym('q', n_states)
+    r = ca.SX.sym('r', n_controls)
+    center = ca.SX.sym('center', 2)
+    stage_cost = ca.Function('stage_cost', [x, u, x_target, q, r],
+                             [ca.mtimes([(x-x_target).T, ca.diag(q), x-x_target]) + ca.mtimes([u.T, ca.diag(r), u])])
+    defect = ca.Function('defect', [x, u, x_next, dt], [x_next - discrete_dynamics(f, integrator, n_substeps)(x, u, dt)])
+    obstacle_distance = ca.Function('obstacle_distance', [x, center],
+                                    [ca.sqrt((x[0]-center[0])**2 + (x[1]-center[1])**2)])
+    return stage_cost, defect, obstacle_distance
+
+
+def block_index(N, blocks=None):
+    """ block of every stage, blocks=None is one block per stage """
+    if blocks is None:
+        return np.arange(N)
+    if sum(blocks) != N or min(blocks) < 1:
+        raise ValueError('block lengths {0} do not add up to N={1}'.format(list(blocks), N))
+    return np.repeat(np.arange(len(blocks)), blocks)
+
+
+def n_blocks(N, blocks=None):
+    return N if blocks is None else len(blocks)
+
+
+def expand_blocks(u, N, blocks=None):
+    """ per stage controls (N, n_controls) from the blocked controls (len(blocks), n_controls) """
+    return np.asarray(u)[block_index(N, blocks)]
+
+
+def n_slacks(N, obstacles=(), soft=(), soft_states=(0, 1)):
+    """ number of slack variables at the end of x for the soft constraint groups """
+    unknown = set(soft) - {'obstacles', 'states'}
+    if unknown:
+        raise ValueError('unknown soft constraint groups {0}'.format(sorted(unknown)))
+    return (N+1)*((len(obstacles) if 'obstacles' in soft else 0) + (len(soft_states) if 'states' in soft else 0))
+
+
+def slack_usage(w, N, n_states, n_controls, obstacles=(), soft=(), soft_states=(0, 1), blocks=None,
+                integrator='euler', degree=3):
+    """ largest slack of every soft constraint group in the solution w """
+    w = np.asarray(w, dtype=float).ravel()
+    s = w[n_blocks(N, blocks)*n_controls + (N+1)*n_states + n_collocation(N, n_states, integrator, degree):]
+    n_obs = (N+1)*len(obstacles) if 'obstacles' in soft else 0
+    usage = {}
+    if 'obstacles' in soft:
+        usage['obstacles'] = np.max(s[:n_obs], initial=0.0)
+    if 'states' in soft:
+        usage['states'] = np.max(s[n_obs:], initial=0.0)
+    return usage
+
+
+def build_mul_shooting_nlp(f, N, T, sym=ca.SX, use_map=False, obstacles=(), blocks=None, soft=(),
+                           soft_states=(0, 1), penalty=(1e2, 1e1), integrator='euler', n_substeps=1, degree=3):
+    """
+    nlp dict for ca.nlpsol, the weights are read from p.
+    obstacles is a list of (x, y) centers, see make_g_bounds for the matching lbg / ubg.
+    blocks is a list of move blocking lengths, see make_bounds for the matching lbx / ubx.
+    soft is a list of constraint groups with slacks ('obstacles', 'states'), penalty the L1 and the
+    quadratic weight of the slacks.
+    integrator is 'euler', 'rk4' (both with n_substeps steps per stage) or 'collocation' (degree points).
+    """
+    if use_map:
+        return _build_mul_shooting_nlp_map(f, N, T, obstacles, blocks, soft, soft_states, penalty, integrator,
+                                           n_substeps, degree)
+    n_states = f.size1_in(0)
+    n_controls = f.size1_in(1)
+    dt = time_grid(T, N)
+    weights = dt/dt[0]
+    U_blocks = sym.sym('U', n_controls, n_blocks(N, blocks))
+    U = U_blocks if blocks is None else ca.horzcat(*[U_blocks[:, j] for j in block_index(N, blocks)])
+    X = sym.sym('X', n_states, N+1)
+    Xc = sym.sym('Xc', n_states, degree*N if integrator == 'collocation' else 0)
+    S = sym.sym('S', n_slacks(N, obstacles, soft, soft_states))
+    P = sym.sym('P', n_params(f))
+    x_init = P[:n_states]
+    x_target = P[n_states:2*n_states]
+    Q = ca.diag(P[2*n_states:3*n_states])
+    R = ca.diag(P[3*n_states:])
+
+    obj = penalty[0]*ca.sum1(S) + penalty[1]*ca.sumsqr(S)
+    g = [X[:, 0]-x_init]
+    collocation_g = []
+    if integrator == 'collocation':
+        stage = collocation_stage(f, degree)
+    else:
+        F = discrete_dynamics(f, integrator, n_substeps)
+    for i in range(N):
+        obj = obj + weights[i]*(ca.mtimes([(X[:, i]-x_target).T, Q, X[:, i]-x_target]) +
+                                ca.mtimes([U[:, i].T, R, U[:, i]]))
+        if integrator == 'collocation':
+            equations, x_next_ = stage(X[:, i], Xc[:, i*degree:(i+1)*degree], U[:, i], dt[i])
+            collocation_g.append(equations)
+        else:
+            x_next_ = F(X[:, i], U[:, i], dt[i])
+        g.append(X[:, i+1]-x_next_)
+    n_obs = (N+1)*len(obstacles) if 'obstacles' in soft else 0
+    for k, (obs_x, obs_y) in enumerate(obstacles):
+        for i in range(N+1):
+            distance = ca.sqrt((X[0, i]-obs_x)**2 + (X[1, i]-obs_y)**2)
+            g.append(distance + S[k*(N+1)+i] if n_obs else distance)
+    g += _soft_state_rows(X, S[n_obs:], soft, soft_states) + collocation_g
+
+    opt_variables = ca.vertcat(ca.reshape(U_blocks, -1, 1), ca.reshape(X, -1, 1), ca.reshape(Xc, -1, 1), S)
+    return {'f': obj, 'x': opt_variables, 'p': P, 'g': ca.vertcat(*g)}
+
+
+def _soft_state_rows(X, S_states, soft, soft_states):
+    if 'states' not in soft:
+        return []
+    X_soft = X[list(soft_states), :]
+    S_states = ca.reshape(S_states, len(soft_states), X.size2())
+    return [ca.reshape(X_soft + S_states, -1, 1), ca.reshape(X_soft - S_states, -1, 1)]
+
+
+def build_single_shooting_nlp(f, N, T):
+    """
+    single shooting version of the sim_1 scripts: only U is a decision variable,
+    the states are a function of U and g holds the positions (x, y) of the N+1 states
+    """
+    n_states = f.size1_in(0)
+    n_controls = f.size1_in(1)
+    U = ca.SX.sym('U', n_controls, N)
+    P = ca.SX.sym('P', n_params(f))
+    x_target = P[n_states:2*n_states]
+    Q = ca.diag(P[2*n_states:3*n_states])
+    R = ca.diag(P[3*n_states:])
+
+    x = P[:n_states]
+    obj = 0
+    g = [x[:2]]
+    for i in range(N):
+        obj = obj + ca.mtimes([(x-x_target).T, Q, x-x_target]) + ca.mtimes([U[:, i].T, R, U[:, i]])
+        x = x + f(x, U[:, i])*T
+        g.append(x[:2])
+    return {'f': obj, 'x': ca.reshape(U, -1, 1), 'p': P, 'g': ca.vertcat(*g)}
+
+
+def _build_mul_shooting_nlp_map(f, N, T, obstacles, blocks=None, soft=(), soft_states=(0, 1), penalty=(1e2, 1e1),
+                                integrator='euler', n_substeps=1, degree=3):
+    n_states = f.size1_in(0)
+    n_controls = f.size1_in(1)
+    collocation = integrator == 'collocation'
+    stage_cost, defect, obstacle_distance = stage_functions(f, 'euler' if collocation else integrator, n_substeps)
+    dt = time_grid(T, N)
+    uniform = np.all(dt == dt[0])
+    U_blocks = ca.MX.sym('U', n_controls, n_blocks(N, blocks))
+    U = U_blocks if blocks is None else U_blocks[:, block_index(N, blocks).tolist()]
+    X = ca.MX.sym('X', n_states, N+1)
+    Xc = ca.MX.sym('Xc', n_states, degree*N if collocation else 0)
+    S = ca.MX.sym('S', n_slacks(N, obstacles, soft, soft_states))
+    P = ca.MX.sym('P', n_params(f))
+    x_init = P[:n_states]
+    x_target = P[n_states:2*n_states]
+    q = P[2*n_states:3*n_states]
+    r = P[3*n_states:]
+
+    # arguments with a single column are repeated over the horizon by map
+    costs = stage_cost.map(N)(X[:, :N], U, x_target, q, r)
+    obj = ca.sum2(costs) if uniform else ca.mtimes(costs, ca.DM(dt/dt[0]))
+    obj = obj + penalty[0]*ca.sum1(S) + penalty[1]*ca.sumsqr(S)
+    dt_arg = dt[0] if uniform else ca.DM(dt).T
+    if collocation:
+        equations, x_end = collocation_stage(f, degree).map(N)(X[:, :N], Xc, U, dt_arg)
+        g = [X[:, 0]-x_init, ca.reshape(X[:, 1:] - x_end, -1, 1)]
+    else:
+        g = [X[:, 0]-x_init, ca.reshape(defect.map(N)(X[:, :N], U, X[:, 1:], dt_arg), -1, 1)]
+    n_obs = (N+1)*len(obstacles) if 'obstacles' in soft else 0
+    for k, center in enumerate(obstacles):
+        distance = obstacle_distance.map(N+1)(X, ca.DM(center)).T
+        g.append(distance + S[k*(N+1):(k+1)*(N+1)] if n_obs else distance)
+    g += _soft_state_rows(X, S[n_obs:], soft, soft_states)
+    if collocation:
+        g.append(ca.reshape(equations, -1, 1))
+
+    opt_variables = ca.vertcat(ca.reshape(U_blocks, -1, 1), ca.reshape(X, -1, 1), ca.reshape(Xc, -1, 1), S)
+    return {'f': obj, 'x': opt_variables, 'p': P, 'g': ca.vertcat(*g)}
+
+
+def _diagonal(W, name):
+    W = np.asarray(W, dtype=float)
+    if W.ndim < 2:
+        return W.ravel()
+    d = np.diag(W)
+    if np.any(W != np.diag(d)):
+        raise ValueError('{0} has off-diagonal weights, the NLP only takes the diagonal as parameter'.format(name))
+    return d
+
+
+def make_params(x0, xs, Q, R):
+    """ Q and R may be given as diagonal matrices or as their diagonals, off-diagonal weights raise """
+    return np.concatenate((np.ravel(x0), np.ravel(xs), _diagonal(Q, 'Q'), _diagonal(R, 'R'))).reshape(-1, 1)
+
+
+def make_bounds(N, u_min, u_max, x_min, x_max, blocks=None, soft=(), obstacles=(), soft_states=(0, 1),
+                integrator='euler', degree=3):
+    """
+    lbx / ubx for the layout [U, X, Xc, S], the limits are given per control / state and
+    also bound the collocation states.
+    With soft states the box of the soft_states components is left to make_g_bounds.
+    """
+    x_min = np.array(x_min, dtype=float)
+    x_max = np.array(x_max, dtype=float)
+    if 'states' in soft:
+        x_min[list(soft_states)] = -np.inf
+        x_max[list(soft_states)] = np.inf
+    n_s = n_slacks(N, obstacles, soft, soft_states)
+    n_nodes = N+1 + (degree*N if integrator == 'collocation' else 0)
+    lbx = np.concatenate((np.tile(u_min, n_blocks(N, blocks)), np.tile(x_min, n_nodes), np.zeros(n_s))).astype(float)
+    ubx = np.concatenate((np.tile(u_max, n_blocks(N, blocks)), np.tile(x_max, n_nodes), np.full(n_s, np.inf)))
+    return lbx, ubx.astype(float)
+
+
+def make_g_bounds(f, N, obstacles=(), min_distances=(), soft=(), x_min=None, x_max=None, soft_states=(0, 1),
+                  integrator='euler', degree=3):
+    """
+    lbg / ubg for the layout of build_mul_shooting_nlp, one minimal distance per obstacle,
+    x_min / x_max (per state) are needed for the rows of soft states
+    """
+    n_states = f.size1_in(0)
+    lbg = [np.zeros(n_states*(N+1))]
+    ubg = [np.zeros(n_states*(N+1))]
+    for _, min_dist in zip(obstacles, min_distances):
+        lbg.append(np.full(N+1, min_dist))
+        ubg.append(np.full(N+1, np.inf))
+    if 'states' in soft:
+        idx = list(soft_states)
+        lbg += [np.tile(np.asarray(x_min, dtype=float)[idx], N+1), np.full(len(idx)*(N+1), -np.inf)]
+        ubg += [np.full(len(idx)*(N+1), np.inf), np.tile(np.asarray(x_max, dtype=float)[idx], N+1)]
+    lbg.append(np.zeros(n_collocation(N, n_states, integrator, degree)))
+    ubg.append(np.zeros(n_collocation(N, n_states, integrator, degree)))
+    return np.concatenate(lbg), np.concatenate(ubg)
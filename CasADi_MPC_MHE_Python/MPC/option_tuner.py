@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+IPOPT option tuner for the multiple shooting MPC loops.
+
+A scenario set (initial states, obstacles) is first run in closed loop with
+the reference options of the sim scripts. Every candidate option combination
+then replays the same scenarios, and its tracking error is the largest
+distance between its closed-loop states and those of the reference run at
+the same tick. The candidates are the product of
+    tol               : tol / acceptable_tol, acceptable_obj_change_tol follows
+    mu_strategy       : monotone, adaptive
+    hessian           : exact, limited-memory
+    warm_start        : shifted primal only, or shifted primal-dual with WARM_START_OPTS
+    linear_solver     : the ones that load in this IPOPT build (available_linear_solvers)
+and are replayed in worker processes. The solve time is the CPU time of the
+worker (time.process_time), so running more workers than CPUs slows the
+tuning down but does not distort the ranking. tune() returns all results and
+the fastest candidate whose tracking error stays within max_error.
+
+    python option_tuner.py [max_error] [n_workers]
+"""
+
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import casadi as ca
+import numpy as np
+
+from ocp_builder import build_mul_shooting_nlp, make_bounds, make_g_bounds, make_params, unicycle_model
+from warm_start import WARM_START_OPTS, shift_primal_dual
+
+REFERENCE_OPTS = {'ipopt.max_iter': 100, 'ipopt.acceptable_tol': 1e-8, 'ipopt.acceptable_obj_change_tol': 1e-6}
+QUIET_OPTS = {'ipopt.print_level': 0, 'print_time': 0, 'ipopt.sb': 'yes'}
+
+# sim_2 / sim_3 problem, unicycle with the +-2 m box
+PROBLEM = {'N': 100, 'T': 0.2, 'xs': [1.5, 1.5, 0.0], 'Q': [1.0, 5.0, 0.1], 'R': [0.5, 0.05],
+           'u_min': [-0.6, -np.pi/4.0], 'u_max': [0.6, np.pi/4.0],
+           'x_min': [-2.0, -2.0, -np.inf], 'x_max': [2.0, 2.0, np.inf], 'min_distance': 0.3}
+
+SCENARIOS = [{'x0': [0.0, 0.0, 0.0], 'obstacles': []},
+             {'x0': [-1.5, 1.0, np.pi/2.0], 'obstacles': []},
+             {'x0': [1.0, -1.5, -2.5], 'obstacles': []},
+             {'x0': [0.0, 0.0, 0.0], 'obstacles': [(0.5, 0.5)]}]
+
+
+def _probe_linear_solver(name):
+    x = ca.SX.sym('x', 2)
+    try:
+        solver = ca.nlpsol('probe', 'ipopt', {'x': x, 'f': ca.sumsqr(x-1.0)},
+                           dict(QUIET_OPTS, **{'ipopt.linear_solver': name}))
+        solver(x0=0.0)
+        return solver.stats()['success']
+    except RuntimeError:
+        return False
+
+
+def available_linear_solvers(candidates=('mumps', 'ma27', 'ma57', 'ma86', 'ma97', 'spral', 'pardiso')):
+    """ linear solvers that load and solve a small NLP, every probe runs in its own process """
+    found = []
+    for name in candidates:
+        # a solver library that fails to load can take the whole process down
+        with ProcessPoolExecutor(1) as pool:
+            try:
+                if pool.submit(_probe_linear_solver, name).result():
+                    found.append(name)
+            except BrokenProcessPool:
+                pass
+    return found
+
+
+def candidate_options(linear_solvers=('mumps',), tols=(1e-8, 1e-6, 1e-4, 1e-3)):
+    """ list of (name, opts, warm_start) """
+    candidates = []
+    for tol, mu, hessian, warm, linear_solver in itertools.product(
+            tols, ['monotone', 'adaptive'], ['exact', 'limited-memory'], [False, True], linear_solvers):
+        opts = {'ipopt.max_iter': 100, 'ipopt.tol': tol, 'ipopt.acceptable_tol': tol,
+                'ipopt.acceptable_obj_change_tol': min(1e-6, tol), 'ipopt.mu_strategy': mu,
+                'ipopt.hessian_approximation': hessian, 'ipopt.linear_solver': linear_solver}
+        if warm:
+            opts.update(WARM_START_OPTS)
+        name = 'tol {0:.0e} {1} {2} {3} {4}'.format(tol, mu, hessian, 'warm' if warm else 'cold', linear_solver)
+        candidates.append((name, opts, warm))
+    return candidates
+
+
+def replay(args):
+    """ closed loop of every scenario, returns states per scenario, solve CPU times and failed ticks """
+    opts, warm_start, scenarios, problem, n_iter = args
+    N, T = problem['N'], problem['T']
+    f = unicycle_model()
+    xs = np.reshape(problem['xs'], (-1, 1))
+    lbx, ubx = make_bounds(N, problem['u_min'], problem['u_max'], problem['x_min'], problem['x_max'])
+    solvers = {}
+    states, solve_t = [], []
+    failed = 0
+    for scenario in scenarios:
+        obstacles = [tuple(o) for o in scenario['obstacles']]
+        if len(obstacles) not in solvers:
+            nlp = build_mul_shooting_nlp(f, N, T, obstacles=obstacles)
+            # the first tick has no multipliers, it is solved without the warm start options
+            first_opts = {k: v for k, v in opts.items() if k not in WARM_START_OPTS}
+            solvers[len(obstacles)] = (ca.nlpsol('solver', 'ipopt', nlp, dict(QUIET_OPTS, **first_opts)),
+                                       ca.nlpsol('solver', 'ipopt', nlp, dict(QUIET_OPTS, **opts)))
+        first_solver, solver = solvers[len(obstacles)]
+        lbg, ubg = make_g_bounds(f, N, obstacles, [problem['min_distance']]*len(obstacles))
+        x0 = np.reshape(scenario['x0'], (-1, 1)).astype(float)
+        w0 = np.concatenate((np.zeros(2*N), np.tile(x0.ravel(), N+1)))
+        lam_x0, lam_g0 = 0.0, 0.0
+        x_c = [x0.ravel()]
+        mpciter = 0
+        while np.linalg.norm(x0-xs) > 1e-2 and mpciter < n_iter:
+            tick_solver = first_solver if mpciter == 0 else solver
+            t_ = time.process_time()
+            res = tick_solver(x0=w0, p=make_params(x0, xs, problem['Q'], problem['R']), lbx=lbx, ubx=ubx,
+                              lbg=lbg, ubg=ubg, lam_x0=lam_x0, lam_g0=lam_g0)
+            solve_t.append(time.process_time() - t_)
+            failed += not tick_solver.stats()['success']
+            w0, lam_x, lam_g = shift_primal_dual(res['x'], res['lam_x'], res['lam_g'], N, 3, 2, len(obstacles))
+            if warm_start:
+                lam_x0, lam_g0 = lam_x, lam_g
+            x0 = x0 + T*f(x0, res['x'][:2]).full()
+            x_c.append(x0.ravel())
+            mpciter = mpciter + 1
+        states.append(np.array(x_c))
+    return states, np.array(solve_t), failed
+
+
+def tracking_error(states, reference):
+    """ largest state distance to the reference run at the same tick, the shorter run stays at its end """
+    error = 0.0
+    for x, x_ref in zip(states, reference):
+        n = max(len(x), len(x_ref))
+        x = np.concatenate((x, np.repeat(x[-1:], n-len(x), axis=0)))
+        x_ref = np.concatenate((x_ref, np.repeat(x_ref[-1:], n-len(x_ref), axis=0)))
+        error = max(error, np.max(np.linalg.norm(x-x_ref, axis=1)))
+    return error
+
+
+def tune(max_error=1e-2, scenarios=SCENARIOS, problem=PROBLEM, candidates=None, n_workers=None, n_iter=60):
+    """ (results sorted by solve time, fastest result within max_error or None) """
+    if candidates is None:
+        candidates = candidate_options(available_linear_solvers())
+    n_workers = n_workers or os.cpu_count() or 1
+    reference_states, reference_t, _ = replay((REFERENCE_OPTS, False, scenarios, problem, n_iter))
+    jobs = [(opts, warm, scenarios, problem, n_iter) for _, opts, warm in candidates]
+    if n_workers == 1:
+        runs = [replay(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(n_workers) as pool:
+            runs = list(pool.map(replay, jobs))
+    results = [{'name': 'reference', 'opts': REFERENCE_OPTS, 'warm_start': False, 'error': 0.0,
+                'solve_ms': 1e3*reference_t.mean(), 'max_ms': 1e3*reference_t.max(), 'failed': 0}]
+    for (name, opts, warm), (states, solve_t, failed) in zip(candidates, runs):
+        results.append({'name': name, 'opts': opts, 'warm_start': warm,
+                        'error': tracking_error(states, reference_states),
+                        'solve_ms': 1e3*solve_t.mean(), 'max_ms': 1e3*solve_t.max(), 'failed': failed})
+    results.sort(key=lambda r: r['solve_ms'])
+    accepted = [r for r in results if r['error'] <= max_error and r['failed'] == 0]
+    return results, accepted[0] if accepted else None
+
+
+if __name__ == '__main__':
+    max_error = float(sys.argv[1]) if len(sys.argv) > 1 else 1e-2
+    n_workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    t_ = time.time()
+    results, best = tune(max_error, n_workers=n_workers)
+    print('{0} candidates replayed in {1:.1f} s, {2} scenarios'.format(len(results)-1, time.time()-t_,
+                                                                      len(SCENARIOS)))
+    print('{0:>52s} {1:>9s} {2:>8s} {3:>7s} {4:>10s}'.format('options', 'solve ms', 'max ms', 'failed',
+                                                              'max error'))
+    for r in results:
+        print('{0:>52s} {1:9.2f} {2:8.2f} {3:7d} {4:10.2e}{5}'.format(
+            r['name'], r['solve_ms'], r['max_ms'], r['failed'], r['error'], '  <-' if r is best else ''))
+    if best is None:
+        print('no candidate within {0:.1e} of the reference run'.format(max_error))
+    else:
+        print('fastest within {0:.1e}: {1}'.format(max_error, best['name']))
+        print(dict(best['opts'], **QUIET_OPTS))
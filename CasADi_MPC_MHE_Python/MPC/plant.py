@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Plant simulation on plain floats for the closed loops of the sim scripts.
+
+shift_movement used to call the CasADi model f (or F of discrete_dynamics)
+once per tick, and the loop converted the DM result back with
+ca.reshape(x0, -1, 1).full(). step_source instead translates the SX
+algorithm of f once into Python source on floats (math module), with
+n_substeps explicit Euler or RK4 steps and the model inlined, e.g. for the
+unicycle and Euler
+
+    def step(x, u, h, n):
+        x0, x1, x2, = x
+        u0, u1, = u
+        ...
+        for _ in range(n):
+            w0 = u0
+            w1 = x2
+            w2 = math.cos(w1)
+            ...
+            x0 = x0 + h*k1_0
+            ...
+        return [x0, x1, x2]
+
+Plant.step runs it for one sampling time, so the plant can be simulated at a
+higher rate than the controller without touching CasADi, and writes the
+result into a preallocated column (out) or a new one. python_function
+translates any dense SX / MX function the same way.
+"""
+
+import math
+
+import casadi as ca
+import numpy as np
+
+_UNARY = {ca.OP_ASSIGN: '{0}', ca.OP_NEG: '-{0}', ca.OP_SQ: '{0}*{0}', ca.OP_TWICE: '2.0*{0}',
+          ca.OP_INV: '1.0/{0}', ca.OP_FABS: 'abs({0})', ca.OP_SQRT: 'math.sqrt({0})', ca.OP_EXP: 'math.exp({0})',
+          ca.OP_LOG: 'math.log({0})', ca.OP_SIN: 'math.sin({0})', ca.OP_COS: 'math.cos({0})',
+          ca.OP_TAN: 'math.tan({0})', ca.OP_ASIN: 'math.asin({0})', ca.OP_ACOS: 'math.acos({0})',
+          ca.OP_ATAN: 'math.atan({0})', ca.OP_SINH: 'math.sinh({0})', ca.OP_COSH: 'math.cosh({0})',
+          ca.OP_TANH: 'math.tanh({0})'}
+_BINARY = {ca.OP_ADD: '{0}+{1}', ca.OP_SUB: '{0}-{1}', ca.OP_MUL: '{0}*{1}', ca.OP_DIV: '{0}/{1}',
+           ca.OP_POW: '{0}**{1}', ca.OP_CONSTPOW: '{0}**{1}', ca.OP_ATAN2: 'math.atan2({0}, {1})',
+           ca.OP_FMIN: 'min({0}, {1})', ca.OP_FMAX: 'max({0}, {1})', ca.OP_HYPOT: 'math.hypot({0}, {1})'}
+
+
+def _expand(f):
+    if not f.is_a('SXFunction'):
+        f = f.expand()
+    for i in range(f.n_in()):
+        if not f.sparsity_in(i).is_dense():
+            raise ValueError('input {0} of {1} is not dense'.format(f.name_in(i), f.name()))
+    return f
+
+
+def _body(f, inputs, outputs, indent='    '):
+    """
+    source lines evaluating the SX function f, inputs[i][j] is the expression of the nonzero j of
+    input i, the nonzero j of output i is assigned to outputs[i][j]
+    """
+    lines = []
+    assigned = set()
+    for k in range(f.n_instructions()):
+        op = f.instruction_id(k)
+        arg = f.instruction_input(k)
+        res = f.instruction_output(k)
+        if op == ca.OP_OUTPUT:
+            # the work variables are reused, copy the value out
+            lines.append('{0}{1} = w{2}'.format(indent, outputs[res[0]][res[1]], arg[0]))
+            assigned.add(tuple(res))
+            continue
+        if op == ca.OP_INPUT:
+            expr = inputs[arg[0]][arg[1]]
+        elif op == ca.OP_CONST:
+            expr = repr(float(f.instruction_constant(k)))
+        elif op in _UNARY:
+            expr = _UNARY[op].format('w{0}'.format(arg[0]))
+        elif op in _BINARY:
+            expr = _BINARY[op].format('w{0}'.format(arg[0]), 'w{0}'.format(arg[1]))
+        else:
+            raise ValueError('operation {0} of {1} has no Python translation'.format(op, f.name()))
+        lines.append('{0}w{1} = {2}'.format(indent, res[0], expr))
+    # structural zeros of the outputs
+    for i in range(f.n_out()):
+        for j in range(f.nnz_out(i)):
+            if (i, j) not in assigned:
+                lines.append('{0}{1} = 0.0'.format(indent, outputs[i][j]))
+    return lines
+
+
+def python_source(f, name='fun'):
+    """ Python source of f, the dense inputs are sequences of floats, returns one list per output """
+    f = _expand(f)
+    inputs = [['a{0}[{1}]'.format(i, j) for j in range(f.nnz_in(i))] for i in range(f.n_in())]
+    outputs = [['o{0}_{1}'.format(i, j) for j in range(f.nnz_out(i))] for i in range(f.n_out())]
+    lines = ['def {0}({1}):'.format(name, ', '.join('a{0}'.format(i) for i in range(f.n_in())))]
+    lines += _body(f, inputs, outputs)
+    lines.append('    return {0},'.format(', '.join('[{0}]'.format(', '.join(o)) for o in outputs)))
+    return '\n'.join(lines) + '\n'
+
+
+def step_source(f, integrator='euler', name='step'):
+    """
+    Python source of step(x, u, h, n), n explicit Euler or RK4 steps of length h of the model
+    f(x, u) -> dx/dt with the model inlined, returns the state as a list
+    """
+    f = _expand(f)
+    n_x, n_u = f.nnz_in(0), f.nnz_in(1)
+    x = ['x{0}'.format(i) for i in range(n_x)]
+    t = ['t{0}'.format(i) for i in range(n_x)]
+    u = ['u{0}'.format(i) for i in range(n_u)]
+    k = [['k{0}_{1}'.format(s, i) for i in range(n_x)] for s in range(1, 5)]
+    lines = ['def {0}(x, u, h, n):'.format(name),
+             '    {0}, = x'.format(', '.join(x)),
+             '    {0}, = u'.format(', '.join(u)),
+             '    h2 = 0.5*h',
+             '    h6 = h/6.0',
+             '    for _ in range(n):']
+    indent = '        '
+    if integrator == 'euler':
+        lines += _body(f, [x, u], [k[0]], indent)
+        lines += ['{0}{1} = {1} + h*{2}'.format(indent, x[i], k[0][i]) for i in range(n_x)]
+    elif integrator == 'rk4':
+        lines += _body(f, [x, u], [k[0]], indent)
+        for s, scale in [(1, 'h2'), (2, 'h2'), (3, 'h')]:
+            lines += ['{0}{1} = {2} + {3}*{4}'.format(indent, t[i], x[i], scale, k[s-1][i]) for i in range(n_x)]
+            lines += _body(f, [t, u], [k[s]], indent)
+        lines += ['{0}{1} = {1} + h6*({2} + 2.0*{3} + 2.0*{4} + {5})'.format(
+            indent, x[i], k[0][i], k[1][i], k[2][i], k[3][i]) for i in range(n_x)]
+    else:
+        raise ValueError('no explicit step for integrator {0}'.format(integrator))
+    lines.append('    return [{0}]'.format(', '.join(x)))
+    return '\n'.join(lines) + '\n'
+
+
+def _compile(source, name):
+    namespace = {'math': math}
+    exec(compile(source, '<{0}>'.format(name), 'exec'), namespace)
+    return namespace[name]
+
+
+def python_function(f, name='fun'):
+    """ callable of python_source(f), e.g. python_function(f)(x, u) -> ([dx/dt],) """
+    return _compile(python_source(f, name), name)
+
+
+class Plant(object):
+    def __init__(self, f, dt, integrator='euler', n_substeps=1):
+        if integrator not in ('euler', 'rk4'):
+            raise ValueError('no explicit step for integrator {0}'.format(integrator))
+        if f.n_out() != 1:
+            raise ValueError('expected the model f(x, u) -> dx/dt, got {0} outputs'.format(f.n_out()))
+        self.n_states = f.size1_in(0)
+        self.dt = float(dt)
+        self.integrator = integrator
+        self.n_substeps = n_substeps
+        self.h = self.dt/n_substeps
+        self.source = step_source(f, integrator)
+        self._step = _compile(self.source, 'step')
+
+    def step(self, x0, u, out=None):
+        """ state after dt from x0 under the constant control u, written into out if given, else a new column """
+        x = self._step(np.ravel(x0).tolist(), np.ravel(u).tolist(), self.h, self.n_substeps)
+        if out is None:
+            return np.array(x).reshape(-1, 1)
+        out.flat[:] = x
+        return out
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Riccati recursion based interior point solver for stage-wise QPs
+
+    min  sum_k 0.5 [x_k; u_k]' [Q_k S_k'; S_k R_k] [x_k; u_k] + q_k' x_k + r_k' u_k + 0.5 x_N' Q_N x_N + q_N' x_N
+    s.t. x_{k+1} = A_k x_k + B_k u_k + c_k,  x_0 = x0,  lbz <= z <= ubz
+
+with z = [u_0, ..., u_{N-1}, x_0, ..., x_N] (the layout of ocp_builder.py, so
+make_bounds gives lbz / ubz). Infinite bounds are ignored.
+
+A Mehrotra predictor-corrector interior point loop handles the bounds. The
+barrier terms only add a diagonal to Q_k / R_k, so every Newton step is an
+unconstrained LQ problem solved by one backward Riccati and one forward
+sweep, O(N (n_states + n_controls)^3) instead of a factorization of the full
+KKT matrix. Predictor and corrector share the factorization.
+"""
+
+import casadi as ca
+import numpy as np
+
+
+def riccati_factor(A, B, Q, R, S):
+    """
+    backward sweep on the Hessian, returns the cost-to-go matrices P, the
+    feedback gains K, the closed-loop matrices A + B K and inv(R + B' P B)
+    """
+    N, n_states = A.shape[:2]
+    # stage Hessians [Q S'; S R] and [A B], so one sweep step is a few calls on small matrices
+    H = np.concatenate((np.concatenate((Q[:N], S.transpose(0, 2, 1)), axis=2),
+                        np.concatenate((S, R), axis=2)), axis=1)
+    AB = np.concatenate((A, B), axis=2)
+    AB_T = AB.transpose(0, 2, 1)
+    P = np.empty_like(Q)
+    K = np.empty_like(S)
+    Rinv = np.empty_like(R)
+    P[N] = Q[N]
+    P_next = Q[N]
+    # per stage loops over lists, indexing a list is cheaper than slicing the stacked arrays
+    H_l, AB_l, AB_T_l = list(H), list(AB), list(AB_T)
+    for k in range(N-1, -1, -1):
+        G = H_l[k] + AB_T_l[k].dot(P_next.dot(AB_l[k]))
+        Rinv_k = np.linalg.inv(G[n_states:, n_states:])
+        K_k = -Rinv_k.dot(G[n_states:, :n_states])
+        P_next = G[:n_states, :n_states] + G[:n_states, n_states:].dot(K_k)
+        P[k] = P_next
+        K[k] = K_k
+        Rinv[k] = Rinv_k
+    A_cl = A + np.matmul(B, K)
+    return P, K, A_cl, Rinv
+
+
+def riccati_solve(factors, B, c, q, r, x0):
+    """ backward sweep on the linear terms and forward simulation, returns x, u and the costates """
+    P, K, A_cl, Rinv = factors
+    N = len(B)
+    # everything that does not depend on the recursion is evaluated for all stages at once
+    Pc = np.einsum('kij,kj->ki', P[1:], c)
+    qK = q[:N] + np.einsum('kji,kj->ki', K, r)
+    A_cl_T = list(A_cl.transpose(0, 2, 1))
+    p = np.empty_like(q)
+    s = np.empty_like(c)
+    p[N] = q[N]
+    p_next = q[N]
+    for k in range(N-1, -1, -1):
+        s_k = Pc[k] + p_next
+        p_next = qK[k] + A_cl_T[k].dot(s_k)
+        s[k] = s_k
+        p[k] = p_next
+    k_ff = -np.einsum('kij,kj->ki', Rinv, r + np.einsum('kji,kj->ki', B, s))
+    d = np.einsum('kij,kj->ki', B, k_ff) + c
+    A_cl_l = list(A_cl)
+    x = np.empty_like(q)
+    x[0] = x0
+    x_k = x[0]
+    for k in range(N):
+        x_k = A_cl_l[k].dot(x_k) + d[k]
+        x[k+1] = x_k
+    u = np.einsum('kij,kj->ki', K, x[:N]) + k_ff
+    lam = np.einsum('kij,kj->ki', P, x) + p
+    return x, u, lam
+
+
+def _split(v, N, n_states, n_controls):
+    return v[:N*n_controls].reshape(N, n_controls), v[N*n_controls:].reshape(N+1, n_states)
+
+
+def _max_step(v, dv):
+    neg = dv < 0.0
+    if not np.any(neg):
+        return 1.0
+    return min(1.0, np.min(-v[neg]/dv[neg]))
+
+
+def solve_ocp_qp(A, B, c, Q, R, S, q, r, x0, lbz=None, ubz=None, z0=None, tol=1e-6, max_iter=50):
+    """
+    A (N, n_x, n_x), B (N, n_x, n_u), c (N, n_x), Q (N+1, n_x, n_x), R (N, n_u, n_u), S (N, n_u, n_x),
+    q (N+1, n_x), r (N, n_u), bounds and the initial guess z0 in the layout [U, X].
+    returns z and a dict with the iteration count, the final barrier parameter and success
+    """
+    N, n_states = c.shape
+    n_controls = r.shape[1]
+    n_z = N*n_controls + (N+1)*n_states
+    lbz = np.full(n_z, -np.inf) if lbz is None else np.broadcast_to(np.asarray(lbz, dtype=float).ravel(), (n_z,))
+    ubz = np.full(n_z, np.inf) if ubz is None else np.broadcast_to(np.asarray(ubz, dtype=float).ravel(), (n_z,))
+    # entries without a bound keep t = 1, lam = 0 and never move
+    m_l = np.isfinite(lbz).astype(float)
+    m_u = np.isfinite(ubz).astype(float)
+    lb = np.where(m_l > 0, lbz, 0.0)
+    ub = np.where(m_u > 0, ubz, 0.0)
+    n_ineq = m_l.sum() + m_u.sum()
+    g = np.concatenate((r.ravel(), q.ravel()))
+    x0 = np.ravel(x0)
+
+    z = np.zeros(n_z) if z0 is None else np.asarray(z0, dtype=float).ravel().copy()
+    t_l = np.maximum(m_l*(z-lb), 1.0)
+    t_u = np.maximum(m_u*(ub-z), 1.0)
+    l_l = m_l.copy()
+    l_u = m_u.copy()
+    nu = np.zeros((N+1, n_states))
+    diag_x = np.arange(n_states)
+    diag_u = np.arange(n_controls)
+    info = {'iter': 0, 'mu': 0.0, 'success': False}
+
+    for it in range(max_iter):
+        u, x = _split(z, N, n_states, n_controls)
+        # KKT residuals, the costates nu are the multipliers of x_0 = x0 and of the dynamics
+        lam_u, lam_x = _split(l_u-l_l, N, n_states, n_controls)
+        r_du = (np.einsum('kij,kj->ki', R, u) + np.einsum('kij,kj->ki', S, x[:N]) + r
+                + np.einsum('kji,kj->ki', B, nu[1:]) + lam_u)
+        r_dx = np.einsum('kij,kj->ki', Q, x) + q - nu + lam_x
+        r_dx[:N] += np.einsum('kji,kj->ki', S, u) + np.einsum('kji,kj->ki', A, nu[1:])
+        r_e = np.concatenate(((x[0]-x0)[None], x[1:]-np.einsum('kij,kj->ki', A, x[:N])
+                              - np.einsum('kij,kj->ki', B, u) - c))
+        r_il = m_l*(lb-z+t_l)
+        r_iu = m_u*(z-ub+t_u)
+        mu = (np.dot(t_l*l_l, m_l) + np.dot(t_u*l_u, m_u))/max(n_ineq, 1.0)
+        # the dual residual is scaled with the linear cost, the costates lose precision as mu goes to zero
+        res_p = max(np.abs(r_e).max(), np.abs(r_il).max(), np.abs(r_iu).max())
+        res_d = max(np.abs(r_du).max(initial=0.0), np.abs(r_dx).max())/max(1.0, np.abs(g).max())
+        info = {'iter': it, 'mu': float(mu), 'success': bool(max(res_p, res_d, mu) < tol)}
+        if info['success']:
+            break
+
+        # the barrier adds a diagonal to the stage Hessians, factorized once for predictor and corrector
+        D = m_l*l_l/t_l + m_u*l_u/t_u
+        D_u, D_x = _split(D, N, n_states, n_controls)
+        Q_mod = Q.copy()
+        R_mod = R.copy()
+        Q_mod[:, diag_x, diag_x] += D_x
+        R_mod[:, diag_u, diag_u] += D_u
+        factors = riccati_factor(A, B, Q_mod, R_mod, S)
+
+        def newton_step(r_cl, r_cu):
+            # the LQ solution is the full step z + dz, its costates the new multipliers of the dynamics
+            v_l = m_l*(l_l*r_il-r_cl)/t_l
+            v_u = m_u*(l_u*r_iu-r_cu)/t_u
+            g_u, g_x = _split(g + l_u - l_l + v_u - v_l - D*z, N, n_states, n_controls)
+            x_new, u_new, nu_new = riccati_solve(factors, B, c, g_x, g_u, x0)
+            dz = np.concatenate((u_new.ravel(), x_new.ravel())) - z
+            dt_l = m_l*(dz-r_il)
+            dt_u = -m_u*(dz+r_iu)
+            dl_l = m_l*(-r_cl-l_l*dt_l)/t_l
+            dl_u = m_u*(-r_cu-l_u*dt_u)/t_u
+            return dz, dt_l, dt_u, dl_l, dl_u, nu_new-nu
+
+        def step_length(dt_l, dt_u, dl_l, dl_u):
+            return min(_max_step(t_l, dt_l), _max_step(t_u, dt_u), _max_step(l_l, dl_l), _max_step(l_u, dl_u))
+
+        # predictor
+        r_cl = m_l*t_l*l_l
+        r_cu = m_u*t_u*l_u
+        step = newton_step(r_cl, r_cu)
+        if n_ineq > 0:
+            _, dt_l, dt_u, dl_l, dl_u, _ = step
+            alpha = step_length(dt_l, dt_u, dl_l, dl_u)
+            mu_aff = (np.dot((t_l+alpha*dt_l)*(l_l+alpha*dl_l), m_l)
+                      + np.dot((t_u+alpha*dt_u)*(l_u+alpha*dl_u), m_u))/n_ineq
+            sigma = (mu_aff/mu)**3
+            # corrector with the second order term of the predictor
+            step = newton_step(r_cl + m_l*(dt_l*dl_l-sigma*mu), r_cu + m_u*(dt_u*dl_u-sigma*mu))
+        dz, dt_l, dt_u, dl_l, dl_u, dnu = step
+        alpha = min(1.0, 0.995*step_length(dt_l, dt_u, dl_l, dl_u)) if n_ineq > 0 else 1.0
+        z = z + alpha*dz
+        t_l = t_l + alpha*dt_l
+        t_u = t_u + alpha*dt_u
+        l_l = l_l + alpha*dl_l
+        l_u = l_u + alpha*dl_u
+        nu = nu + alpha*dnu
+    else:
+        info['iter'] = max_iter
+    return z, info
+
+
+def ocp_qp_function(nlp, N, n_states, n_controls):
+    """
+    ca.Function (w, p) -> (Q, R, S, q, r, A, B, c) of the QP of one SQP step of a
+    build_mul_shooting_nlp problem at w, with the step dw in the layout [U, X].
+    The matrices are stacked horizontally over the stages, see unpack_ocp_qp.
+    """
+    w = nlp['x']
+    g = nlp['g']
+    if g.size1() != (N+1)*n_states:
+        raise ValueError('the Riccati QP only handles the dynamics constraints, got {0} instead of {1}'.format(
+            g.size1(), (N+1)*n_states))
+    n_u = N*n_controls
+    H, grad = ca.hessian(nlp['f'], w)
+    J = ca.jacobian(g, w)
+
+    def iu(k):
+        return slice(k*n_controls, (k+1)*n_controls)
+
+    def ix(k):
+        return slice(n_u+k*n_states, n_u+(k+1)*n_states)
+
+    def ig(k):
+        return slice(k*n_states, (k+1)*n_states)
+
+    # the defect X_{k+1} - F(X_k, U_k) is linearized to dX_{k+1} = A_k dX_k + B_k dU_k - defect_k
+    Q = ca.horzcat(*[H[ix(k), ix(k)] for k in range(N+1)])
+    R = ca.horzcat(*[H[iu(k), iu(k)] for k in range(N)])
+    S = ca.horzcat(*[H[iu(k), ix(k)] for k in range(N)])
+    A = ca.horzcat(*[-J[ig(k+1), ix(k)] for k in range(N)])
+    B = ca.horzcat(*[-J[ig(k+1), iu(k)] for k in range(N)])
+    c = -g[n_states:]
+    return ca.Function('ocp_qp', [w, nlp['p']], [Q, R, S, grad[ix(0).start:], grad[:n_u], A, B, c],
+                       ['w', 'p'], ['Q', 'R', 'S', 'q', 'r', 'A', 'B', 'c'])
+
+
+def unpack_ocp_qp(res, N, n_states, n_controls):
+    """ stage arrays for solve_ocp_qp from the outputs of ocp_qp_function """
+    def blocks(M, n_blocks, n_rows, n_cols):
+        return np.ascontiguousarray(ca.DM(M).full().reshape(n_rows, n_blocks, n_cols).transpose(1, 0, 2))
+    Q, R, S, q, r, A, B, c = res
+    return {'Q': blocks(Q, N+1, n_states, n_states), 'R': blocks(R, N, n_controls, n_controls),
+            'S': blocks(S, N, n_controls, n_states), 'q': ca.DM(q).full().reshape(N+1, n_states),
+            'r': ca.DM(r).full().reshape(N, n_controls), 'A': blocks(A, N, n_states, n_states),
+            'B': blocks(B, N, n_states, n_controls), 'c': ca.DM(c).full().reshape(N, n_states)}
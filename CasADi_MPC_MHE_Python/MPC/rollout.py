@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Batched NumPy rollouts of the unicycle and forklift models.
+
+prediction_state of the *_opt scripts integrates one control sequence with a
+Python loop over the stages and the state components. Rollout integrates K
+control sequences u of shape (K, N, n_controls) from one or K initial states
+at once: the loop runs over the N stages only, and every stage is a handful
+of array operations over K. The states are kept stage major, (N+1, n_states,
+K), so every state component of a stage is one contiguous vector, and all
+intermediate results are written into buffers that are allocated once for
+the largest batch. The returned states are a (K, N+1, n_states) view of that
+buffer and are overwritten by the next call, copy them to keep them.
+
+    rollout = Rollout('unicycle', N=100, T=0.2, batch_size=1000)
+    states = rollout(x0, u)    # x0 (n_states,) or (K, n_states)
+
+integrator 'euler' matches prediction_state and the defects of ocp_builder,
+'rk4' with n_substeps matches discrete_dynamics(f, 'rk4', n_substeps).
+"""
+
+import numpy as np
+
+MODELS = {'unicycle': (3, 2), 'forklift': (4, 2)}  # (n_states, n_controls)
+
+
+def unicycle_rhs(x, u, out, tmp, l=None):
+    """ x (3, K), u (2, K), writes dx/dt into out (3, K), tmp is a (K,) buffer """
+    np.cos(x[2], out=tmp)
+    np.multiply(u[0], tmp, out=out[0])
+    np.sin(x[2], out=tmp)
+    np.multiply(u[0], tmp, out=out[1])
+    out[2] = u[1]
+    return out
+
+
+def forklift_rhs(x, u, out, tmp, l=1.0):
+    """ x (4, K), u (2, K), writes dx/dt into out (4, K), tmp is a (K,) buffer """
+    # out[3] holds v cos(alpha) until the heading rates are done
+    np.cos(x[3], out=tmp)
+    np.multiply(u[0], tmp, out=out[3])
+    np.cos(x[2], out=tmp)
+    np.multiply(out[3], tmp, out=out[0])
+    np.sin(x[2], out=tmp)
+    np.multiply(out[3], tmp, out=out[1])
+    np.sin(x[3], out=tmp)
+    np.multiply(u[0], tmp, out=out[2])
+    out[2] *= 1.0/l
+    out[3] = u[1]
+    return out
+
+
+class Rollout(object):
+    def __init__(self, model, N, T, batch_size=1024, integrator='euler', n_substeps=1, l=1.0):
+        if model not in MODELS:
+            raise ValueError('unknown model {0}, expected one of {1}'.format(model, sorted(MODELS)))
+        if integrator not in ('euler', 'rk4'):
+            raise ValueError('no explicit step for integrator {0}'.format(integrator))
+        self.model = model
+        self.n_states, self.n_controls = MODELS[model]
+        self.N = N
+        self.T = float(T)
+        self.batch_size = batch_size
+        self.integrator = integrator
+        self.n_substeps = n_substeps
+        self.l = l
+        self.rhs = unicycle_rhs if model == 'unicycle' else forklift_rhs
+        self.states = np.empty((N+1, self.n_states, batch_size))
+        self.controls = np.empty((N, self.n_controls, batch_size))
+        self.tmp = np.empty(batch_size)
+        n_stages = 1 if integrator == 'euler' else 5  # k1 .. k4 and the stage point
+        self.stages = np.empty((n_stages, self.n_states, batch_size))
+        self.x = np.empty((self.n_states, batch_size))  # state between substeps
+
+    def __call__(self, x0, u):
+        """
+        x0 : (n_states,) shared by all rollouts or (K, n_states)
+        u  : (K, N, n_controls)
+        returns the states (K, N+1, n_states), a view of the internal buffer
+        """
+        u = np.asarray(u, dtype=float)
+        K = u.shape[0]
+        if u.shape[1:] != (self.N, self.n_controls):
+            raise ValueError('expected controls of shape (K, {0}, {1}), got {2}'.format(
+                self.N, self.n_controls, u.shape))
+        if K > self.batch_size:
+            raise ValueError('{0} rollouts for a batch size of {1}'.format(K, self.batch_size))
+        states = self.states[:, :, :K]
+        controls = self.controls[:, :, :K]
+        np.copyto(controls, u.transpose(1, 2, 0))
+        np.copyto(states[0], np.asarray(x0, dtype=float).T.reshape(self.n_states, -1))
+        step = self._euler if self.integrator == 'euler' else self._rk4
+        h = self.T/self.n_substeps
+        tmp = self.tmp[:K]
+        for k in range(self.N):
+            if self.n_substeps == 1:
+                step(states[k], controls[k], h, states[k+1], tmp, K)
+            else:
+                x = self.x[:, :K]
+                x[...] = states[k]
+                for _ in range(self.n_substeps-1):
+                    step(x, controls[k], h, x, tmp, K)
+                step(x, controls[k], h, states[k+1], tmp, K)
+        return states.transpose(2, 0, 1)
+
+    def _euler(self, x, u, h, out, tmp, K):
+        dx = self.rhs(x, u, self.stages[0, :, :K], tmp, self.l)
+        dx *= h
+        np.add(x, dx, out=out)
+
+    def _rk4(self, x, u, h, out, tmp, K):
+        k1, k2, k3, k4, xt = self.stages[:, :, :K]
+        self.rhs(x, u, k1, tmp, self.l)
+        np.multiply(k1, h/2, out=xt)
+        xt += x
+        self.rhs(xt, u, k2, tmp, self.l)
+        np.multiply(k2, h/2, out=xt)
+        xt += x
+        self.rhs(xt, u, k3, tmp, self.l)
+        np.multiply(k3, h, out=xt)
+        xt += x
+        self.rhs(xt, u, k4, tmp, self.l)
+        # k1 + 2 k2 + 2 k3 + k4 accumulated in k1
+        k2 += k3
+        k2 *= 2.0
+        k1 += k2
+        k1 += k4
+        k1 *= h/6
+        np.add(x, k1, out=out)
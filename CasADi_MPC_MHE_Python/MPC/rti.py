@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Real-time iteration (RTI) for the multiple shooting OCP of ocp_builder.py.
+
+One SQP step per control tick, split in two phases:
+    preparation : shift the last trajectory and linearize the NLP around it
+                  (Gauss-Newton Hessian of the quadratic cost, Jacobian of g),
+                  done while the plant moves, before the new state is known
+    feedback    : the new x0 only enters the first constraint block
+                  X_0 - x0 = 0, which is linear, so only the QP bounds change
+                  and the QP is solved once
+The feedback latency is the QP time instead of a full IPOPT solve.
+With qp_plugin='riccati' the QP is solved stage-wise by riccati_qp.py instead
+of a ca.conic solver (dynamics constraints only). With qp_plugin='condensed'
+it is condensed in blocks by condensing.py first, qp_opts gives block_size
+('auto' picks the fastest at the first tick) and the qp_plugin of the
+condensed QP.
+"""
+
+import casadi as ca
+import numpy as np
+
+from condensing import CondensedQP, select_block_size
+from riccati_qp import ocp_qp_function, solve_ocp_qp, unpack_ocp_qp
+from warm_start import shift_blocks
+
+
+class RTIController(object):
+    def __init__(self, nlp, N, n_states, n_controls, lbx, ubx, lbg=0.0, ubg=0.0, qp_plugin='osqp',
+                 qp_opts=None):
+        w = nlp['x']
+        p = nlp['p']
+        self.N = N
+        self.n_states = n_states
+        self.n_controls = n_controls
+        self.n_u = N*n_controls
+        n_g = nlp['g'].size1()
+        self.lbx = np.broadcast_to(np.asarray(lbx, dtype=float).ravel(), (w.size1(),)).copy()
+        self.ubx = np.broadcast_to(np.asarray(ubx, dtype=float).ravel(), (w.size1(),)).copy()
+        self.lbg = np.broadcast_to(np.asarray(lbg, dtype=float).ravel(), (n_g,)).copy()
+        self.ubg = np.broadcast_to(np.asarray(ubg, dtype=float).ravel(), (n_g,)).copy()
+
+        self.w = None
+        self._qp_args = None
+        self._g = None
+        # the stage-wise solvers work on the (A, B, Q, R, ...) blocks of the QP
+        self.use_stage_qp = qp_plugin in ['riccati', 'condensed']
+        if self.use_stage_qp:
+            self._prepare = ocp_qp_function(nlp, N, n_states, n_controls)
+            self.qp = None
+            self._stage_opts = dict(qp_opts or {})
+            if qp_plugin == 'riccati':
+                self._stage_solve = solve_ocp_qp
+            else:
+                self._stage_solve = None
+                self.block_size = self._stage_opts.pop('block_size', N)
+                self._condensed_plugin = self._stage_opts.pop('qp_plugin', None)
+            return
+        # the cost is quadratic, its Hessian is the Gauss-Newton Hessian of the problem
+        H, grad = ca.hessian(nlp['f'], w)
+        A = ca.jacobian(nlp['g'], w)
+        self._prepare = ca.Function('rti_prepare', [w, p], [H, grad, nlp['g'], A])
+        if qp_opts is None:
+            qp_opts = {'osqp': {'verbose': False, 'eps_abs': 1e-5, 'eps_rel': 1e-5, 'polish': False},
+                       'warm_start_primal': True} if qp_plugin == 'osqp' else {}
+        qp_opts = dict({'print_time': 0, 'error_on_fail': False}, **qp_opts)
+        self.qp = ca.conic('rti_qp', qp_plugin, {'h': H.sparsity(), 'a': A.sparsity()}, qp_opts)
+
+    def initialize(self, w):
+        """ start from a given trajectory, e.g. a converged IPOPT solution """
+        self.w = np.asarray(w, dtype=float).ravel().copy()
+
+    def shift(self):
+        self.w = np.concatenate((shift_blocks(self.w[:self.n_u], self.N, self.n_controls),
+                                 shift_blocks(self.w[self.n_u:], self.N+1, self.n_states))).ravel()
+
+    def preparation(self, p):
+        """ linearize around self.w, the x0 block of p is not used """
+        if self.use_stage_qp:
+            self._qp_args = unpack_ocp_qp(self._prepare(self.w, p), self.N, self.n_states, self.n_controls)
+            return
+        H, grad, g, A = self._prepare(self.w, p)
+        self._g = g.full().ravel()
+        self._qp_args = {'h': H, 'g': grad, 'a': A, 'lbx': self.lbx-self.w, 'ubx': self.ubx-self.w}
+
+    def feedback(self, x0):
+        """ solve the QP for the measured state and return the first control """
+        if self.use_stage_qp:
+            dx0 = np.ravel(x0) - self.w[self.n_u:self.n_u+self.n_states]
+            lbz = self.lbx - self.w
+            ubz = self.ubx - self.w
+            if self._stage_solve is None:
+                if self.block_size == 'auto':
+                    self.block_size, _ = select_block_size(self._qp_args, dx0, lbz, ubz,
+                                                           qp_plugin=self._condensed_plugin)
+                self._stage_solve = CondensedQP(self.N, self.n_states, self.n_controls, self.lbx, self.ubx,
+                                                self.block_size, self._condensed_plugin).solve
+            dw, _ = self._stage_solve(x0=dx0, lbz=lbz, ubz=ubz, **dict(self._qp_args, **self._stage_opts))
+            self.w = self.w + dw
+            return self.w[:self.n_controls].reshape(-1, 1)
+        g = self._g.copy()
+        g[:self.n_states] = self.w[self.n_u:self.n_u+self.n_states] - np.ravel(x0)
+        res = self.qp(lba=self.lbg-g, uba=self.ubg-g, **self._qp_args)
+        self.w = self.w + res['x'].full().ravel()
+        return self.w[:self.n_controls].reshape(-1, 1)
+
+    def trajectory(self):
+        """ (u (N, n_controls), x (N+1, n_states)) of the current iterate """
+        return (self.w[:self.n_u].reshape(self.N, self.n_controls),
+                self.w[self.n_u:].reshape(self.N+1, self.n_states))
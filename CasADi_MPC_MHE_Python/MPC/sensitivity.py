@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tangential predictor from the parametric sensitivity of the NLP solution.
+
+At a solution (w*, lam_g*) for the parameter p* the KKT conditions
+    grad_w L(w, lam_g, p) = 0,   g_A(w, p) = 0   (equalities and active inequalities)
+with the active variable bounds kept fixed are differentiated w.r.t. p:
+    [ H    J_A' ] [ dw/dp     ]     [ d grad_w L / dp ]
+    [ J_A  0    ] [ dlam_A/dp ] = - [ d g_A / dp      ]
+The matrices are evaluated once per full solve and the sparse system is
+factorized with csparse, so a prediction for a new p (new x0 or a new
+target in the layout of ocp_builder.make_params) is a matrix-vector product
+    w(p) ~ w* + dw/dp (p - p*)
+clipped to the bounds. The active set is the one of the last solve.
+shift() moves the expansion point one stage forward like shift_movement
+(solution and sensitivities are shifted, the x0 of the reference parameter
+becomes the predicted state), so at the next tick the prediction corrects
+the shifted plan for the difference between measured and predicted state.
+The prediction is also the initial guess of the next full solve.
+"""
+
+import casadi as ca
+import numpy as np
+
+from warm_start import shift_primal_dual
+
+
+class SensitivityPredictor(object):
+    def __init__(self, nlp, N, n_states, n_controls, lbx, ubx, lbg=0.0, ubg=0.0, active_tol=1e-6,
+                 regularization=1e-9, linear_solver='csparse'):
+        self.N = N
+        self.n_states = n_states
+        self.n_controls = n_controls
+        w = nlp['x']
+        p = nlp['p']
+        g = nlp['g']
+        self.n_w = w.size1()
+        self.n_g = g.size1()
+        self.lbx = np.broadcast_to(np.ravel(lbx), (self.n_w,)).astype(float)
+        self.ubx = np.broadcast_to(np.ravel(ubx), (self.n_w,)).astype(float)
+        lbg = np.broadcast_to(np.ravel(lbg), (self.n_g,))
+        ubg = np.broadcast_to(np.ravel(ubg), (self.n_g,))
+        self.equality = lbg == ubg
+        self.active_tol = active_tol
+        self.regularization = regularization
+        self.linear_solver = linear_solver
+        lam_g = w.sym('lam_g', self.n_g)
+        lag = nlp['f'] + ca.dot(lam_g, g)
+        grad = ca.gradient(lag, w)
+        self.kkt = ca.Function('kkt', [w, p, lam_g],
+                               [ca.hessian(lag, w)[0], ca.jacobian(g, w), ca.jacobian(grad, p), ca.jacobian(g, p)])
+        self.w = None
+        self.lam_x = None
+        self.lam_g = None
+        self.p = None
+        self.dw_dp = None
+        self.dlam_dp = None
+
+    def update(self, res, p):
+        """ sensitivities at the solution res of the solver for the parameter p """
+        self.w = res['x'].full().ravel()
+        self.lam_g = res['lam_g'].full().ravel()
+        self.p = np.ravel(p).astype(float)
+        self.lam_x = res['lam_x'].full().ravel()
+        free = np.where(np.abs(self.lam_x) <= self.active_tol)[0]
+        active = np.where(self.equality | (np.abs(self.lam_g) > self.active_tol))[0]
+        H, J, H_p, J_p = self.kkt(self.w, self.p, self.lam_g)
+        J_A = J[active.tolist(), free.tolist()]
+        # the small negative diagonal keeps the system regular for degenerate active sets
+        kkt = ca.blockcat([[H[free.tolist(), free.tolist()], J_A.T],
+                           [J_A, -self.regularization*ca.DM.eye(len(active))]])
+        rhs = -ca.vertcat(H_p[free.tolist(), :], J_p[active.tolist(), :])
+        sens = ca.solve(kkt, rhs, self.linear_solver).full()
+        # fixed bounds do not move, inactive constraints keep zero multipliers
+        self.dw_dp = np.zeros((self.n_w, self.p.size))
+        self.dw_dp[free] = sens[:len(free)]
+        self.dlam_dp = np.zeros((self.n_g, self.p.size))
+        self.dlam_dp[active] = sens[len(free):]
+
+    def shift(self):
+        """ move the expansion point one stage forward, see shift_primal_dual """
+        args = (self.N, self.n_states, self.n_controls)
+        self.w, self.lam_x, self.lam_g = [v.ravel() for v in shift_primal_dual(self.w, self.lam_x, self.lam_g, *args)]
+        zeros = np.zeros(self.n_w)
+        for i in range(self.p.size):
+            dw, _, dlam = shift_primal_dual(self.dw_dp[:, i], zeros, self.dlam_dp[:, i], *args)
+            self.dw_dp[:, i] = dw.ravel()
+            self.dlam_dp[:, i] = dlam.ravel()
+        # the shifted plan belongs to its own first state
+        n_u = self.N*self.n_controls
+        self.p[:self.n_states] = self.w[n_u:n_u+self.n_states]
+
+    def predict(self, p):
+        """ first order prediction of (w, lam_x, lam_g) for the parameter p, lam_x is kept """
+        dp = np.ravel(p) - self.p
+        w = np.clip(self.w + self.dw_dp.dot(dp), self.lbx, self.ubx)
+        return w.reshape(-1, 1), self.lam_x.reshape(-1, 1), (self.lam_g + self.dlam_dp.dot(dp)).reshape(-1, 1)
@@ -5,8 +5,10 @@ import casadi as ca
 import casadi.tools as ca_tools
 
 import numpy as np
+import os
 import time
 from draw import Draw_MPC_point_stabilization_v1
+from explicit_mpc import DEFAULT_TABLE, ExplicitMPC, build_table
 
 def shift_movement(T, t0, x0, u, f):
     f_value = f(x0, u[:, 0])
@@ -22,6 +24,7 @@ if __name__ == '__main__':
     rob_diam = 0.3 # [m]
     v_max = 0.6
     omega_max = np.pi/4.0
+    use_table = False # first control from the explicit MPC table, the solver only where it is not confident
 
     x = ca.SX.sym('x')
     y = ca.SX.sym('y')
@@ -107,19 +110,35 @@ if __name__ == '__main__':
     init_control = ca.reshape(u0, -1, 1)
     res = solver(x0=init_control, p=c_p, lbg=lbg, lbx=lbx, ubg=ubg, ubx=ubx)
     lam_x_ = res['lam_x']
+    if use_table:
+        if not os.path.isfile(DEFAULT_TABLE):
+            build_table([-2.0, -2.0, -np.pi], [2.0, 2.0, np.pi], N=N, T=T, v_max=v_max, omega_max=omega_max)
+        table = ExplicitMPC(DEFAULT_TABLE)
+    table_ticks = 0
     ### inital test
     while(np.linalg.norm(x0-xs)>1e-2 and mpciter-sim_time/T<0.0 ):
         ## set parameter
         c_p = np.concatenate((x0, xs))
         init_control = ca.reshape(u0, -1, 1)
         t_ = time.time()
-        res = solver(x0=init_control, p=c_p, lbg=lbg, lbx=lbx, ubg=ubg, ubx=ubx, lam_x0=lam_x_)
-        lam_x_ = res['lam_x']
-        # res = solver(x0=init_control, p=c_p,)
-        # print(res['g'])
+        u_table, ok = table(x0) if use_table else (None, False)
+        if ok:
+            # interpolated plan and its predicted states, the first control is u_table
+            u_sol = ca.DM(table.plan(x0).T)
+            ff_value = ca.DM(table.trajectory(x0).T)
+            table_ticks += 1
+        else:
+            u_plan = table.plan(x0) if use_table else None
+            if u_plan is not None:
+                # the interpolated plan selects the same local solution as the table
+                init_control = ca.reshape(u_plan, -1, 1)
+            res = solver(x0=init_control, p=c_p, lbg=lbg, lbx=lbx, ubg=ubg, ubx=ubx, lam_x0=lam_x_)
+            lam_x_ = res['lam_x']
+            # res = solver(x0=init_control, p=c_p,)
+            # print(res['g'])
+            u_sol = ca.reshape(res['x'], n_controls, N) # one can only have this shape of the output
+            ff_value = ff(u_sol, c_p) # [n_states, N+1]
         index_t.append(time.time()- t_)
-        u_sol = ca.reshape(res['x'], n_controls, N) # one can only have this shape of the output
-        ff_value = ff(u_sol, c_p) # [n_states, N+1]
         x_c.append(ff_value)
         u_c.append(u_sol[:, 0])
         t_c.append(t0)
@@ -131,4 +150,6 @@ if __name__ == '__main__':
     t_v = np.array(index_t)
     print(t_v.mean())
     print((time.time() - start_time)/(mpciter))
+    if use_table:
+        print('table ticks {0}/{1}'.format(table_ticks, mpciter))
     draw_result = Draw_MPC_point_stabilization_v1(rob_diam=0.3, init_state=x0.full(), target_state=xs, robot_states=xx, export_fig=False)
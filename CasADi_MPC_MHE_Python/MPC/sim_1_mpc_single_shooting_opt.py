@@ -79,6 +79,14 @@ if __name__ == '__main__':
     final_state = np.array([1.5, 1.5, 0.0])
     opti.set_value(opt_xs, final_state)
 
+    ## compiled controller (x0, xs, u_guess, x_guess) -> (u_opt, x_opt), it skips the
+    ## Opti bookkeeping of set_value / set_initial / sol.value in every tick.
+    ## decision variables given as inputs are used as the initial guess
+    use_to_function = True
+    mpc_controller = opti.to_function('mpc_controller', [opt_x0, opt_xs, opt_controls, opt_states],
+                                      [opt_controls, opt_states], ['x0', 'xs', 'u_guess', 'x_guess'],
+                                      ['u_opt', 'x_opt'])
+
     t0 = 0
     init_state = np.array([0.0, 0.0, 0.0])
     current_state = init_state.copy()
@@ -94,17 +102,26 @@ if __name__ == '__main__':
     mpciter = 0
     start_time = time.time()
     index_t = []
+    tick_t = [] # set values + solve + read back
     while(np.linalg.norm(current_state-final_state)>1e-2 and mpciter-sim_time/T<0.0  ):
-        ## set parameter, here only update initial state of x (x0)
-        opti.set_value(opt_x0, current_state)
-        opti.set_initial(opt_controls, u0)
-        opti.set_initial(opt_states, next_states)
-        t_ = time.time()
-        ## solve the problem once again
-        sol = opti.solve()
-        index_t.append(time.time()- t_)
-        ## obtain the control input
-        u = sol.value(opt_controls)
+        t_tick = time.time()
+        if use_to_function:
+            t_ = time.time()
+            u, _ = mpc_controller(current_state, final_state, u0, next_states)
+            index_t.append(time.time()- t_)
+            u = u.full()
+        else:
+            ## set parameter, here only update initial state of x (x0)
+            opti.set_value(opt_x0, current_state)
+            opti.set_initial(opt_controls, u0)
+            opti.set_initial(opt_states, next_states)
+            t_ = time.time()
+            ## solve the problem once again
+            sol = opti.solve()
+            index_t.append(time.time()- t_)
+            ## obtain the control input
+            u = sol.value(opt_controls)
+        tick_t.append(time.time()- t_tick)
         u_c.append(u[0, :])
         t_c.append(t0)
         next_states_pred = prediction_state(x0=current_state, u=u, N=N, T=T)
@@ -117,6 +134,7 @@ if __name__ == '__main__':
     print((time.time()-start_time)/(mpciter))
     t_v = np.array(index_t)
     print(t_v.mean()) 
+    print('tick time (to_function={0}) {1}'.format(use_to_function, np.mean(tick_t)))
     print(mpciter)
     print('final error {}'.format(np.linalg.norm(final_state-current_state)))
     ## draw function
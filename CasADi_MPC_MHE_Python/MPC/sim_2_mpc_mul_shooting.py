@@ -7,15 +7,22 @@ import casadi.tools as ca_tools
 import numpy as np
 import time
 from draw import Draw_MPC_point_stabilization_v1
+from solver_cache import SolverCache
+from ocp_builder import build_mul_shooting_nlp, collocation_guess, make_bounds, make_params, n_blocks
+from plant import Plant
+from warm_start import WARM_START_OPTS, shift_move_blocks, shift_primal_dual
 
 
-def shift_movement(T, t0, x0, u, x_f, f):
-    f_value = f(x0, u[0, :])
-    st = x0 + T*f_value.full()
+def shift_movement(T, t0, x0, u, x_f, plant, blocks=None):
+    # plant.step runs the discretized model on floats, see plant.Plant
+    st = plant.step(x0, u[0, :])
     t = t0 + T
     # print(u[:,0])
     # u_end = np.concatenate((u[:, 1:], u[:, -1:]), axis=1)
-    u_end = np.concatenate((u[1:], u[-1:]))
+    if blocks is None:
+        u_end = np.concatenate((u[1:], u[-1:]))
+    else:
+        u_end = shift_move_blocks(u, blocks, u.shape[1]).reshape(u.shape)
     # x_f = np.concatenate((x_f[:, 1:], x_f[:, -1:]), axis=1)
     x_f = np.concatenate((x_f[1:], x_f[-1:]), axis=0)
 
@@ -28,6 +35,14 @@ if __name__ == '__main__':
     rob_diam = 0.3  # [m]
     v_max = 0.6
     omega_max = np.pi/4.0
+    use_codegen = False  # compile the NLP callbacks to C (cached shared library)
+    use_map = False  # build the horizon with Function.map instead of a Python loop
+    use_warm_start = True  # feed the shifted multipliers of the last solution back to IPOPT
+    blocks = None  # move blocking, e.g. [1, 1, 1, 2, 5, 10, 20, 60] holds u constant over each block
+    n_u = n_blocks(N, blocks)
+    integrator = 'euler'  # 'euler', 'rk4' or 'collocation' discretization of the prediction model
+    n_substeps = 1  # integrator steps per stage for euler / rk4, the plant step uses the same
+    degree = 3 if integrator == 'collocation' else 0  # collocation points per stage
 
     x = ca.SX.sym('x')
     y = ca.SX.sym('y')
@@ -50,51 +65,39 @@ if __name__ == '__main__':
     f = ca.Function('f', [states, controls], [rhs], [
                     'input_state', 'control_input'], ['rhs'])
 
-    # for MPC
-    U = ca.SX.sym('U', n_controls, N)
-
-    X = ca.SX.sym('X', n_states, N+1)
-
-    P = ca.SX.sym('P', n_states+n_states)
-
     # define
     Q = np.array([[1.0, 0.0, 0.0], [0.0, 5.0, 0.0], [0.0, 0.0, .1]])
     R = np.array([[0.5, 0.0], [0.0, 0.05]])
-    # cost function
-    obj = 0  # cost
-    g = []  # equal constrains
-    g.append(X[:, 0]-P[:3])
-    for i in range(N):
-        obj = obj + ca.mtimes([(X[:, i]-P[3:]).T, Q, X[:, i]-P[3:]]
-                              ) + ca.mtimes([U[:, i].T, R, U[:, i]])
-        x_next_ = f(X[:, i], U[:, i])*T + X[:, i]
-        g.append(X[:, i+1]-x_next_)
-
-    opt_variables = ca.vertcat(ca.reshape(U, -1, 1), ca.reshape(X, -1, 1))
-
-    nlp_prob = {'f': obj, 'x': opt_variables, 'p': P, 'g': ca.vertcat(*g)}
+
+    def build_nlp():
+        # Q, R are parameters of the NLP, the bounds are given per call
+        return build_mul_shooting_nlp(f, N, T, use_map=use_map, blocks=blocks, integrator=integrator,
+                                      n_substeps=n_substeps, degree=degree)
+
     opts_setting = {'ipopt.max_iter': 100, 'ipopt.print_level': 5   , 'print_time': 0,
                     'ipopt.acceptable_tol': 1e-8, 'ipopt.acceptable_obj_change_tol': 1e-6}
 
-    solver = ca.nlpsol('solver', 'ipopt', nlp_prob, opts_setting)
+    # the symbolic problem is only built if no solver for this definition is on disk
+    solver_cache = SolverCache()
+    problem_definition = {'model': 'unicycle', 'shooting': 'multiple', 'N': N, 'T': T, 'params': 'x0_xs_q_r',
+                          'use_map': use_map, 'blocks': blocks, 'integrator': integrator, 'n_substeps': n_substeps,
+                          'degree': degree}
+    solver = solver_cache.nlpsol('solver', problem_definition, build_nlp, opts_setting,
+                                 codegen=use_codegen)
+    # the first tick has no multipliers yet and is solved with the cold solver
+    cold_solver = solver
+    if use_warm_start:
+        solver = solver_cache.nlpsol('solver', problem_definition, build_nlp,
+                                     dict(opts_setting, **WARM_START_OPTS), codegen=use_codegen)
+    solver_cache.report()
 
     lbg = 0.0
     ubg = 0.0
-    lbx = []
-    ubx = []
-
-    for _ in range(N):
-        lbx.append(-v_max)
-        lbx.append(-omega_max)
-        ubx.append(v_max)
-        ubx.append(omega_max)
-    for _ in range(N+1):  # note that this is different with the method using structure
-        lbx.append(-2.0)
-        lbx.append(-2.0)
-        lbx.append(-np.inf)
-        ubx.append(2.0)
-        ubx.append(2.0)
-        ubx.append(np.inf)
+    # note that this is different with the method using structure
+    lbx, ubx = make_bounds(N, [-v_max, -omega_max], [v_max, omega_max],
+                           [-2.0, -2.0, -np.inf], [2.0, 2.0, np.inf], blocks, integrator=integrator, degree=degree)
+    # the plant is stepped with the model discretization, collocation has no explicit step and uses RK4
+    plant = Plant(f, T, 'rk4' if integrator == 'collocation' else integrator, n_substeps)
 
     # Simulation
     t0 = 0.0
@@ -103,7 +106,7 @@ if __name__ == '__main__':
     x_m = np.zeros((n_states, N+1))
     next_states = x_m.copy().T
     xs = np.array([1.5, 1.5, 0.0]).reshape(-1, 1)  # final state
-    u0 = np.array([1, 2]*N).reshape(-1, 2).T  # np.ones((N, 2)) # controls
+    u0 = np.array([1, 2]*n_u).reshape(-1, 2).T  # np.ones((N, 2)) # controls
     x_c = []  # contains for the history of the state
     u_c = []
     t_c = []  # for the time
@@ -114,30 +117,39 @@ if __name__ == '__main__':
     mpciter = 0
     start_time = time.time()
     index_t = []
+    iter_c = []  # IPOPT iterations per step
+    lam_x0 = 0.0
+    lam_g0 = 0.0
     # inital test
     while(np.linalg.norm(x0-xs) > 1e-2 and mpciter-sim_time/T < 0.0):
         # set parameter
-        c_p = np.concatenate((x0, xs))
-        init_control = np.concatenate((u0.reshape(-1, 1), next_states.reshape(-1, 1)))
+        c_p = make_params(x0, xs, Q, R)
+        init_control = np.concatenate((u0.reshape(-1, 1), next_states.reshape(-1, 1),
+                                       collocation_guess(next_states, degree)))
         t_ = time.time()
-        res = solver(x0=init_control, p=c_p, lbg=lbg,
-                     lbx=lbx, ubg=ubg, ubx=ubx)
+        tick_solver = cold_solver if mpciter == 0 else solver
+        res = tick_solver(x0=init_control, p=c_p, lbg=lbg,
+                          lbx=lbx, ubg=ubg, ubx=ubx, lam_x0=lam_x0, lam_g0=lam_g0)
         index_t.append(time.time() - t_)
+        iter_c.append(tick_solver.stats()['iter_count'])
+        if use_warm_start:
+            # multipliers are shifted by one stage like u and x in shift_movement
+            _, lam_x0, lam_g0 = shift_primal_dual(res['x'], res['lam_x'], res['lam_g'], N, n_states, n_controls,
+                                                  blocks=blocks, degree=degree)
         # the feedback is in the series [u0, x0, u1, x1, ...]
         estimated_opt = res['x'].full()
-        u0 = estimated_opt[:200].reshape(N, n_controls)  # (N, n_controls)
-        x_m = estimated_opt[200:].reshape(N+1, n_states)  # (N+1, n_states)
+        u0 = estimated_opt[:n_u*n_controls].reshape(n_u, n_controls)  # (n_u, n_controls)
+        x_m = estimated_opt[n_u*n_controls:n_u*n_controls+(N+1)*n_states].reshape(N+1, n_states)  # (N+1, n_states)
         x_c.append(x_m.T)
         u_c.append(u0[0, :])
         t_c.append(t0)
-        t0, x0, u0, next_states = shift_movement(T, t0, x0, u0, x_m, f)
-        x0 = ca.reshape(x0, -1, 1)
-        x0 = x0.full()
+        t0, x0, u0, next_states = shift_movement(T, t0, x0, u0, x_m, plant, blocks)
         xx.append(x0)
         # print(u0[0])
         mpciter = mpciter + 1
     t_v = np.array(index_t)
     print(t_v.mean())
+    print('mean iterations {0:.2f} (warm start {1})'.format(np.mean(iter_c), use_warm_start))
     print((time.time() - start_time)/(mpciter))
 
     draw_result = Draw_MPC_point_stabilization_v1(
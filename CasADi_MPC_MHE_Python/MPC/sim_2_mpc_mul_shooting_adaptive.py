@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Adaptive horizon (horizon_bank.py) against fixed horizons in the sim_2
+point stabilization loop. A fixed horizon is a bank with a single solver,
+so both variants run the same code (primal-dual warm start included).
+Closed-loop CPU time, ticks to the target, closed-loop cost and the
+horizons used are reported.
+"""
+
+import time
+
+import numpy as np
+
+from horizon_bank import HorizonBank
+from ocp_builder import unicycle_model
+
+
+def closed_loop(bank, f, T, x0, xs, Q, R, sim_time=20.0):
+    mpciter = 0
+    cost = 0.0
+    t_cpu = time.process_time()
+    while(np.linalg.norm(x0-xs) > 1e-2 and mpciter-sim_time/T < 0.0):
+        u, _ = bank(x0, xs, Q, R)
+        e = (x0 - xs).ravel()
+        cost += e.dot(Q).dot(e) + u[0].dot(R).dot(u[0])
+        x0 = x0 + T*f(x0, u[0]).full()
+        mpciter = mpciter + 1
+    return mpciter, cost, time.process_time() - t_cpu, x0
+
+
+if __name__ == '__main__':
+    T = 0.2  # sampling time [s]
+    v_max = 0.6
+    omega_max = np.pi/4.0
+    horizons = [10, 20, 30, 50, 100]
+
+    f = unicycle_model()
+    Q = np.array([[1.0, 0.0, 0.0], [0.0, 5.0, 0.0], [0.0, 0.0, .1]])
+    R = np.array([[0.5, 0.0], [0.0, 0.05]])
+    opts_setting = {'ipopt.max_iter': 100, 'ipopt.print_level': 0, 'print_time': 0,
+                    'ipopt.acceptable_tol': 1e-8, 'ipopt.acceptable_obj_change_tol': 1e-6}
+    limits = ([-v_max, -omega_max], [v_max, omega_max], [-2.0, -2.0, -np.inf], [2.0, 2.0, np.inf])
+    x0 = np.array([0.0, 0.0, 0.0]).reshape(-1, 1)
+    xs = np.array([1.5, 1.5, 0.0]).reshape(-1, 1)
+
+    adaptive = HorizonBank(f, T, horizons, *limits, rates=[v_max, v_max, omega_max], opts=opts_setting)
+    print('bank of {0} horizons built in {1:.2f} s'.format(len(horizons), adaptive.build_time))
+    print('{0:>10s} {1:>6s} {2:>8s} {3:>8s} {4:>10s}'.format('horizon', 'ticks', 'cost', 'CPU s', 'ms / tick'))
+    for N in [50, 100]:
+        fixed = HorizonBank(f, T, [N], *limits, rates=[v_max, v_max, omega_max], opts=opts_setting)
+        ticks, cost, t_cpu, _ = closed_loop(fixed, f, T, x0, xs, Q, R)
+        print('{0:>10s} {1:6d} {2:8.3f} {3:8.2f} {4:10.2f}'.format(
+            'N={0}'.format(N), ticks, cost, t_cpu, t_cpu/ticks*1e3))
+    ticks, cost, t_cpu, _ = closed_loop(adaptive, f, T, x0, xs, Q, R)
+    print('{0:>10s} {1:6d} {2:8.3f} {3:8.2f} {4:10.2f}'.format('adaptive', ticks, cost, t_cpu, t_cpu/ticks*1e3))
+    used = adaptive.horizon_c
+    print('horizons used: ' + ', '.join('N={0} x{1}'.format(N, used.count(N)) for N in horizons if N in used))
+    print('switches: {0}'.format(sum(1 for a, b in zip(used[:-1], used[1:]) if a != b)))
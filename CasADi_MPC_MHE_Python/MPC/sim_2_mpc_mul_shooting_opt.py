@@ -87,6 +87,14 @@ if __name__ == '__main__':
     final_state = np.array([1.5, 1.5, 0.0])
     opti.set_value(opt_xs, final_state)
 
+    # compiled controller (x0, xs, u_guess, x_guess) -> (u_opt, x_opt), it skips the
+    # Opti bookkeeping of set_value / set_initial / sol.value in every tick.
+    # decision variables given as inputs are used as the initial guess
+    use_to_function = True
+    mpc_controller = opti.to_function('mpc_controller', [opt_x0, opt_xs, opt_controls, opt_states],
+                                      [opt_controls, opt_states], ['x0', 'xs', 'u_guess', 'x_guess'],
+                                      ['u_opt', 'x_opt'])
+
     t0 = 0
     init_state = np.array([0.0, 0.0, 0.0])
     u0 = np.zeros((N, 2))
@@ -102,23 +110,33 @@ if __name__ == '__main__':
     mpciter = 0
     start_time = time.time()
     index_t = []
+    tick_t = []  # set values + solve + read back
     while(np.linalg.norm(current_state-final_state) > 1e-2 and mpciter-sim_time/T < 0.0):
-        # set parameter, here only update initial state of x (x0)
-        opti.set_value(opt_x0, current_state)
-        # set optimizing target withe init guess
-        opti.set_initial(opt_controls, u0)  # (N, 2)
-        opti.set_initial(opt_states, next_states)  # (N+1, 3)
-        # solve the problem once again
-        t_ = time.time()
-        sol = opti.solve()
-        index_t.append(time.time() - t_)
-        ## opti.set_initial(opti.lam_g, sol.value(opti.lam_g))
-        # obtain the control input
-        u_res = sol.value(opt_controls)
+        t_tick = time.time()
+        if use_to_function:
+            t_ = time.time()
+            u_res, next_states_pred = mpc_controller(current_state, final_state, u0, next_states)
+            index_t.append(time.time() - t_)
+            u_res = u_res.full()
+            next_states_pred = next_states_pred.full()
+        else:
+            # set parameter, here only update initial state of x (x0)
+            opti.set_value(opt_x0, current_state)
+            # set optimizing target withe init guess
+            opti.set_initial(opt_controls, u0)  # (N, 2)
+            opti.set_initial(opt_states, next_states)  # (N+1, 3)
+            # solve the problem once again
+            t_ = time.time()
+            sol = opti.solve()
+            index_t.append(time.time() - t_)
+            ## opti.set_initial(opti.lam_g, sol.value(opti.lam_g))
+            # obtain the control input
+            u_res = sol.value(opt_controls)
+            # prediction_state(x0=current_state, u=u_res, N=N, T=T)
+            next_states_pred = sol.value(opt_states)
+        tick_t.append(time.time() - t_tick)
         u_c.append(u_res[0, :])
         t_c.append(t0)
-        # prediction_state(x0=current_state, u=u_res, N=N, T=T)
-        next_states_pred = sol.value(opt_states)
         # next_states_pred = prediction_state(x0=current_state, u=u_res, N=N, T=T)
         x_c.append(next_states_pred)
         # for next loop
@@ -128,6 +146,7 @@ if __name__ == '__main__':
         xx.append(current_state)
     t_v = np.array(index_t)
     print(t_v.mean())
+    print('tick time (to_function={0}) {1}'.format(use_to_function, np.mean(tick_t)))
     print((time.time() - start_time)/(mpciter))
     # after loop
     print(mpciter)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+One multiple shooting solver for every scenario: Q and R are NLP parameters,
+v_max / omega_max and the state box are lbx / ubx vectors. A weight sweep and
+a fleet of robots with different limits reuse the same solver, only the
+first build pays the construction cost.
+"""
+
+import casadi as ca
+import numpy as np
+import time
+
+from ocp_builder import build_mul_shooting_nlp, make_bounds, make_params, unicycle_model
+
+
+def shift_movement(T, t0, x0, u, x_f, f):
+    f_value = f(x0, u[:, 0])
+    st = x0 + T*f_value.full()
+    t = t0 + T
+    u_end = np.concatenate((u[:, 1:], u[:, -1:]), axis=1)
+    x_f = np.concatenate((x_f[:, 1:], x_f[:, -1:]), axis=1)
+
+    return t, st, u_end, x_f
+
+
+def run_scenario(solver, f, N, T, x0, xs, Q, R, lbx, ubx, sim_time=20.0):
+    n_states = f.size1_in(0)
+    n_controls = f.size1_in(1)
+    t0 = 0.0
+    u0 = np.zeros((n_controls, N))
+    next_states = np.tile(x0, (1, N+1))
+    mpciter = 0
+    index_t = []
+    while(np.linalg.norm(x0-xs) > 1e-2 and mpciter-sim_time/T < 0.0):
+        c_p = make_params(x0, xs, Q, R)
+        init_control = np.concatenate((u0.T.reshape(-1, 1), next_states.T.reshape(-1, 1)))
+        t_ = time.time()
+        res = solver(x0=init_control, p=c_p, lbg=0.0, lbx=lbx, ubg=0.0, ubx=ubx)
+        index_t.append(time.time() - t_)
+        estimated_opt = res['x'].full()
+        u0 = estimated_opt[:n_controls*N].reshape(N, n_controls).T
+        x_m = estimated_opt[n_controls*N:].reshape(N+1, n_states).T
+        t0, x0, u0, next_states = shift_movement(T, t0, x0, u0, x_m, f)
+        mpciter = mpciter + 1
+    return mpciter, np.array(index_t), x0
+
+
+if __name__ == '__main__':
+    T = 0.2  # sampling time [s]
+    N = 100  # prediction horizon
+
+    f = unicycle_model()
+    opts_setting = {'ipopt.max_iter': 100, 'ipopt.print_level': 0, 'print_time': 0,
+                    'ipopt.acceptable_tol': 1e-8, 'ipopt.acceptable_obj_change_tol': 1e-6}
+    t_ = time.time()
+    solver = ca.nlpsol('solver', 'ipopt', build_mul_shooting_nlp(f, N, T), opts_setting)
+    print('solver built once in {0:.1f} ms'.format((time.time() - t_)*1e3))
+
+    x0 = np.array([0.0, 0.0, 0.0]).reshape(-1, 1)
+    xs = np.array([1.5, 1.5, 0.0]).reshape(-1, 1)
+    x_min = [-2.0, -2.0, -np.inf]
+    x_max = [2.0, 2.0, np.inf]
+
+    # weight sweep, same limits
+    Q = np.diag([1.0, 5.0, 0.1])
+    lbx, ubx = make_bounds(N, [-0.6, -np.pi/4.0], [0.6, np.pi/4.0], x_min, x_max)
+    for r_v in [0.05, 0.5, 5.0]:
+        R = np.diag([r_v, 0.05])
+        steps, solve_t, x_end = run_scenario(solver, f, N, T, x0, xs, Q, R, lbx, ubx)
+        print('R = diag({0}, 0.05): {1} steps, mean solve {2:.2f} ms, final error {3:.3e}'.format(
+            r_v, steps, solve_t.mean()*1e3, np.linalg.norm(x_end-xs)))
+
+    # fleet with different velocity limits, same weights
+    R = np.diag([0.5, 0.05])
+    for v_max, omega_max in [(0.3, np.pi/8.0), (0.6, np.pi/4.0), (1.0, np.pi/2.0)]:
+        lbx, ubx = make_bounds(N, [-v_max, -omega_max], [v_max, omega_max], x_min, x_max)
+        steps, solve_t, x_end = run_scenario(solver, f, N, T, x0, xs, Q, R, lbx, ubx)
+        print('v_max {0:.1f}, omega_max {1:.2f}: {2} steps, mean solve {3:.2f} ms, final error {4:.3e}'.format(
+            v_max, omega_max, steps, solve_t.mean()*1e3, np.linalg.norm(x_end-xs)))
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+sim_2 point stabilization with the tangential (sensitivity) predictor of
+sensitivity.py between full solves. IPOPT solves every solve_every ticks,
+warm started with the prediction of the last solution for the new x0, the
+ticks in between apply the prediction directly.
+"""
+
+import casadi as ca
+import numpy as np
+import time
+
+from draw import Draw_MPC_point_stabilization_v1
+from ocp_builder import build_mul_shooting_nlp, make_bounds, make_params, unicycle_model
+from plant import Plant
+from sensitivity import SensitivityPredictor
+from sim_2_mpc_mul_shooting import shift_movement
+from warm_start import WARM_START_OPTS
+
+
+if __name__ == '__main__':
+    T = 0.2  # sampling time [s]
+    N = 100  # prediction horizon
+    v_max = 0.6
+    omega_max = np.pi/4.0
+    solve_every = 2  # full IPOPT solve every solve_every ticks, the predictor in between
+
+    f = unicycle_model()
+    n_states = 3
+    n_controls = 2
+    Q = np.array([[1.0, 0.0, 0.0], [0.0, 5.0, 0.0], [0.0, 0.0, .1]])
+    R = np.array([[0.5, 0.0], [0.0, 0.05]])
+
+    nlp = build_mul_shooting_nlp(f, N, T)
+    opts_setting = {'ipopt.max_iter': 100, 'ipopt.print_level': 0, 'print_time': 0,
+                    'ipopt.acceptable_tol': 1e-8, 'ipopt.acceptable_obj_change_tol': 1e-6}
+    # the first tick has no multipliers yet and is solved with the cold solver
+    cold_solver = ca.nlpsol('solver', 'ipopt', nlp, opts_setting)
+    solver = ca.nlpsol('solver', 'ipopt', nlp, dict(opts_setting, **WARM_START_OPTS))
+
+    lbg = 0.0
+    ubg = 0.0
+    lbx, ubx = make_bounds(N, [-v_max, -omega_max], [v_max, omega_max],
+                           [-2.0, -2.0, -np.inf], [2.0, 2.0, np.inf])
+    plant = Plant(f, T)
+    predictor = SensitivityPredictor(nlp, N, n_states, n_controls, lbx, ubx, lbg, ubg)
+
+    # Simulation
+    t0 = 0.0
+    x0 = np.array([0.0, 0.0, 0.0]).reshape(-1, 1)  # initial state
+    x0_ = x0.copy()
+    next_states = np.zeros((N+1, n_states))
+    xs = np.array([1.5, 1.5, 0.0]).reshape(-1, 1)  # final state
+    u0 = np.array([1, 2]*N).reshape(-1, 2)  # controls
+    xx = []
+    sim_time = 20.0
+
+    # start MPC
+    mpciter = 0
+    start_time = time.time()
+    index_t = []
+    iter_c = []  # IPOPT iterations per tick, 0 for a predictor tick
+    update_t = []  # sensitivity update time per full solve
+    lam_x0 = 0.0
+    lam_g0 = 0.0
+    while(np.linalg.norm(x0-xs) > 1e-2 and mpciter-sim_time/T < 0.0):
+        c_p = make_params(x0, xs, Q, R)
+        t_ = time.time()
+        if mpciter % solve_every != 0:
+            # no solve, first order update of the last full solution for the new x0
+            estimated_opt, _, _ = predictor.predict(c_p)
+            index_t.append(time.time() - t_)
+            iter_c.append(0)
+        else:
+            if mpciter > 0:
+                # the predicted solution replaces the shifted guess
+                init_control, lam_x0, lam_g0 = predictor.predict(c_p)
+            else:
+                init_control = np.concatenate((u0.reshape(-1, 1), next_states.reshape(-1, 1)))
+            tick_solver = cold_solver if mpciter == 0 else solver
+            res = tick_solver(x0=init_control, p=c_p, lbg=lbg, lbx=lbx, ubg=ubg, ubx=ubx,
+                              lam_x0=lam_x0, lam_g0=lam_g0)
+            index_t.append(time.time() - t_)
+            iter_c.append(tick_solver.stats()['iter_count'])
+            t_ = time.time()
+            predictor.update(res, c_p)
+            update_t.append(time.time() - t_)
+            estimated_opt = res['x'].full()
+        u0 = estimated_opt[:N*n_controls].reshape(N, n_controls)
+        x_m = estimated_opt[N*n_controls:].reshape(N+1, n_states)
+        t0, x0, u0, next_states = shift_movement(T, t0, x0, u0, x_m, plant)
+        xx.append(x0)
+        # the next prediction corrects the shifted plan
+        predictor.shift()
+        mpciter = mpciter + 1
+    predict_t = [t for t, it in zip(index_t, iter_c) if it == 0]
+    print('predictor {0:.3f} ms, full solve {1:.2f} ms, sensitivity update {2:.2f} ms'.format(
+        np.mean(predict_t)*1e3, np.mean([t for t, it in zip(index_t, iter_c) if it > 0])*1e3,
+        np.mean(update_t)*1e3))
+    print((time.time() - start_time)/(mpciter))
+
+    draw_result = Draw_MPC_point_stabilization_v1(
+        rob_diam=0.3, init_state=x0_, target_state=xs, robot_states=xx)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+sim_2 point stabilization with the real-time iteration of rti.py: the first
+tick is a full IPOPT solve, every later tick is one QP (feedback) for the
+measured x0, and the linearization around the shifted trajectory
+(preparation) runs after the plant step, before the next state is known.
+"""
+
+import casadi as ca
+import numpy as np
+import time
+
+from draw import Draw_MPC_point_stabilization_v1
+from ocp_builder import build_mul_shooting_nlp, make_bounds, make_params, unicycle_model
+from plant import Plant
+from rti import RTIController
+from sim_2_mpc_mul_shooting import shift_movement
+
+
+if __name__ == '__main__':
+    T = 0.2  # sampling time [s]
+    N = 100  # prediction horizon
+    v_max = 0.6
+    omega_max = np.pi/4.0
+
+    f = unicycle_model()
+    n_states = 3
+    n_controls = 2
+    Q = np.array([[1.0, 0.0, 0.0], [0.0, 5.0, 0.0], [0.0, 0.0, .1]])
+    R = np.array([[0.5, 0.0], [0.0, 0.05]])
+
+    nlp = build_mul_shooting_nlp(f, N, T)
+    opts_setting = {'ipopt.max_iter': 100, 'ipopt.print_level': 0, 'print_time': 0,
+                    'ipopt.acceptable_tol': 1e-8, 'ipopt.acceptable_obj_change_tol': 1e-6}
+    solver = ca.nlpsol('solver', 'ipopt', nlp, opts_setting)
+
+    lbg = 0.0
+    ubg = 0.0
+    lbx, ubx = make_bounds(N, [-v_max, -omega_max], [v_max, omega_max],
+                           [-2.0, -2.0, -np.inf], [2.0, 2.0, np.inf])
+    plant = Plant(f, T)
+    rti = RTIController(nlp, N, n_states, n_controls, lbx, ubx, lbg, ubg)
+
+    # Simulation
+    t0 = 0.0
+    x0 = np.array([0.0, 0.0, 0.0]).reshape(-1, 1)  # initial state
+    x0_ = x0.copy()
+    next_states = np.zeros((N+1, n_states))
+    xs = np.array([1.5, 1.5, 0.0]).reshape(-1, 1)  # final state
+    u0 = np.array([1, 2]*N).reshape(-1, 2)  # controls
+    xx = []
+    sim_time = 20.0
+
+    # start MPC
+    mpciter = 0
+    start_time = time.time()
+    index_t = []
+    prep_t = []  # RTI preparation time per step
+    while(np.linalg.norm(x0-xs) > 1e-2 and mpciter-sim_time/T < 0.0):
+        c_p = make_params(x0, xs, Q, R)
+        t_ = time.time()
+        if mpciter > 0:
+            # feedback phase, only the QP for the measured x0
+            rti.feedback(x0)
+            index_t.append(time.time() - t_)
+            u0, x_m = rti.trajectory()
+        else:
+            init_control = np.concatenate((u0.reshape(-1, 1), next_states.reshape(-1, 1)))
+            res = solver(x0=init_control, p=c_p, lbg=lbg, lbx=lbx, ubg=ubg, ubx=ubx)
+            index_t.append(time.time() - t_)
+            rti.initialize(res['x'])
+            estimated_opt = res['x'].full()
+            u0 = estimated_opt[:N*n_controls].reshape(N, n_controls)
+            x_m = estimated_opt[N*n_controls:].reshape(N+1, n_states)
+        t0, x0, u0, next_states = shift_movement(T, t0, x0, u0, x_m, plant)
+        xx.append(x0)
+        # preparation phase, linearize around the shifted trajectory before the next state arrives
+        t_ = time.time()
+        rti.shift()
+        rti.preparation(c_p)
+        prep_t.append(time.time() - t_)
+        mpciter = mpciter + 1
+    print('RTI feedback {0:.2f} ms, preparation {1:.2f} ms'.format(
+        np.mean(index_t[1:])*1e3, np.mean(prep_t)*1e3))
+    print((time.time() - start_time)/(mpciter))
+
+    draw_result = Draw_MPC_point_stabilization_v1(
+        rob_diam=0.3, init_state=x0_, target_state=xs, robot_states=xx)
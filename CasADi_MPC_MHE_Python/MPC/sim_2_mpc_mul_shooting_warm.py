@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Primal only against primal-dual warm starting in the sim_2 closed loop.
+The multipliers of the last solution are shifted by one stage and given to
+IPOPT as lam_x0 / lam_g0 together with the warm start options.
+Iterations and solve time are reported per step.
+"""
+
+import casadi as ca
+import numpy as np
+import time
+
+from ocp_builder import build_mul_shooting_nlp, make_bounds, make_params, unicycle_model
+from warm_start import WARM_START_OPTS, shift_primal_dual
+
+
+def closed_loop(solver, f, N, T, x0, xs, Q, R, lbx, ubx, warm_solver=None, sim_time=20.0):
+    # the first tick has no multipliers yet and always uses the cold solver
+    n_states = f.size1_in(0)
+    n_controls = f.size1_in(1)
+    opt_x0 = np.concatenate((np.zeros(N*n_controls), np.tile(x0.ravel(), N+1))).reshape(-1, 1)
+    lam_x0 = 0.0
+    lam_g0 = 0.0
+    mpciter = 0
+    iterations = []
+    index_t = []
+    while(np.linalg.norm(x0-xs) > 1e-2 and mpciter-sim_time/T < 0.0):
+        c_p = make_params(x0, xs, Q, R)
+        t_ = time.time()
+        if warm_solver is not None and mpciter > 0:
+            tick_solver = warm_solver
+            res = tick_solver(x0=opt_x0, lam_x0=lam_x0, lam_g0=lam_g0, p=c_p, lbg=0.0, ubg=0.0, lbx=lbx, ubx=ubx)
+        else:
+            tick_solver = solver
+            res = tick_solver(x0=opt_x0, p=c_p, lbg=0.0, ubg=0.0, lbx=lbx, ubx=ubx)
+        index_t.append(time.time() - t_)
+        iterations.append(tick_solver.stats()['iter_count'])
+        u_first = res['x'].full()[:n_controls]
+        # plant step and the shifted guess for the next tick
+        x0 = x0 + T*f(x0, u_first).full()
+        opt_x0, lam_x0, lam_g0 = shift_primal_dual(res['x'], res['lam_x'], res['lam_g'], N, n_states, n_controls)
+        mpciter = mpciter + 1
+    return np.array(iterations), np.array(index_t), x0
+
+
+if __name__ == '__main__':
+    T = 0.2  # sampling time [s]
+    N = 100  # prediction horizon
+    v_max = 0.6
+    omega_max = np.pi/4.0
+
+    f = unicycle_model()
+    nlp_prob = build_mul_shooting_nlp(f, N, T)
+    opts_setting = {'ipopt.max_iter': 100, 'ipopt.print_level': 0, 'print_time': 0,
+                    'ipopt.acceptable_tol': 1e-8, 'ipopt.acceptable_obj_change_tol': 1e-6}
+    warm_opts_setting = dict(opts_setting, **WARM_START_OPTS)
+    solver = ca.nlpsol('solver', 'ipopt', nlp_prob, opts_setting)
+    warm_solver = ca.nlpsol('solver', 'ipopt', nlp_prob, warm_opts_setting)
+
+    lbx, ubx = make_bounds(N, [-v_max, -omega_max], [v_max, omega_max],
+                           [-2.0, -2.0, -np.inf], [2.0, 2.0, np.inf])
+    Q = np.diag([1.0, 5.0, 0.1])
+    R = np.diag([0.5, 0.05])
+    x0 = np.array([0.0, 0.0, 0.0]).reshape(-1, 1)
+    xs = np.array([1.5, 1.5, 0.0]).reshape(-1, 1)
+
+    cold_iter, cold_t, cold_x = closed_loop(solver, f, N, T, x0, xs, Q, R, lbx, ubx)
+    warm_iter, warm_t, warm_x = closed_loop(solver, f, N, T, x0, xs, Q, R, lbx, ubx, warm_solver)
+
+    print('step  iter (primal / primal-dual)   solve ms (primal / primal-dual)')
+    for i in range(min(len(cold_iter), len(warm_iter))):
+        print('{0:4d}  {1:6d} / {2:<6d}               {3:7.2f} / {4:<7.2f}'.format(
+            i, cold_iter[i], warm_iter[i], cold_t[i]*1e3, warm_t[i]*1e3))
+    print('steps           {0} / {1}'.format(len(cold_iter), len(warm_iter)))
+    print('mean iterations {0:.2f} / {1:.2f} ({2:.1f}% fewer)'.format(
+        cold_iter.mean(), warm_iter.mean(), 100.0*(1.0 - warm_iter.mean()/cold_iter.mean())))
+    print('mean solve time {0:.2f} ms / {1:.2f} ms ({2:.1f}% less)'.format(
+        cold_t.mean()*1e3, warm_t.mean()*1e3, 100.0*(1.0 - warm_t.mean()/cold_t.mean())))
+    print('final error     {0:.3e} / {1:.3e}'.format(np.linalg.norm(cold_x-xs), np.linalg.norm(warm_x-xs)))
@@ -6,11 +6,15 @@ import casadi.tools as ca_tools
 
 import numpy as np
 import time
+from deadline import DeadlineSolver
 from draw import Draw_MPC_Obstacle
+from mppi import MPPI
+from multi_start import MultiStartSolver, detour_guess
+from ocp_builder import build_mul_shooting_nlp, make_bounds, make_g_bounds, make_params, n_slacks, slack_usage
+from plant import Plant
 
-def shift_movement(T, t0, x0, u, x_f, f):
-    f_value = f(x0, u[:, 0])
-    st = x0 + T*f_value.full()
+def shift_movement(T, t0, x0, u, x_f, plant):
+    st = plant.step(x0, u[:, 0])
     t = t0 + T
     u_end = np.concatenate((u[:, 1:], u[:, -1:]), axis=1)
     x_f = np.concatenate((x_f[:, 1:], x_f[:, -1:]), axis=1)
@@ -42,65 +46,43 @@ if __name__ == '__main__':
 
     ## function
     f = ca.Function('f', [states, controls], [rhs], ['input_state', 'control_input'], ['rhs'])
-
-    ## for MPC
-    U = ca.SX.sym('U', n_controls, N)
-
-    X = ca.SX.sym('X', n_states, N+1)
-
-    P = ca.SX.sym('P', n_states+n_states)
-
+    plant_substeps = 1 # Euler steps of the simulated robot per sampling time
+    plant = Plant(f, T, n_substeps=plant_substeps)
 
     ### define
     Q = np.array([[1.0, 0.0, 0.0],[0.0, 5.0, 0.0],[0.0, 0.0, .1]])
     R = np.array([[0.5, 0.0], [0.0, 0.05]])
-    #### cost function
-    obj = 0 #### cost
-    g = [] # equal constrains
-    g.append(X[:, 0]-P[:3])
-    for i in range(N):
-        obj = obj + ca.mtimes([(X[:, i]-P[3:]).T, Q, X[:, i]-P[3:]]) + ca.mtimes([U[:, i].T, R, U[:, i]])
-        x_next_ = f(X[:, i], U[:, i])*T +X[:, i]
-        g.append(X[:, i+1]-x_next_)
     #### constraints
     obs_x = 0.5
     obs_y = 0.5
     obs_diam = 0.3
-    for i in range(N+1):
-        g.append(ca.sqrt((X[0, i]-obs_x)**2+(X[1, i]-obs_y)**2)) # should be smaller als 0.0
-    opt_variables = ca.vertcat( ca.reshape(U, -1, 1), ca.reshape(X, -1, 1))
-
-    nlp_prob = {'f': obj, 'x': opt_variables, 'p':P, 'g':ca.vertcat(*g)}
+    use_map = False # apply stage cost / defects / obstacle distance with Function.map instead of a loop
+    soft = () # e.g. ('obstacles', 'states'), constraint groups with L1 + quadratic penalized slacks
+    n_s = n_slacks(N, [(obs_x, obs_y)], soft)
+    ## cost function and the multiple shooting constraints, the obstacle distance is appended to g
+    nlp_prob = build_mul_shooting_nlp(f, N, T, use_map=use_map, obstacles=[(obs_x, obs_y)], soft=soft)
     opts_setting = {'ipopt.max_iter':100, 'ipopt.print_level':0, 'print_time':0, 'ipopt.acceptable_tol':1e-8, 'ipopt.acceptable_obj_change_tol':1e-6}
 
-    solver = ca.nlpsol('solver', 'ipopt', nlp_prob, opts_setting)
-
-    lbg = []
-    ubg = []
-    lbx = []
-    ubx = []
-    for _ in range(N+1):
-        lbg.append(0.0)
-        lbg.append(0.0)
-        lbg.append(0.0)
-        ubg.append(0.0)
-        ubg.append(0.0)
-        ubg.append(0.0)
-    for _ in range(N+1):
-        lbg.append(0.3)
-        ubg.append(np.inf)
-    for _ in range(N):
-        lbx.append(-v_max)
-        lbx.append(-omega_max)
-        ubx.append(v_max)
-        ubx.append(omega_max)
-    for _ in range(N+1): # note that this is different with the method using structure
-        lbx.append(-2.0)
-        lbx.append(-2.0)
-        lbx.append(-np.inf)
-        ubx.append(2.0)
-        ubx.append(2.0)
-        ubx.append(np.inf)
+    tick_budget = None # [s] per tick, None waits for IPOPT; on a miss the best feasible iterate or the shifted plan is used
+    multi_start = False # solve from the shifted plan and from detours left / right of the obstacle, keep the best
+    controller = 'ipopt' # 'mppi' samples around the shifted plan instead, no IPOPT
+    if controller == 'mppi':
+        mppi = MPPI('unicycle', N, T, Q, R, [-v_max, -omega_max], [v_max, omega_max], obstacles=[(obs_x, obs_y)],
+                    min_distance=[rob_diam/2.+obs_diam/2.], x_min=[-2.0, -2.0, -np.inf], x_max=[2.0, 2.0, np.inf],
+                    budget=tick_budget)
+    elif multi_start:
+        ms_solver = MultiStartSolver(nlp_prob, opts_setting, 3, 'thread', tick_budget)
+    elif tick_budget is None:
+        solver = ca.nlpsol('solver', 'ipopt', nlp_prob, opts_setting)
+    else:
+        deadline_solver = DeadlineSolver(nlp_prob, N, n_states, n_controls, tick_budget, opts_setting)
+
+    ## distance should be larger than the sum of both radii
+    lbg, ubg = make_g_bounds(f, N, [(obs_x, obs_y)], [rob_diam/2.+obs_diam/2.], soft,
+                             [-2.0, -2.0, -np.inf], [2.0, 2.0, np.inf])
+    # note that this is different with the method using structure
+    lbx, ubx = make_bounds(N, [-v_max, -omega_max], [v_max, omega_max], [-2.0, -2.0, -np.inf], [2.0, 2.0, np.inf],
+                           soft=soft, obstacles=[(obs_x, obs_y)])
 
     # Simulation
     t0 = 0.0
@@ -120,28 +102,54 @@ if __name__ == '__main__':
     mpciter = 0
     start_time = time.time()
     index_t = []
+    slack_c = [] # largest slack per soft constraint group and tick
     while(np.linalg.norm(x0-xs)>1e-2 and mpciter-sim_time/T<0.0 and mpciter<50):
         ## set parameter
-        c_p = np.concatenate((x0, xs))
+        c_p = make_params(x0, xs, Q, R)
         # print('{0}'.format(next_states))
         # print('{0}'.format(next_states.T.reshape(-1, 1)[:6]))
-        init_control = np.concatenate((u0.T.reshape(-1, 1), next_states.T.reshape(-1, 1)))
+        init_control = np.concatenate((u0.T.reshape(-1, 1), next_states.T.reshape(-1, 1), np.zeros((n_s, 1))))
         t_ = time.time()
-        res = solver(x0=init_control, p=c_p, lbg=lbg, lbx=lbx, ubg=ubg, ubx=ubx)
+        if controller == 'mppi':
+            u_plan, x_plan = mppi(x0, xs, u0.T if mpciter > 0 else None)
+            estimated_opt = np.concatenate((u_plan.ravel(), x_plan.ravel())).reshape(-1, 1)
+        elif multi_start:
+            clearance = 1.5*(rob_diam/2.+obs_diam/2.)
+            guesses = {'shifted': init_control,
+                       'left': np.concatenate((detour_guess(x0, xs, (obs_x, obs_y), clearance, 1, N, T, v_max),
+                                               np.zeros((n_s, 1)))),
+                       'right': np.concatenate((detour_guess(x0, xs, (obs_x, obs_y), clearance, -1, N, T, v_max),
+                                                np.zeros((n_s, 1))))}
+            estimated_opt, _ = ms_solver(guesses, c_p, lbx, ubx, lbg, ubg)
+        elif tick_budget is None:
+            res = solver(x0=init_control, p=c_p, lbg=lbg, lbx=lbx, ubg=ubg, ubx=ubx)
+            estimated_opt = res['x'].full() # the feedback is in the series [u0, x0, u1, x1, ...]
+        else:
+            estimated_opt, _ = deadline_solver(init_control, c_p, lbx, ubx, lbg, ubg)
         index_t.append(time.time()- t_)
-        estimated_opt = res['x'].full() # the feedback is in the series [u0, x0, u1, x1, ...]
         u0 = estimated_opt[:200].reshape(N, n_controls).T # (n_controls, N)
-        x_m = estimated_opt[200:].reshape(N+1, n_states).T# [n_states, N]
+        x_m = estimated_opt[200:200+(N+1)*n_states].reshape(N+1, n_states).T# [n_states, N]
+        if soft:
+            slack_c.append(slack_usage(estimated_opt, N, n_states, n_controls, [(obs_x, obs_y)], soft))
         x_c.append(x_m.T)
         u_c.append(u0[:, 0])
         t_c.append(t0)
-        t0, x0, u0, next_states = shift_movement(T, t0, x0, u0, x_m, f)
-        x0 = ca.reshape(x0, -1, 1)
-        x0 = x0.full()
+        t0, x0, u0, next_states = shift_movement(T, t0, x0, u0, x_m, plant)
         xx.append(x0)
         mpciter = mpciter + 1
     print(mpciter)
     t_v = np.array(index_t)
     print(t_v.mean())
     print((time.time() - start_time)/(mpciter))
+    for k, usage in enumerate(slack_c):
+        if max(usage.values()) > 1e-6:
+            print('tick {0}: slack '.format(k) + ', '.join('{0} {1:.4f}'.format(*i) for i in usage.items()))
+    if controller == 'mppi':
+        print(mppi.summary())
+        mppi.close()
+    elif multi_start:
+        print(ms_solver.summary())
+        ms_solver.close()
+    elif tick_budget is not None:
+        print(deadline_solver.summary())
     draw_result = Draw_MPC_Obstacle(rob_diam=0.3, init_state=x0_, target_state=xs, robot_states=xx, obstacle=np.array([obs_x, obs_y, obs_diam/2.]), export_fig=True)
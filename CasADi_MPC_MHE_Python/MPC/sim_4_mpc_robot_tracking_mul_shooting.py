@@ -7,13 +7,22 @@ import casadi.tools as ca_tools
 import numpy as np
 import time
 from draw import Draw_MPC_tracking
-
-def shift_movement(T, t0, x0, u, x_f, f):
-    f_value = f(x0, u[:, 0])
-    st = x0 + T*f_value.full()
+from ltv_mpc import LTVController
+from solver_cache import SolverCache
+from ocp_builder import time_grid
+from plant import Plant
+from warm_start import shift_grid_blocks
+
+def shift_movement(T, t0, x0, u, x_f, plant, dt=None):
+    st = plant.step(x0, u[:, 0])
     t = t0 + T
-    u_end = np.concatenate((u[:, 1:], u[:, -1:]), axis=1)
-    x_f = np.concatenate((x_f[:, 1:], x_f[:, -1:]), axis=1)
+    if dt is None:
+        u_end = np.concatenate((u[:, 1:], u[:, -1:]), axis=1)
+        x_f = np.concatenate((x_f[:, 1:], x_f[:, -1:]), axis=1)
+    else:
+        # non-uniform grid, move the plan forward by the control period dt[0] = T
+        u_end = shift_grid_blocks(u.T, dt, u.shape[0], nodes=False).reshape(-1, u.shape[0]).T
+        x_f = shift_grid_blocks(x_f.T, dt, x_f.shape[0]).reshape(-1, x_f.shape[0]).T
 
     return t, st, u_end, x_f
 
@@ -21,9 +30,11 @@ def desired_command_and_trajectory(t, T, x0_, N_):
     # initial state / last state
     x_ = x0_.reshape(1, -1).tolist()[0]
     u_ = []
+    # T is the step length or the vector of the N_ step lengths of the grid
+    t_stages = t + np.concatenate(([0.0], np.cumsum(time_grid(T, N_))[:-1]))
     # states for the next N_ trajectories
     for i in range(N_):
-        t_predict = t + T*i
+        t_predict = t_stages[i]
         x_ref_ = 0.5 * t_predict
         y_ref_ = 1.0
         theta_ref_ = 0.0
@@ -39,7 +50,7 @@ def desired_command_and_trajectory(t, T, x0_, N_):
         u_.append(omega_ref_)
     # return pose and command
     x_ = np.array(x_).reshape(N_+1, -1)
-    u_ = np.array(u_).reshape(N, -1)
+    u_ = np.array(u_).reshape(N_, -1)
     return x_, u_
 
 if __name__ == '__main__':
@@ -48,6 +59,12 @@ if __name__ == '__main__':
     rob_diam = 0.3 # [m]
     v_max = 0.6
     omega_max = np.pi/4.0
+    use_codegen = False # compile the NLP callbacks to C (cached shared library)
+    dt = np.full(N, T) # step lengths of the horizon, e.g. make_time_grid(N, T, 8.0) for an 8 s lookahead
+    uniform_grid = np.all(dt == T)
+    mode = 'nlp' # 'ltv' solves a QP linearized along the reference, the NLP only when the linearization error is too large
+    ltv_linearize = 'reference' # or 'shifted', the plan of the last tick
+    ltv_threshold = 0.05 # [m] largest mismatch between the QP prediction and the nonlinear model
 
     x = ca.SX.sym('x')
     y = ca.SX.sym('y')
@@ -67,34 +84,43 @@ if __name__ == '__main__':
 
     ## function
     f = ca.Function('f', [states, controls], [rhs], ['input_state', 'control_input'], ['rhs'])
-
-    ## for MPC
-    U = ca.SX.sym('U', n_controls, N)
-    X = ca.SX.sym('X', n_states, N+1)
-    U_ref = ca.SX.sym('U_ref', n_controls, N)
-    X_ref = ca.SX.sym('X_ref', n_states, N+1)
+    plant_substeps = 1 # Euler steps of the simulated robot per sampling time
+    plant = Plant(f, T, n_substeps=plant_substeps)
 
     ### define
     Q = np.array([[1.0, 0.0, 0.0],[0.0, 5.0, 0.0],[0.0, 0.0, .1]])
     R = np.array([[0.5, 0.0], [0.0, 0.05]])
-    #### cost function
-    obj = 0 #### cost
-    g = [] # equal constrains
-    g.append(X[:, 0]-X_ref[:, 0])
-    for i in range(N):
-        state_error_ = X[:, i] - X_ref[:, i+1]
-        control_error_ = U[:, i] - U_ref[:, i]
-        obj = obj + ca.mtimes([state_error_.T, Q, state_error_]) + ca.mtimes([control_error_.T, R, control_error_])
-        x_next_ = f(X[:, i], U[:, i])*T +X[:, i]
-        g.append(X[:, i+1]-x_next_)
-
-    opt_variables = ca.vertcat( ca.reshape(U, -1, 1), ca.reshape(X, -1, 1))
-    opt_params = ca.vertcat(ca.reshape(U_ref, -1, 1), ca.reshape(X_ref, -1, 1))
-
-    nlp_prob = {'f': obj, 'x': opt_variables, 'p':opt_params, 'g':ca.vertcat(*g)}
+
+    def build_nlp():
+        ## for MPC
+        U = ca.SX.sym('U', n_controls, N)
+        X = ca.SX.sym('X', n_states, N+1)
+        U_ref = ca.SX.sym('U_ref', n_controls, N)
+        X_ref = ca.SX.sym('X_ref', n_states, N+1)
+
+        #### cost function
+        obj = 0 #### cost
+        g = [] # equal constrains
+        g.append(X[:, 0]-X_ref[:, 0])
+        for i in range(N):
+            state_error_ = X[:, i] - X_ref[:, i+1]
+            control_error_ = U[:, i] - U_ref[:, i]
+            obj = obj + dt[i]/T*(ca.mtimes([state_error_.T, Q, state_error_]) + ca.mtimes([control_error_.T, R, control_error_]))
+            x_next_ = f(X[:, i], U[:, i])*dt[i] +X[:, i]
+            g.append(X[:, i+1]-x_next_)
+
+        opt_variables = ca.vertcat( ca.reshape(U, -1, 1), ca.reshape(X, -1, 1))
+        opt_params = ca.vertcat(ca.reshape(U_ref, -1, 1), ca.reshape(X_ref, -1, 1))
+
+        return {'f': obj, 'x': opt_variables, 'p':opt_params, 'g':ca.vertcat(*g)}
+
     opts_setting = {'ipopt.max_iter':100, 'ipopt.print_level':0, 'print_time':0, 'ipopt.acceptable_tol':1e-8, 'ipopt.acceptable_obj_change_tol':1e-6}
 
-    solver = ca.nlpsol('solver', 'ipopt', nlp_prob, opts_setting)
+    solver_cache = SolverCache()
+    problem_definition = {'model': 'unicycle', 'task': 'tracking', 'shooting': 'multiple', 'N': N, 'T': T, 'dt': dt,
+                          'Q': Q, 'R': R, 'v_max': v_max, 'omega_max': omega_max, 'state_box': [20.0, 2.0]}
+    solver = solver_cache.nlpsol('solver', problem_definition, build_nlp, opts_setting, codegen=use_codegen)
+    solver_cache.report()
 
     lbg = 0.0
     ubg = 0.0
@@ -112,6 +138,8 @@ if __name__ == '__main__':
         ubx.append(20.0)
         ubx.append(2.0)
         ubx.append(np.inf)
+    if mode == 'ltv':
+        ltv = LTVController(f, N, dt, Q, R, lbx, ubx, solver, ltv_linearize, ltv_threshold)
 
     # Simulation
     t0 = 0.0
@@ -139,22 +167,27 @@ if __name__ == '__main__':
         # print('{0}'.format(next_states.T.reshape(-1, 1)[:6]))
         init_control = np.concatenate((u0.T.reshape(-1, 1), next_states.T.reshape(-1, 1)))
         t_ = time.time()
-        res = solver(x0=init_control, p=c_p, lbg=lbg, lbx=lbx, ubg=ubg, ubx=ubx)
+        if mode == 'ltv':
+            # no plan before the first tick, it is linearized along the reference
+            estimated_opt = ltv(current_state, next_trajectories, next_controls, next_states.T if mpciter > 0 else None,
+                                u0.T)
+        else:
+            res = solver(x0=init_control, p=c_p, lbg=lbg, lbx=lbx, ubg=ubg, ubx=ubx)
+            estimated_opt = res['x'].full() # the feedback is in the series [u0, x0, u1, x1, ...]
         index_t.append(time.time()- t_)
-        estimated_opt = res['x'].full() # the feedback is in the series [u0, x0, u1, x1, ...]
         u0 = estimated_opt[:int(n_controls*N)].reshape(N, n_controls).T # (n_controls, N)
         x_m = estimated_opt[int(n_controls*N):].reshape(N+1, n_states).T# [n_states, N]
         x_c.append(x_m.T)
         u_c.append(u0[:, 0])
         t_c.append(t0)
-        t0, current_state, u0, next_states = shift_movement(T, t0, current_state, u0, x_m, f)
-        current_state = ca.reshape(current_state, -1, 1)
-        current_state = current_state.full()
+        t0, current_state, u0, next_states = shift_movement(T, t0, current_state, u0, x_m, plant, None if uniform_grid else dt)
         xx.append(current_state)
-        next_trajectories, next_controls = desired_command_and_trajectory(t0, T, current_state, N)
+        next_trajectories, next_controls = desired_command_and_trajectory(t0, dt, current_state, N)
         mpciter = mpciter + 1
     t_v = np.array(index_t)
     print(t_v.mean())
     print((time.time() - start_time)/(mpciter))
     print(mpciter)
+    if mode == 'ltv':
+        print(ltv.summary())
     draw_result = Draw_MPC_tracking(rob_diam=0.3, init_state=init_state, robot_states=xx )
\ No newline at end of file
@@ -100,6 +100,14 @@ if __name__ == '__main__':
 
     opti.solver('ipopt', opts_setting)
 
+    ## compiled controller (x_ref, u_ref, u_guess, x_guess) -> (u_opt, x_opt), it skips the
+    ## Opti bookkeeping of set_value / set_initial / sol.value in every tick.
+    ## decision variables given as inputs are used as the initial guess
+    use_to_function = True
+    mpc_controller = opti.to_function('mpc_controller', [opt_x_ref, opt_u_ref, opt_controls, opt_states],
+                                      [opt_controls, opt_states], ['x_ref', 'u_ref', 'u_guess', 'x_guess'],
+                                      ['u_opt', 'x_opt'])
+
     t0 = 0
     init_state = np.array([0.0, 0.0, 0.0])
     current_state = init_state.copy()
@@ -117,20 +125,30 @@ if __name__ == '__main__':
     mpciter = 0
     start_time = time.time()
     index_t = []
+    tick_t = [] # set values + solve + read back
     while(mpciter-sim_time/T<0.0):
-        ## set parameter, here only update initial state of x (x0)
-        opti.set_value(opt_x_ref, next_trajectories)
-        opti.set_value(opt_u_ref, next_controls)
-        ## provide the initial guess of the optimization targets
-        opti.set_initial(opt_controls, u0.reshape(N, 2))# (N, 2)
-        opti.set_initial(opt_states, next_states) # (N+1, 3)
-        ## solve the problem once again
-        t_ = time.time()
-        sol = opti.solve()
-        index_t.append(time.time()- t_)
-        ## obtain the control input
-        u_res = sol.value(opt_controls)
-        x_m = sol.value(opt_states)
+        t_tick = time.time()
+        if use_to_function:
+            t_ = time.time()
+            u_res, x_m = mpc_controller(next_trajectories, next_controls, u0.reshape(N, 2), next_states)
+            index_t.append(time.time()- t_)
+            u_res = u_res.full()
+            x_m = x_m.full()
+        else:
+            ## set parameter, here only update initial state of x (x0)
+            opti.set_value(opt_x_ref, next_trajectories)
+            opti.set_value(opt_u_ref, next_controls)
+            ## provide the initial guess of the optimization targets
+            opti.set_initial(opt_controls, u0.reshape(N, 2))# (N, 2)
+            opti.set_initial(opt_states, next_states) # (N+1, 3)
+            ## solve the problem once again
+            t_ = time.time()
+            sol = opti.solve()
+            index_t.append(time.time()- t_)
+            ## obtain the control input
+            u_res = sol.value(opt_controls)
+            x_m = sol.value(opt_states)
+        tick_t.append(time.time()- t_tick)
         # print(x_m[:3])
         u_c.append(u_res[0, :])
         t_c.append(t0)
@@ -146,6 +164,7 @@ if __name__ == '__main__':
     print(mpciter)
     t_v = np.array(index_t)
     print(t_v.mean())
+    print('tick time (to_function={0}) {1}'.format(use_to_function, np.mean(tick_t)))
     print((time.time() - start_time)/(mpciter))
     ## draw function
     draw_result = Draw_MPC_tracking(rob_diam=0.3, init_state=init_state, robot_states=xx )
@@ -10,17 +10,25 @@ Note: Note
 
 import casadi as ca
 from draw import Draw_FolkLift
+from solver_cache import SolverCache
+from ocp_builder import build_mul_shooting_nlp, collocation_guess, forklift_model, make_bounds, make_params, n_blocks
+from plant import Plant
+from rti import RTIController
+from warm_start import shift_move_blocks
 
 import numpy as np
 import time
 
 
 # define a movement at next time step
-def shift_movement(T, t0, x0, u, x_f, f):
-    f_value = f(x0, u[:, 0])
-    st = x0 + T * f_value.full()
+def shift_movement(T, t0, x0, u, x_f, plant, blocks=None):
+    # plant.step runs the discretized model on floats, see plant.Plant
+    st = plant.step(x0, u[:, 0])
     t = t0 + T
-    u_end = np.concatenate((u[:, 1:], u[:, -1:]), axis=1)
+    if blocks is None:
+        u_end = np.concatenate((u[:, 1:], u[:, -1:]), axis=1)
+    else:
+        u_end = shift_move_blocks(u.T, blocks, u.shape[0]).reshape(-1, u.shape[0]).T
     x_f = np.concatenate((x_f[:, 1:], x_f[:, -1:]), axis=1)
 
     return t, st, u_end, x_f
@@ -32,6 +40,16 @@ if __name__ == "__main__":
     l = 1.0
     v_max = 0.6
     omega_max = np.pi / 4.0
+    use_rti = False  # one SQP step per tick (real-time iteration) after the first IPOPT solve
+    blocks = None  # move blocking, e.g. [1, 1, 1, 2, 5, 10, 20, 60] holds u constant over each block
+    if use_rti and blocks is not None:
+        raise ValueError("the RTI controller shifts one control per stage, use blocks=None")
+    n_u = n_blocks(N, blocks)
+    integrator = "euler"  # 'euler', 'rk4' or 'collocation' discretization of the prediction model
+    n_substeps = 1  # integrator steps per stage for euler / rk4, the plant step uses the same
+    degree = 3 if integrator == "collocation" else 0  # collocation points per stage
+    if use_rti and integrator == "collocation":
+        raise ValueError("the RTI controller needs an explicit integrator")
 
     x = ca.MX.sym("x")
     y = ca.MX.sym("y")
@@ -58,13 +76,6 @@ if __name__ == "__main__":
         "f", [states, controls], [rhs], ["input_state", "control_input"], ["rhs"]
     )
 
-    # for MPC
-    U = ca.MX.sym("U", n_controls, N)
-
-    X = ca.MX.sym("X", n_states, N + 1)
-
-    P = ca.MX.sym("P", n_states + n_states)
-
     # define
     Q = np.array(
         [
@@ -75,23 +86,14 @@ if __name__ == "__main__":
         ]
     )
     R = np.array([[0.5, 0.0], [0.0, .4]])
-    # cost function
-    obj = 0  # cost
-    g = []  # equal constrains
-    g.append(X[:, 0] - P[:n_states])
-
-    for i in range(N):
-        obj = (
-            obj
-            + ca.mtimes([(X[:, i] - P[n_states:]).T, Q, X[:, i] - P[n_states:]])
-            + ca.mtimes([U[:, i].T, R, U[:, i]])
-        )
-        x_next_ = f(X[:, i], U[:, i]) * T + X[:, i]
-        g.append(X[:, i + 1] - x_next_)
 
-    opt_variables = ca.vertcat(ca.reshape(U, -1, 1), ca.reshape(X, -1, 1))
+    def build_nlp():
+        # Q, R are parameters of the NLP, the bounds are given per call
+        # the stages are mapped, an MX loop over N is slow and memory-hungry to build
+        return build_mul_shooting_nlp(
+            f, N, T, use_map=True, blocks=blocks, integrator=integrator, n_substeps=n_substeps, degree=degree
+        )
 
-    nlp_prob = {"f": obj, "x": opt_variables, "p": P, "g": ca.vertcat(*g)}
     opts_setting = {
         "ipopt.max_iter": 100,
         "ipopt.print_level": 0,
@@ -100,35 +102,52 @@ if __name__ == "__main__":
         "ipopt.acceptable_obj_change_tol": 1e-6,
     }
 
-    solver = ca.nlpsol("solver", "ipopt", nlp_prob, opts_setting)
+    # the symbolic problem is only built if no solver for this definition is on disk
+    solver_cache = SolverCache()
+    problem_definition = {
+        "model": "forklift",
+        "l": l,
+        "shooting": "multiple",
+        "use_map": True,
+        "N": N,
+        "T": T,
+        "params": "x0_xs_q_r",
+        "blocks": blocks,
+        "integrator": integrator,
+        "n_substeps": n_substeps,
+        "degree": degree,
+    }
+    solver = solver_cache.nlpsol("solver", problem_definition, build_nlp, opts_setting)
+    solver_cache.report()
 
     lbg = 0.0
     ubg = 0.0
-    lbx = []
-    ubx = []
-    for _ in range(N):
-        lbx.append(-v_max)
-        lbx.append(-omega_max)
-        ubx.append(v_max)
-        ubx.append(omega_max)
-    for _ in range(
-        N + 1
-    ):  # note that this is different with the method using structure
-        lbx.append(-16.0)
-        lbx.append(-16.0)
-        lbx.append(-np.pi)
-        lbx.append(-np.pi / 2.0)
-        ubx.append(7.01)
-        ubx.append(7.01)
-        ubx.append(np.pi)
-        ubx.append(np.pi / 2.0)
+    # note that this is different with the method using structure
+    lbx, ubx = make_bounds(
+        N,
+        [-v_max, -omega_max],
+        [v_max, omega_max],
+        [-16.0, -16.0, -np.pi, -np.pi / 2.0],
+        [7.01, 7.01, np.pi, np.pi / 2.0],
+        blocks,
+        integrator=integrator,
+        degree=degree,
+    )
+    # the plant is stepped with the model discretization, collocation has no explicit step and uses RK4
+    plant = Plant(f, T, "rk4" if integrator == "collocation" else integrator, n_substeps)
+    if use_rti:
+        # the linearization is evaluated every tick, the SX loop is cheaper to evaluate than the mapped MX graph
+        rti = RTIController(
+            build_mul_shooting_nlp(forklift_model(l), N, T, integrator=integrator, n_substeps=n_substeps),
+            N, n_states, n_controls, lbx, ubx, lbg, ubg,
+        )
 
     # simulation
     t0 = 0.0
     x_init = np.array([0.0, 0.0, 0.0, 0.0])
     x_current = x_init.copy().reshape(-1, 1)
     x_target = np.array([7, 7, 0.0, 0.0]).reshape(-1, 1)
-    u_guess = np.array([0.0, 0.0] * N).reshape(-1, 2)
+    u_guess = np.array([0.0, 0.0] * n_u).reshape(-1, 2)
     x_guess = np.zeros((n_states, N + 1))
     start_time = time.time()
     cal_time_list = []
@@ -136,30 +155,52 @@ if __name__ == "__main__":
     control_results = []
     time_step_list = []
     final_state_results = []
+    prep_time_list = []
     mpc_iter = 0
     while np.linalg.norm(x_target - x_init) > 1e-3 and mpc_iter < 100:
         # parameters
-        c_p = np.concatenate((x_current, x_target))
+        c_p = make_params(x_current, x_target, Q, R)
         # guessing optimization states
         init_opt_state = np.concatenate(
-            (u_guess.T.reshape(-1, 1), x_guess.T.reshape(-1, 1))
+            (u_guess.T.reshape(-1, 1), x_guess.T.reshape(-1, 1), collocation_guess(x_guess.T, degree))
         )
         t_ = time.time()
-        opt_result = solver(
-            x0=init_opt_state, p=c_p, lbg=lbg, ubg=ubg, lbx=lbx, ubx=ubx
-        )
-        cal_time_list.append(time.time() - t_)
-        estimated_result = opt_result["x"].full()
-        u_guess = estimated_result[: n_controls * N].reshape(N, n_controls).T
-        x_guess = estimated_result[n_controls * N :].reshape(N + 1, n_states).T
+        if use_rti and mpc_iter > 0:
+            # feedback phase, only the QP for the measured state
+            rti.feedback(x_current)
+            cal_time_list.append(time.time() - t_)
+            u_rti, x_rti = rti.trajectory()
+            u_guess = u_rti.T
+            x_guess = x_rti.T
+        else:
+            opt_result = solver(
+                x0=init_opt_state, p=c_p, lbg=lbg, ubg=ubg, lbx=lbx, ubx=ubx
+            )
+            cal_time_list.append(time.time() - t_)
+            if use_rti:
+                rti.initialize(opt_result["x"])
+            estimated_result = opt_result["x"].full()
+            u_guess = estimated_result[: n_controls * n_u].reshape(n_u, n_controls).T
+            x_guess = estimated_result[n_controls * n_u : n_controls * n_u + (N + 1) * n_states].reshape(N + 1, n_states).T
         # print(x_guess.T)
         state_results.append(x_guess.T)
         final_state_results.append(x_guess.T[0])
         control_results.append(u_guess[:, 0])
         time_step_list.append(t0)
         t0, x_current, u_guess, x_guess = shift_movement(
-            T, t0, x_current, u_guess, x_guess, f
+            T, t0, x_current, u_guess, x_guess, plant, blocks
         )
+        if use_rti:
+            # preparation phase, linearize around the shifted trajectory before the next state arrives
+            t_ = time.time()
+            rti.shift()
+            rti.preparation(c_p)
+            prep_time_list.append(time.time() - t_)
         mpc_iter += 1
 
+    print("mean solve time {0:.2f} ms (rti {1})".format(np.mean(cal_time_list) * 1e3, use_rti))
+    if use_rti:
+        print("RTI feedback {0:.2f} ms, preparation {1:.2f} ms".format(
+            np.mean(cal_time_list[1:]) * 1e3, np.mean(prep_time_list) * 1e3))
+
     Draw_FolkLift(final_state_results, x_init, False)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+On-disk cache for built nlpsol solvers.
+
+The cache key is a hash over a plain description of the problem (model, N, T,
+Q, R, bounds, solver options, ...) and over the code that builds it
+(code_hash of build_nlp: its source, the local modules it calls such as
+ocp_builder.py, and the serialized ca.Function / values it refers to such as
+the model f), so editing the model or the builder rebuilds the solver. The
+symbolic NLP is only constructed when no serialized solver with the same key
+exists, otherwise the stored ca.Function is loaded from disk.
+
+The MHE scripts import this module from the MPC folder.
+
+With codegen=True the NLP callbacks (objective, constraints, Jacobians and
+Hessian) are generated as C code, compiled with the local gcc into a shared
+library and loaded through ca.external, so IPOPT no longer evaluates them in
+the CasADi virtual machine.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import subprocess
+import sysconfig
+import time
+import types
+
+import casadi as ca
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'solver_cache')
+
+
+def _to_plain(obj):
+    # convert numpy / casadi values into something json can hash stably
+    if isinstance(obj, dict):
+        return {str(k): _to_plain(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_to_plain(v) for v in obj]
+    if isinstance(obj, ca.Function):
+        return {'function': hashlib.sha1(obj.serialize().encode('utf-8')).hexdigest()}
+    if isinstance(obj, ca.DM):
+        obj = obj.full()
+    if isinstance(obj, np.ndarray):
+        return {'shape': list(obj.shape), 'data': _to_plain(obj.ravel().tolist())}
+    if isinstance(obj, (np.floating, float)):
+        return repr(float(obj))  # keeps inf / nan and full precision
+    if isinstance(obj, np.integer):
+        return int(obj)
+    return obj
+
+
+def _is_local(module):
+    # a module of this repository, not of the standard library or an installed package
+    file_name = getattr(module, '__file__', None)
+    if file_name is None:
+        return False
+    file_name = os.path.realpath(file_name)
+    paths = sysconfig.get_paths()
+    return not any(file_name.startswith(os.path.realpath(paths[k]) + os.sep) for k in ('stdlib', 'purelib', 'platlib'))
+
+
+def _code_names(code):
+    names = list(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names += _code_names(const)
+    return names
+
+
+def code_hash(fun):
+    """
+    hash of the code behind fun: its source, the files of the local modules it uses, and the
+    ca.Function, NumPy and plain values it refers to by name, also inside lists and dicts (values
+    without a plain form are skipped); local functions are followed
+    """
+    digest = hashlib.sha1()
+    todo = [fun]
+    seen = set()
+    while todo:
+        fun = todo.pop()
+        if id(fun) in seen:
+            continue
+        seen.add(id(fun))
+        if isinstance(fun, types.ModuleType):
+            with open(fun.__file__, 'rb') as f:
+                digest.update(f.read())
+            continue
+        digest.update(inspect.getsource(fun).encode('utf-8'))
+        values = dict(zip(fun.__code__.co_freevars, [c.cell_contents for c in fun.__closure__ or []]))
+        for name in _code_names(fun.__code__):
+            if name in fun.__globals__ and name not in values:
+                values[name] = fun.__globals__[name]
+        for name in sorted(values):
+            value = values[name]
+            if isinstance(value, types.ModuleType):
+                if _is_local(value):
+                    todo.append(value)
+            elif isinstance(value, types.FunctionType):
+                module = inspect.getmodule(value)
+                if module is None or not _is_local(module):
+                    continue
+                # functions of the calling script are followed one by one, imported ones hash their module
+                if module.__name__ == '__main__' or module is inspect.getmodule(fun):
+                    todo.append(value)
+                else:
+                    todo.append(module)
+            elif isinstance(value, ca.Function):
+                digest.update(name.encode('utf-8') + value.serialize().encode('utf-8'))
+            elif isinstance(value, (bool, int, float, str, list, tuple, dict, np.ndarray, ca.DM, type(None))):
+                try:
+                    text = json.dumps([name, _to_plain(value)], sort_keys=True)
+                except TypeError:
+                    # a container with objects that have no stable plain form, e.g. a solver instance
+                    continue
+                digest.update(text.encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def problem_hash(definition):
+    """ hash of a problem description, the casadi version is always part of it """
+    plain = {'casadi': ca.__version__, 'definition': _to_plain(definition)}
+    text = json.dumps(plain, sort_keys=True)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+class SolverCache(object):
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, verbose=True, compiler='gcc', cflags=('-O3',)):
+        self.cache_dir = cache_dir
+        self.verbose = verbose
+        self.compiler = compiler
+        self.cflags = list(cflags)
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def _log(self, msg):
+        if self.verbose:
+            print('[solver_cache] ' + msg)
+
+    def path(self, name, definition, opts, plugin='ipopt', build_nlp=None):
+        key = problem_hash({'definition': definition, 'opts': opts, 'plugin': plugin,
+                            'code': None if build_nlp is None else code_hash(build_nlp)})
+        return os.path.join(self.cache_dir, '{0}_{1}.casadi'.format(name, key))
+
+    def library_path(self, name, definition, build_nlp=None):
+        # the options are given at load time, so they are not part of the library key
+        key = problem_hash({'definition': definition, 'compiler': self.compiler, 'cflags': self.cflags,
+                            'code': None if build_nlp is None else code_hash(build_nlp)})
+        return os.path.join(self.cache_dir, '{0}_{1}.so'.format(name, key))
+
+    def nlpsol(self, name, definition, build_nlp, opts, plugin='ipopt', codegen=False):
+        """
+        return ca.nlpsol(name, plugin, build_nlp(), opts), loaded from disk when possible.
+        build_nlp is only called on a cache miss, its code is part of the key (code_hash).
+        """
+        if codegen:
+            return self._compiled_nlpsol(name, definition, build_nlp, opts, plugin)
+        file_name = self.path(name, definition, opts, plugin, build_nlp)
+        t_ = time.time()
+        if os.path.isfile(file_name):
+            try:
+                solver = ca.Function.load(file_name)
+                self.hits += 1
+                self._log('hit  {0} ({1:.1f} ms) {2}'.format(
+                    name, (time.time() - t_)*1e3, os.path.basename(file_name)))
+                return solver
+            except RuntimeError:
+                # unreadable file (e.g. interrupted write), rebuild it
+                os.remove(file_name)
+        solver = ca.nlpsol(name, plugin, build_nlp(), opts)
+        tmp_name = file_name + '.tmp'
+        solver.save(tmp_name)
+        os.replace(tmp_name, file_name)
+        self.misses += 1
+        self._log('miss {0} ({1:.1f} ms) {2}'.format(
+            name, (time.time() - t_)*1e3, os.path.basename(file_name)))
+        return solver
+
+    def _compiled_nlpsol(self, name, definition, build_nlp, opts, plugin):
+        lib_name = self.library_path(name, definition, build_nlp)
+        t_ = time.time()
+        if os.path.isfile(lib_name):
+            self.hits += 1
+            state = 'hit '
+        else:
+            # generate the callbacks from a plain solver, compile them next to the cache
+            solver = ca.nlpsol(name, plugin, build_nlp(), opts)
+            c_name = os.path.splitext(lib_name)[0] + '.c'
+            # the code generator only writes into the working directory
+            solver.generate_dependencies(os.path.basename(c_name), {'with_header': False})
+            shutil.move(os.path.basename(c_name), c_name)
+            tmp_name = lib_name + '.tmp'
+            subprocess.check_call([self.compiler, '-fPIC', '-shared'] + self.cflags + [c_name, '-o', tmp_name])
+            os.replace(tmp_name, lib_name)
+            os.remove(c_name)
+            self.misses += 1
+            state = 'miss'
+        # generate_dependencies always names the oracle 'nlp'
+        solver = ca.nlpsol(name, plugin, ca.external('nlp', lib_name), opts)
+        self._log('{0} {1} ({2:.1f} ms) {3}'.format(
+            state, name, (time.time() - t_)*1e3, os.path.basename(lib_name)))
+        return solver
+
+    def report(self):
+        print('[solver_cache] hits: {0}, misses: {1}'.format(self.hits, self.misses))
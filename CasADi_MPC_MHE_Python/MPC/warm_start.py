@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Primal-dual warm start for the multiple shooting MPC loops.
+
+The solution of the last tick (x, lam_x, lam_g) is shifted by one stage in
+the same way shift_movement shifts u and x: the first stage is dropped and
+the last one is repeated. On a non-uniform time grid (a vector dt of step
+lengths) the solution is moved forward by the control period dt[0] instead:
+states and multipliers are interpolated at the shifted node times and the
+controls are sampled at the shifted stage start times. The layouts are the ones of ocp_builder.py
+    x = [U (N blocks of n_controls), X (N+1 blocks of n_states), Xc (N blocks of degree*n_states),
+         S (N+1 per soft obstacle, N+1 blocks of len(soft_states) for soft states)]
+    g = [x_0 - x0 and defects (N+1 blocks of n_states), obstacle distances (N+1 per obstacle),
+         soft state rows (2 groups of N+1 blocks of len(soft_states)),
+         collocation equations (N blocks of degree*n_states)]
+where the collocation blocks only exist with integrator='collocation' (degree > 0), they are
+shifted like the controls. The slacks S and the soft state rows only exist for the groups in
+soft, they are shifted like the states.
+"""
+
+import numpy as np
+
+# IPOPT only uses lam_x0 / lam_g0 with warm_start_init_point, the small pushes
+# keep the shifted point close to where it was given
+WARM_START_OPTS = {
+    'ipopt.warm_start_init_point': 'yes',
+    'ipopt.warm_start_bound_push': 1e-6,
+    'ipopt.warm_start_bound_frac': 1e-6,
+    'ipopt.warm_start_slack_bound_push': 1e-6,
+    'ipopt.warm_start_slack_bound_frac': 1e-6,
+    'ipopt.warm_start_mult_bound_push': 1e-6,
+    'ipopt.mu_init': 1e-4,
+}
+
+
+def shift_blocks(v, n_blocks, block_size):
+    """ shift a stack of n_blocks equally sized blocks by one, the last block is kept """
+    v = np.asarray(v, dtype=float).reshape(n_blocks, block_size)
+    return np.concatenate((v[1:], v[-1:])).reshape(-1, 1)
+
+
+def shift_grid_blocks(v, dt, block_size, nodes=True):
+    """
+    move a stack of blocks forward by dt[0] on the time grid dt, nodes=True for
+    the N+1 node values (linear interpolation), False for the N stage values
+    (held constant over each step)
+    """
+    tau = np.concatenate(([0.0], np.cumsum(dt)))
+    if nodes:
+        v = np.asarray(v, dtype=float).reshape(len(tau), block_size)
+        t_new = np.minimum(tau + dt[0], tau[-1])
+        return np.stack([np.interp(t_new, tau, v[:, i]) for i in range(block_size)], axis=1).reshape(-1, 1)
+    v = np.asarray(v, dtype=float).reshape(len(dt), block_size)
+    idx = np.searchsorted(tau[:-1], tau[:-1] + dt[0] + 1e-9*dt[0], 'right') - 1
+    return v[np.minimum(idx, len(dt)-1)].reshape(-1, 1)
+
+
+def shift_move_blocks(u, blocks, n_controls, dt=None):
+    """
+    shift move blocked controls by one stage: the per stage sequence is shifted
+    and every block takes the value of its first stage
+    """
+    u = np.asarray(u, dtype=float).reshape(len(blocks), n_controls)
+    u_stage = np.repeat(u, blocks, axis=0)
+    starts = np.cumsum(np.r_[0, blocks[:-1]])
+    if dt is None:
+        u_stage = np.concatenate((u_stage[1:], u_stage[-1:]))
+    else:
+        u_stage = shift_grid_blocks(u_stage, dt, n_controls, nodes=False).reshape(-1, n_controls)
+    return u_stage[starts].reshape(-1, 1)
+
+
+def shift_primal_dual(x, lam_x, lam_g, N, n_states, n_controls, n_obstacles=0, blocks=None, dt=None, degree=0,
+                      soft=(), soft_states=(0, 1)):
+    """
+    shifted (x0, lam_x0, lam_g0) for the next call of the solver, dt for a non-uniform grid,
+    degree the number of collocation points per stage, soft and soft_states as in
+    ocp_builder.build_mul_shooting_nlp
+    """
+    x = np.asarray(x, dtype=float).ravel()
+    lam_x = np.asarray(lam_x, dtype=float).ravel()
+    lam_g = np.asarray(lam_g, dtype=float).ravel()
+    n_u = (N if blocks is None else len(blocks))*n_controls
+    n_dyn = (N+1)*n_states
+
+    n_coll = N*degree*n_states
+    n_obs_s = (N+1)*n_obstacles if 'obstacles' in soft else 0
+    n_soft = len(soft_states) if 'states' in soft else 0
+    n_x = n_u + n_dyn + n_coll + n_obs_s + (N+1)*n_soft
+    n_g = n_dyn + (N+1)*n_obstacles + 2*(N+1)*n_soft + n_coll
+    if (len(x), len(lam_x), len(lam_g)) != (n_x, n_x, n_g):
+        raise ValueError('x, lam_x and lam_g have {0}, {1} and {2} entries, the layout (n_obstacles={3}, blocks, '
+                         'degree={4}, soft={5}) gives {6} and {7}'.format(
+                             len(x), len(lam_x), len(lam_g), n_obstacles, degree, list(soft), n_x, n_g))
+
+    def shift_nodes(v, block_size):
+        return shift_blocks(v, N+1, block_size) if dt is None else shift_grid_blocks(v, dt, block_size)
+
+    def shift_stages(v, block_size):
+        return shift_blocks(v, N, block_size) if dt is None else shift_grid_blocks(v, dt, block_size, nodes=False)
+
+    def shift_x(v):
+        if blocks is not None:
+            u = shift_move_blocks(v[:n_u], blocks, n_controls, dt)
+        elif dt is not None:
+            u = shift_grid_blocks(v[:n_u], dt, n_controls, nodes=False)
+        else:
+            u = shift_blocks(v[:n_u], N, n_controls)
+        parts = [u, shift_nodes(v[n_u:n_u+n_dyn], n_states)]
+        if n_coll:
+            parts.append(shift_stages(v[n_u+n_dyn:n_u+n_dyn+n_coll], degree*n_states))
+        s = v[n_u+n_dyn+n_coll:]
+        for k in range(n_obs_s//(N+1)):
+            parts.append(shift_nodes(s[k*(N+1):(k+1)*(N+1)], 1))
+        if n_soft:
+            parts.append(shift_nodes(s[n_obs_s:], n_soft))
+        return np.concatenate(parts)
+
+    lam_g_next = [shift_nodes(lam_g[:n_dyn], n_states)]
+    for k in range(n_obstacles):
+        lam_g_next.append(shift_nodes(lam_g[n_dyn+k*(N+1):n_dyn+(k+1)*(N+1)], 1))
+    n_rows = n_dyn + (N+1)*n_obstacles
+    for k in range(2 if n_soft else 0):
+        lam_g_next.append(shift_nodes(lam_g[n_rows+k*(N+1)*n_soft:n_rows+(k+1)*(N+1)*n_soft], n_soft))
+    if n_coll:
+        lam_g_next.append(shift_stages(lam_g[-n_coll:], degree*n_states))
+    return shift_x(x), shift_x(lam_x), np.concatenate(lam_g_next)
+
+
+def resize_blocks(v, n_blocks, block_size, n_new):
+    """ truncate a stack of blocks to n_new blocks or pad it by repeating the last block """
+    v = np.asarray(v, dtype=float).reshape(n_blocks, block_size)
+    if n_new <= n_blocks:
+        return v[:n_new].reshape(-1, 1)
+    return np.concatenate((v, np.repeat(v[-1:], n_new-n_blocks, axis=0))).reshape(-1, 1)
+
+
+def resize_primal_dual(x, lam_x, lam_g, N, N_new, n_states, n_controls, n_obstacles=0):
+    """ (x0, lam_x0, lam_g0) of a horizon N solution for the solver of horizon N_new """
+    x = np.asarray(x, dtype=float).ravel()
+    lam_x = np.asarray(lam_x, dtype=float).ravel()
+    lam_g = np.asarray(lam_g, dtype=float).ravel()
+    n_u = N*n_controls
+    n_dyn = (N+1)*n_states
+
+    def resize_x(v):
+        return np.concatenate((resize_blocks(v[:n_u], N, n_controls, N_new),
+                               resize_blocks(v[n_u:], N+1, n_states, N_new+1)))
+
+    lam_g_next = [resize_blocks(lam_g[:n_dyn], N+1, n_states, N_new+1)]
+    for k in range(n_obstacles):
+        lam_g_next.append(resize_blocks(lam_g[n_dyn+k*(N+1):n_dyn+(k+1)*(N+1)], N+1, 1, N_new+1))
+    return resize_x(x), resize_x(lam_x), np.concatenate(lam_g_next)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Bounded cache of NLP solutions keyed on (x0, xs) for the multiple shooting
+MPC loops.
+
+Robots that revisit the same start / goal pairs can start IPOPT from the
+stored primal-dual solution (x, lam_x, lam_g) of the closest earlier problem
+instead of the zero guess. The keys are the concatenation [x0, xs], scaled
+per component (e.g. to weigh metres against radians), and the nearest key is
+found with a KD-tree. New keys are inserted into the tree and evicted keys
+are only marked dead, the tree is rebuilt balanced by store() once the
+inserts and dead nodes outnumber the nodes of the last build, so lookup()
+never pays for it. Eviction is least recently used (a hit counts as a use).
+A lookup farther away than max_distance is a miss.
+
+stats() reports lookups, hit rate, lookup latency and, when the IPOPT
+iteration count of every solve is passed to record(), the mean iterations
+after a hit and after a miss.
+"""
+
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class KDTree(object):
+    """ nearest neighbour search over points that can be inserted and removed """
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.clear()
+
+    def clear(self):
+        self.point = []  # per node
+        self.key = []  # per node, the handle given to insert
+        self.axis = []
+        self.left = []
+        self.right = []
+        self.alive = []
+        self.root = -1
+        self.n_alive = 0
+        self.n_changes = 0  # inserts and removals since the last build
+
+    def build(self, points, keys):
+        """ balanced tree, the median of the widest axis splits every node """
+        self.clear()
+        points = [list(map(float, p)) for p in points]
+        self.root = self._build(points, list(keys))
+        self.n_alive = len(points)
+
+    def _build(self, points, keys):
+        if not points:
+            return -1
+        spans = [max(p[d] for p in points) - min(p[d] for p in points) for d in range(self.dim)]
+        axis = spans.index(max(spans))
+        order = sorted(range(len(points)), key=lambda i: points[i][axis])
+        mid = len(order)//2
+        node = self._new_node(points[order[mid]], keys[order[mid]], axis)
+        self.left[node] = self._build([points[i] for i in order[:mid]], [keys[i] for i in order[:mid]])
+        self.right[node] = self._build([points[i] for i in order[mid+1:]], [keys[i] for i in order[mid+1:]])
+        return node
+
+    def _new_node(self, point, key, axis):
+        self.point.append(point)
+        self.key.append(key)
+        self.axis.append(axis)
+        self.left.append(-1)
+        self.right.append(-1)
+        self.alive.append(True)
+        return len(self.point)-1
+
+    def insert(self, point, key):
+        """ add a point below the leaf it falls into, returns the node """
+        point = list(map(float, point))
+        self.n_alive += 1
+        self.n_changes += 1
+        if self.root < 0:
+            self.root = self._new_node(point, key, 0)
+            return self.root
+        node = self.root
+        depth = 0
+        while True:
+            depth += 1
+            branch = self.left if point[self.axis[node]] < self.point[node][self.axis[node]] else self.right
+            if branch[node] < 0:
+                branch[node] = self._new_node(point, key, depth % self.dim)
+                return branch[node]
+            node = branch[node]
+
+    def remove(self, node):
+        self.alive[node] = False
+        self.n_alive -= 1
+        self.n_changes += 1
+
+    def needs_rebuild(self):
+        return self.n_changes > max(16, self.n_alive)
+
+    def nearest(self, point):
+        """ (distance, key) of the closest alive point, (inf, None) for an empty tree """
+        best_d2 = np.inf
+        best_key = None
+        stack = [self.root] if self.root >= 0 else []
+        while stack:
+            node = stack.pop()
+            p = self.point[node]
+            if self.alive[node]:
+                d2 = sum((a-b)*(a-b) for a, b in zip(point, p))
+                if d2 < best_d2:
+                    best_d2, best_key = d2, self.key[node]
+            diff = point[self.axis[node]] - p[self.axis[node]]
+            near, far = (self.left[node], self.right[node]) if diff < 0.0 else (self.right[node], self.left[node])
+            # the far side can only be closer than the splitting plane
+            if far >= 0 and diff*diff < best_d2:
+                stack.append(far)
+            if near >= 0:
+                stack.append(near)
+        return np.sqrt(best_d2), best_key
+
+
+class WarmStartCache(object):
+    def __init__(self, n_states, capacity=256, scale=None, max_distance=np.inf):
+        """
+        scale : weight of every key component [x0, xs] (2*n_states), default 1
+        """
+        self.n_states = n_states
+        self.capacity = capacity
+        self.scale = np.ones(2*n_states) if scale is None else np.broadcast_to(scale, (2*n_states,)).astype(float)
+        self.max_distance = max_distance
+        self.tree = KDTree(2*n_states)
+        self.entries = OrderedDict()  # slot -> (node, key, x, lam_x, lam_g), least recently used first
+        self.free_slots = list(range(capacity))
+        self.n_lookups = 0
+        self.n_hits = 0
+        self.lookup_t = []
+        self.iter_hit = []
+        self.iter_miss = []
+        self.last_hit = False
+
+    def make_key(self, x0, xs):
+        return (np.concatenate((np.ravel(x0), np.ravel(xs)))*self.scale).tolist()
+
+    def lookup(self, x0, xs):
+        """ (x, lam_x, lam_g) of the closest stored problem as columns, None for a miss """
+        t_ = time.time()
+        distance, slot = self.tree.nearest(self.make_key(x0, xs))
+        self.n_lookups += 1
+        self.last_hit = slot is not None and distance <= self.max_distance
+        guess = None
+        if self.last_hit:
+            self.n_hits += 1
+            self.entries.move_to_end(slot)
+            guess = tuple(v.reshape(-1, 1) for v in self.entries[slot][2:])
+        self.lookup_t.append(time.time() - t_)
+        return guess
+
+    def store(self, x0, xs, res):
+        """ keep the solution res of the solver for the problem (x0, xs) """
+        if not self.free_slots:
+            slot, entry = self.entries.popitem(last=False)
+            self.tree.remove(entry[0])
+            self.free_slots.append(slot)
+        slot = self.free_slots.pop()
+        key = self.make_key(x0, xs)
+        node = self.tree.insert(key, slot)
+        self.entries[slot] = (node, key, res['x'].full().ravel(), res['lam_x'].full().ravel(),
+                              res['lam_g'].full().ravel())
+        # rebuilt here so that the lookup of the next tick does not pay for it
+        if self.tree.needs_rebuild():
+            self._rebuild()
+
+    def record(self, iterations):
+        """ IPOPT iterations of the solve that followed the last lookup """
+        (self.iter_hit if self.last_hit else self.iter_miss).append(iterations)
+
+    def _rebuild(self):
+        slots = list(self.entries.keys())
+        self.tree.build([self.entries[s][1] for s in slots], slots)
+        for node, slot in enumerate(self.tree.key):
+            self.entries[slot] = (node,) + self.entries[slot][1:]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        lookup_t = np.array(self.lookup_t)*1e3
+        return {'lookups': self.n_lookups, 'hits': self.n_hits, 'size': len(self.entries),
+                'hit_rate': self.n_hits/float(max(1, self.n_lookups)),
+                'lookup_ms': np.mean(lookup_t) if len(lookup_t) else np.nan,
+                'lookup_ms_p99': np.percentile(lookup_t, 99) if len(lookup_t) else np.nan,
+                'iter_hit': np.mean(self.iter_hit) if self.iter_hit else np.nan,
+                'iter_miss': np.mean(self.iter_miss) if self.iter_miss else np.nan}
+
+    def report(self):
+        s = self.stats()
+        return ('cache {size}/{0} entries, {lookups} lookups, hit rate {1:.0f} %, lookup {lookup_ms:.3f} ms '
+                '(p99 {lookup_ms_p99:.3f}), iterations after hit {iter_hit:.2f}, after miss {iter_miss:.2f}'.format(
+                    self.capacity, 100*s['hit_rate'], **s))
@@ -17,6 +17,20 @@ def shift_movement(T, t0, x0, u, x_n, f):
     return t, st, u_end, x_n
 
 
+def shift_lam_g(lam_g, N):
+    # multipliers in the order of the constraints below: x0 (3), dynamics (N*3),
+    # x / y bounds (N+1 each), v / omega bounds (N each), shifted by one stage
+    lam_g = np.asarray(lam_g).ravel()
+    blocks = [(N+1, 3), (N+1, 1), (N+1, 1), (N, 1), (N, 1)]
+    shifted = []
+    start = 0
+    for n_blocks, block_size in blocks:
+        block = lam_g[start:start+n_blocks*block_size].reshape(n_blocks, block_size)
+        shifted.append(np.concatenate((block[1:], block[-1:])).ravel())
+        start += n_blocks*block_size
+    return np.concatenate(shifted)
+
+
 def prediction_state(x0, u, T, N):
     # define predition horizon function
     states = np.zeros((N+1, 3))
@@ -83,10 +97,33 @@ if __name__ == '__main__':
     opts_setting = {'ipopt.max_iter': 100, 'ipopt.print_level': 0, 'print_time': 0,
                     'ipopt.acceptable_tol': 1e-8, 'ipopt.acceptable_obj_change_tol': 1e-6}
 
+    # primal-dual warm start, the shifted lam_g of the last tick is given to IPOPT.
+    # the first tick has no multipliers yet and is solved with the cold options
+    use_warm_start = True
+    warm_opts_setting = dict(opts_setting, **{
+        'ipopt.warm_start_init_point': 'yes', 'ipopt.warm_start_bound_push': 1e-6,
+        'ipopt.warm_start_bound_frac': 1e-6, 'ipopt.warm_start_slack_bound_push': 1e-6,
+        'ipopt.warm_start_slack_bound_frac': 1e-6, 'ipopt.warm_start_mult_bound_push': 1e-6,
+        'ipopt.mu_init': 1e-4})
+
     opti.solver('ipopt', opts_setting)
     final_state = np.array([2, 1.5, 0.0])
     opti.set_value(opt_xs, final_state)
 
+    # compiled controller (x0, xs, u_guess, x_guess, lam_g_guess) -> (u_opt, x_opt, lam_g), it skips the
+    # Opti bookkeeping of set_value / set_initial / sol.value in every tick.
+    # decision variables (and lam_g) given as inputs are used as the initial guess
+    use_to_function = True
+    controller_args = ([opt_x0, opt_xs, opt_controls, opt_states, opti.lam_g],
+                       [opt_controls, opt_states, opti.lam_g],
+                       ['x0', 'xs', 'u_guess', 'x_guess', 'lam_g_guess'], ['u_opt', 'x_opt', 'lam_g'])
+    cold_controller = opti.to_function('mpc_controller', *controller_args)
+    mpc_controller = cold_controller
+    if use_warm_start:
+        opti.solver('ipopt', warm_opts_setting)
+        mpc_controller = opti.to_function('mpc_controller', *controller_args)
+        opti.solver('ipopt', opts_setting)
+
     t0 = 0
     init_state = np.array([0.0, 0.0, 0.0])
     u0 = np.zeros((N, 2))
@@ -102,23 +139,44 @@ if __name__ == '__main__':
     mpciter = 0
     start_time = time.time()
     index_t = []
+    tick_t = []  # set values + solve + read back
+    iter_c = []  # IPOPT iterations per step
+    lam_g0 = np.zeros(opti.ng)
     while(np.linalg.norm(current_state-final_state) > 1e-2 and mpciter-sim_time/T < 0.0):
-        # set parameter, here only update initial state of x (x0)
-        opti.set_value(opt_x0, current_state)
-        # set optimizing target withe init guess
-        opti.set_initial(opt_controls, u0)  # (N, 2)
-        opti.set_initial(opt_states, next_states)  # (N+1, 3)
-        # solve the problem once again
-        t_ = time.time()
-        sol = opti.solve()
-        index_t.append(time.time() - t_)
-        ## opti.set_initial(opti.lam_g, sol.value(opti.lam_g))
-        # obtain the control input
-        u_res = sol.value(opt_controls)
+        t_tick = time.time()
+        if use_to_function:
+            t_ = time.time()
+            tick_controller = cold_controller if mpciter == 0 else mpc_controller
+            u_res, next_states_pred, lam_g = tick_controller(current_state, final_state, u0, next_states, lam_g0)
+            index_t.append(time.time() - t_)
+            iter_c.append(tick_controller.stats()['iter_count'])
+            u_res = u_res.full()
+            next_states_pred = next_states_pred.full()
+        else:
+            # set parameter, here only update initial state of x (x0)
+            opti.set_value(opt_x0, current_state)
+            # set optimizing target withe init guess
+            opti.set_initial(opt_controls, u0)  # (N, 2)
+            opti.set_initial(opt_states, next_states)  # (N+1, 3)
+            if use_warm_start and mpciter == 1:
+                opti.solver('ipopt', warm_opts_setting)
+            if use_warm_start and mpciter > 0:
+                opti.set_initial(opti.lam_g, lam_g0)
+            # solve the problem once again
+            t_ = time.time()
+            sol = opti.solve()
+            index_t.append(time.time() - t_)
+            iter_c.append(sol.stats()['iter_count'])
+            lam_g = sol.value(opti.lam_g)
+            # obtain the control input
+            u_res = sol.value(opt_controls)
+            # prediction_state(x0=current_state, u=u_res, N=N, T=T)
+            next_states_pred = sol.value(opt_states)
+        if use_warm_start:
+            lam_g0 = shift_lam_g(lam_g, N)
+        tick_t.append(time.time() - t_tick)
         u_c.append(u_res[0, :])
         t_c.append(t0)
-        # prediction_state(x0=current_state, u=u_res, N=N, T=T)
-        next_states_pred = sol.value(opt_states)
         # next_states_pred = prediction_state(x0=current_state, u=u_res, N=N, T=T)
         x_c.append(next_states_pred)
         # for next loop
@@ -128,6 +186,8 @@ if __name__ == '__main__':
         xx.append(current_state)
     t_v = np.array(index_t)
     print(t_v.mean())
+    print('tick time (to_function={0}) {1}'.format(use_to_function, np.mean(tick_t)))
+    print('mean iterations {0:.2f} (warm start {1})'.format(np.mean(iter_c), use_warm_start))
     print((time.time() - start_time)/(mpciter))
     # after loop
     print(mpciter)